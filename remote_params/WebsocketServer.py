@@ -1,35 +1,222 @@
-import logging, json, math, asyncio, websockets, threading
+import logging, json, math, asyncio, websockets, threading, zlib, struct
 
 from remote_params.server import Server, Remote
-from remote_params.schema import schema_list
+from remote_params.schema import schema_list, iter_schema_json, get_path
+from remote_params.routing import SubscriptionTrie
+from remote_params.binary import U32, pack_path, unpack_path, pack_value, unpack_value, value_type
+from remote_params.image_delta import TileDeltaEncoder, DEFAULT_TILE_SIZE, DEFAULT_KEYFRAME_INTERVAL
+from remote_params.lanes import PriorityLanes, priority_of, _discard, PRIORITY_HIGH, PRIORITY_BULK
+from remote_params.history import query_history, DEFAULT_HISTORY_BUCKETS
+from remote_params.image_stream import AdaptiveImageEncoder, SharedEncodings, PendingFrame, encode_jpeg, DEFAULT_TARGET_FPS, cv2
+
+try:
+  import numpy as np
+except:
+  np = None # numpy not supported
 
 DEFAULT_PORT = 8081
+DEFAULT_SCHEMA_CHUNK_SIZE = 64*1024
+DEFAULT_PAYLOAD_COMPRESSION_THRESHOLD = 1024
+
+# binary message types (first byte of binary messages)
+BINARY_VALUE = b'V'[0] # path + value (see binary.pack_value)
+BINARY_RANGE = b'R'[0] # path + u32 start index + array value
+BINARY_ID_VALUE = b'I'[0] # u32 param id + value (see IdTable)
 
 logger = logging.getLogger(__name__)
 
+def value_message(path, val):
+  '''
+  Returns the websocket message for a param value change; a binary
+  message for (1D) array param values (images are 2D/3D), text otherwise
+  '''
+  if np is not None and isinstance(val, np.ndarray) and val.ndim == 1:
+    return bytes([BINARY_VALUE]) + pack_path(path) + pack_value('a', val)
+  return 'POST {}?value={}'.format(path, val)
+
+def id_value_message(id, val):
+  '''
+  Returns the binary websocket message for a param value change with
+  an interned param id (see IdTable), or None when the value can't be packed
+  '''
+  type_ = value_type(val)
+  if type_ is None:
+    return None
+  return bytes([BINARY_ID_VALUE]) + U32.pack(id) + pack_value(type_, val)
+
 class WebsocketServer:
   """
   Connect a private Remote instance on a given params.Server instance
   Accepts new websocket connections.
   Broadcasts any value and schema change notifications from the server
   to all connected client at that moment.
+  Clients can limit the value changes they receive by subscribing
+  to path prefixes/globs (see SubscriptionTrie).
   Forwards any value change from a connected client to the server.
   Respond to schema requests from a connected client with the schema
   schema information for the server's params.
+
+  Compression
+  -----------
+  The compression, compression_level and compression_window_bits arguments
+  configure websocket permessage-deflate, which compresses every message
+  separately for every client.
+
+  Clients can also opt in to receive large shared payloads (schema data) as
+  binary messages containing the zlib-compressed message text, by sending:
+    POST compression?payloads=zlib
+  These payloads are compressed once per schema version and shared by
+  all clients. Clients that use this, typically won't need permessage-deflate;
+  clients that negotiated permessage-deflate anyway get uncompressed payloads,
+  which the extension compresses.
+
+  The cached schema message isn't rebuilt for value changes; a client
+  requesting the schema gets the cached message, followed by value messages
+  for the params that changed since it was created.
+
+  Array values
+  ------------
+  Array param (vector, color, etc.) values are sent as binary messages:
+    'V' + <u16 path length> + <path> + 'a' + <element type 'f'|'i'> + <u32 count> + <elements>
+  with little-endian float32 or int32 elements. Clients can send array values
+  in the same format, or as text: POST <path>?value=[1.0, 0.5]
+  Partial updates are sent as:
+    'R' + <u16 path length> + <path> + <u32 start index> + 'a' + <element type> + <u32 count> + <elements>
+  or as text: POST <path>?range=<start index>&value=[1.0, 0.5]
+
+  Image deltas
+  ------------
+  Clients can opt in to receive image (numpy frame) updates as tile-based
+  deltas, containing only the tiles that changed, by sending:
+    POST delta?enabled=1
+  after which image values are sent as:
+    POST <path>?delta=<json>
+  (see TileDeltaEncoder for the json format and TileDeltaDecoder
+  for reassembling the frames). Every client starts with a keyframe.
+
+  Param ids
+  ---------
+  Clients can request a table of small integer ids for all params (see IdTable):
+    GET ids
+  which is answered (and after every schema change that added ids, sent again) with:
+    POST ids?table=<json list of paths; the index is the id>
+  after which values are sent to the client as binary messages:
+    'I' + <u32 id> + <value> (see binary.pack_value)
+  Clients can send values in the same format.
+
+  Priorities
+  ----------
+  Outgoing messages are queued per client in priority lanes (see PriorityLanes);
+  schema data and the values of high priority params (triggers, toggles and
+  numbers by default, see Param.priority) are sent before any queued lower
+  priority messages, so they never wait for more than the one (image) message
+  that is being sent at that moment.
+
+  Image streaming
+  ---------------
+  Only the latest pending frame of an image param is kept per client; a client
+  that can't keep up with the frame rate skips frames instead of queueing them.
+  Clients can opt in to receive image frames as JPEG with a quality and resolution
+  adapted to their bandwidth (see AdaptiveImageEncoder; requires cv2), by sending:
+    POST images?adaptive=1
+  after which image values are sent as:
+    POST <path>?jpeg=<base64 jpeg>
+
+  Value history
+  -------------
+  Clients can request the recent values of params that record their
+  history (see Param.enable_history), downsampled to a number of buckets:
+    GET <path>?history=<window in seconds>&buckets=<count>
+  which is answered with (see History.query for the json format, null
+  for params without history):
+    POST <path>?history=<json>
   """
 
-  def __init__(self, server: Server, host: str='0.0.0.0', port: int=DEFAULT_PORT, start: bool=True):
+  def __init__(self, server: Server, host: str='0.0.0.0', port: int=DEFAULT_PORT, start: bool=True,
+    compression: str='deflate', compression_level: int=None, compression_window_bits: int=None,
+    payload_compression_threshold: int=DEFAULT_PAYLOAD_COMPRESSION_THRESHOLD,
+    delta_tile_size: int=DEFAULT_TILE_SIZE, delta_keyframe_interval: int=DEFAULT_KEYFRAME_INTERVAL,
+    image_target_fps: int=DEFAULT_TARGET_FPS, reuse_port: bool=False):
+    """
+    Parameters
+    ----------
+    compression : str
+      'deflate' to enable websocket permessage-deflate, or None to disable it
+
+    compression_level : int
+      zlib compression level (0-9) for permessage-deflate
+
+    compression_window_bits : int
+      server_max_window_bits (8-15) for permessage-deflate; lower values
+      use less memory per client at the cost of compression ratio
+
+    payload_compression_threshold : int
+      minimum size (in characters) of shared payloads to send pre-compressed
+      to clients that opted in to payload compression
+
+    delta_tile_size : int
+      size (in pixels) of the square tiles for image deltas
+
+    delta_keyframe_interval : int
+      number of image deltas after which a keyframe is sent
+
+    image_target_fps : int
+      frame rate that adaptive image streams aim for
+
+    reuse_port : bool
+      accept connections on a port that other processes serve as well (SO_REUSEPORT, see WorkerPool)
+    """
     self.server = server
     self.host = host
     self.port = port
+    self.compression = compression
+    self.compression_level = compression_level
+    self.compression_window_bits = compression_window_bits
+    self.payload_compression_threshold = payload_compression_threshold
+    self.delta_tile_size = delta_tile_size
+    self.delta_keyframe_interval = delta_keyframe_interval
+    self.image_target_fps = image_target_fps
+    self.reuse_port = reuse_port
+    # encode(frame, quality) -> str, for adaptive image streams
+    self.encode_image = encode_jpeg
+    # latency (in seconds) between the server and the origin server, when
+    # serving mirrored params (see Relay); reported to 'GET latency' requests
+    self.upstream_latency = 0.0
     self.thread = None
     self.sockets = set()
-
-    self.remote = Remote(serialize=True)
+    # sockets without subscriptions; these receive all value changes
+    self.unfiltered_sockets = {}
+    self.subscriptions = SubscriptionTrie()
+    # sockets that opted in to pre-compressed payloads
+    self.compressing_sockets = set()
+    # sockets that opted in to image deltas -> set of image paths they've received a keyframe for
+    self.delta_sockets = {}
+    # image path -> TileDeltaEncoder, shared by all delta sockets
+    self.delta_encoders = {}
+    # image path -> SharedEncodings, for adaptive image streams
+    self.image_encodings = {}
+    # sockets that requested the id table, and the id table version they received
+    self.id_sockets = set()
+    self._ids_version = None
+    # websocket -> PriorityLanes, its outgoing message queues
+    self.lanes = {}
+    # sockets that opted in to adaptive image streams -> {image path: AdaptiveImageEncoder}
+    self.adaptive_sockets = {}
+
+    # incremented for every schema change; (version, message, compressed message)
+    self._schema_version = 0
+    self._schema_cache = None
+    # paths of the params whose value changed since the cached schema message was created
+    self._stale_paths = {}
+
+    # receives raw image values; these are only serialized (see _sendImage)
+    # when a client without delta or adaptive image streams needs them
+    self.remote = Remote()
     self.remote.outgoing.sendValueEvent += self._onValueFromServer
     self.remote.outgoing.sendSchemaEvent += self._onSchemaFromServer
 
     self._ws_server = None
+    self._loop = None
 
     if start:
       self.start()
@@ -46,9 +233,10 @@ class WebsocketServer:
     """
     self.server.connect(self.remote)
 
-    async_action = websockets.serve(self._connectionFunc, self.host, self.port)
+    async_action = websockets.serve(self._connectionFunc, self.host, self.port, **self._serveOptions(), **self._socketOptions())
     
     eventloop = asyncio.get_event_loop()
+    self._loop = eventloop
 
     def func():
       eventloop.run_until_complete(async_action)
@@ -67,9 +255,31 @@ class WebsocketServer:
     websocket WebsocketServer instance
     """
     self.server.connect(self.remote)
-    self._ws_server = await websockets.serve(self._connectionFunc, self.host, self.port)
+    self._loop = asyncio.get_event_loop()
+    self._ws_server = await websockets.serve(self._connectionFunc, self.host, self.port, **self._serveOptions(), **self._socketOptions())
     return self._ws_server
 
+  def _serveOptions(self):
+    """
+    Returns the compression related keyword arguments for websockets.serve
+    """
+    if not self.compression:
+      return {'compression': None}
+
+    if self.compression_level is None and self.compression_window_bits is None:
+      return {'compression': self.compression}
+
+    from websockets.extensions.permessage_deflate import ServerPerMessageDeflateFactory
+
+    factory = ServerPerMessageDeflateFactory(
+      server_max_window_bits=self.compression_window_bits,
+      compress_settings={'level': self.compression_level} if self.compression_level is not None else None)
+
+    return {'compression': None, 'extensions': [factory]}
+
+  def _socketOptions(self):
+    return {'reuse_port': True} if self.reuse_port else {}
+
   def stop(self, joinThread=True):
     """
     
@@ -107,6 +317,7 @@ class WebsocketServer:
     """
     logging.info('New websocket connection...')
     self.sockets.add(websocket)
+    self.unfiltered_sockets[websocket] = True
     logger.debug('registered websocket, {} active'.format(len(self.sockets)))
 
     try:
@@ -119,6 +330,15 @@ class WebsocketServer:
       logger.warning('KeyboardInterrupt in WebsocketServer connectionFunc')
     finally:
       self.sockets.remove(websocket)
+      self.compressing_sockets.discard(websocket)
+      self.delta_sockets.pop(websocket, None)
+      self.id_sockets.discard(websocket)
+      self.adaptive_sockets.pop(websocket, None)
+      self.unfiltered_sockets.pop(websocket, None)
+      lanes = self.lanes.pop(websocket, None)
+      if lanes is not None:
+        lanes.close()
+      self.subscriptions.unsubscribe_all(websocket)
 
       logger.debug('unregistered websocket, {} left'.format(len(self.sockets)))
 
@@ -128,18 +348,99 @@ class WebsocketServer:
     incoming message from a specific websocket.
     """
 
+    if isinstance(msg, (bytes, bytearray)):
+      self._onBinaryMessage(msg)
+      return
+
     if msg == 'stop':
       logger.info('Websocket connection stopped')
       websocket.close()
       return
 
+    # GET schema.json?chunk_size=<characters>
+    if msg.startswith('GET schema.json?chunk_size='):
+      try:
+        chunk_size = max(int(msg[len('GET schema.json?chunk_size='):]), 1)
+      except ValueError:
+        chunk_size = DEFAULT_SCHEMA_CHUNK_SIZE
+      logger.info('Got websocket chunked schema request (chunk_size={})'.format(chunk_size))
+      await self._sendSchemaChunks(websocket, chunk_size)
+      return
+
+    # GET latency; responds with the latency to the origin Server (see Relay)
+    if msg == 'GET latency':
+      await websocket.send('POST latency?value={}'.format(self.upstream_latency))
+      return
+
+    # GET ids; switches the socket to (binary) values with param ids
+    if msg == 'GET ids':
+      self.id_sockets.add(websocket)
+      await websocket.send(self._idsMessage())
+      return
+
+    # GET <param-path>?history=<window>&buckets=<count>
+    if msg.startswith('GET /') and '?history=' in msg:
+      path, query = msg[len('GET '):].split('?history=', 1)
+      window, _, buckets = query.partition('&buckets=')
+      try:
+        data = query_history(self.server.params, path, float(window), int(buckets) if buckets else DEFAULT_HISTORY_BUCKETS)
+      except ValueError:
+        logger.warning('Received invalid history request via websocket: {}'.format(msg))
+        data = None
+      await websocket.send('POST {}?history={}'.format(path, json.dumps(data)))
+      return
+
     if msg.startswith('GET schema.json'):
       logger.info('Got websocket schema request ({})'.format('GET schema.json'))
       # immediately respond
-      data = schema_list(self.server.params)
-      msg = 'POST schema.json?schema={}'.format(json.dumps(data))
+      msg = self._schemaMessage()
       logger.debug('Websocket schema request response: ({})'.format(msg))
-      await websocket.send(msg)
+      await self._sendPayloadToSockets(msg, [websocket])
+      for value_msg in self._staleValueMessages():
+        await websocket.send(value_msg)
+      return
+
+    # POST compression?payloads=<zlib|none>
+    if msg.startswith('POST compression?payloads='):
+      if msg[len('POST compression?payloads='):] == 'zlib':
+        # compressing pre-compressed payloads again is wasted work
+        if self._usesDeflate(websocket):
+          logger.debug('Websocket uses permessage-deflate, sending payloads uncompressed')
+        else:
+          self.compressing_sockets.add(websocket)
+      else:
+        self.compressing_sockets.discard(websocket)
+      return
+
+    # POST delta?enabled=<1|0>
+    if msg.startswith('POST delta?enabled='):
+      if msg[len('POST delta?enabled='):] in ('1', 'true'):
+        self.delta_sockets.setdefault(websocket, set())
+      else:
+        self.delta_sockets.pop(websocket, None)
+      return
+
+    # POST images?adaptive=<1|0>
+    if msg.startswith('POST images?adaptive='):
+      if msg[len('POST images?adaptive='):] not in ('1', 'true'):
+        self.adaptive_sockets.pop(websocket, None)
+      elif cv2 is None and self.encode_image is encode_jpeg:
+        logger.warning('Adaptive image streams require cv2')
+      else:
+        self.adaptive_sockets.setdefault(websocket, {})
+      return
+
+    # POST <param-path>?range=<start>&value=<values>
+    if msg.startswith('POST /') and '?range=' in msg and '&value=' in msg:
+      path, query = msg[len('POST '):].split('?range=', 1)
+      start, val = query.split('&value=', 1)
+      try:
+        start = int(start)
+      except ValueError:
+        logger.warning('Received invalid range start via websocket: {}'.format(start))
+        return
+      logger.info('Value range received via websocket: {}[{}:] = {}'.format(path, start, val))
+      self.remote.incoming.valueRangeEvent(path, start, val)
       return
 
     # POST <param-path>?value=<value>
@@ -150,8 +451,148 @@ class WebsocketServer:
       self.remote.incoming.valueEvent(path, val)
       return
 
+    # POST subscribe?pattern=<path-or-glob>
+    if msg.startswith('POST subscribe?pattern='):
+      pattern = msg[len('POST subscribe?pattern='):]
+      logger.info('Websocket subscribes to: {}'.format(pattern))
+      self.unfiltered_sockets.pop(websocket, None)
+      self.subscriptions.subscribe(websocket, pattern)
+      self._resetImageDeltas(websocket)
+      return
+
+    # POST unsubscribe?pattern=<path-or-glob>
+    if msg.startswith('POST unsubscribe?pattern='):
+      pattern = msg[len('POST unsubscribe?pattern='):]
+      logger.info('Websocket unsubscribes from: {}'.format(pattern))
+      self.subscriptions.unsubscribe(websocket, pattern)
+      self._resetImageDeltas(websocket)
+      return
+
     logger.warning('Received unknown websocket message: {}'.format(msg))
 
+  def _onBinaryMessage(self, msg):
+    """
+    Processes binary value (BINARY_VALUE and BINARY_ID_VALUE)
+    and partial array value (BINARY_RANGE) messages
+    """
+    try:
+      if msg[0] == BINARY_VALUE:
+        path, offset = unpack_path(msg, 1)
+        _, value, _ = unpack_value(msg, offset)
+        self.remote.incoming.valueEvent(path, value)
+        return
+
+      if msg[0] == BINARY_ID_VALUE:
+        id = U32.unpack_from(msg, 1)[0]
+        _, value, _ = unpack_value(msg, 1+U32.size)
+        self.remote.incoming.valueIdEvent(id, value)
+        return
+
+      if msg[0] == BINARY_RANGE:
+        path, offset = unpack_path(msg, 1)
+        start = U32.unpack_from(msg, offset)[0]
+        _, values, _ = unpack_value(msg, offset+U32.size)
+        self.remote.incoming.valueRangeEvent(path, start, values)
+        return
+    except (ValueError, IndexError, KeyError, struct.error) as err:
+      logger.warning('Received invalid binary websocket message: {}'.format(err))
+      return
+
+    logger.warning('Received unknown binary websocket message type: {}'.format(msg[:1]))
+
+  def _schemaMessage(self, schemadata=None):
+    """
+    Returns the schema message for the current schema version, which is
+    cached as long as our remote is connected (and receives changes).
+    The values in a cached message may be outdated (see _staleValueMessages).
+    """
+    cacheable = self.remote in self.server.connections
+    if cacheable and self._schema_cache and self._schema_cache[0] == self._schema_version:
+      return self._schema_cache[1]
+
+    # (before collecting the values, so no change gets lost)
+    self._stale_paths = {}
+    if schemadata is None:
+      schemadata = schema_list(self.server.params)
+    msg = 'POST schema.json?schema={}'.format(json.dumps(schemadata))
+    self._schema_cache = (self._schema_version, msg, None) if cacheable else None
+    return msg
+
+  def _staleValueMessages(self):
+    """
+    Returns value messages with the current values of the params
+    that changed since the cached schema message was created
+    """
+    msgs = []
+    for path in list(self._stale_paths):
+      param = get_path(self.server.params, path)
+      if param is None:
+        continue
+      msgs.append(value_message(path, param.get_serialized() if param.type == 'g' else param.val()))
+    return msgs
+
+  def _usesDeflate(self, websocket):
+    """
+    Returns True when the given websocket negotiated permessage-deflate
+    """
+    return any(getattr(ext, 'name', None) == 'permessage-deflate' for ext in getattr(websocket, 'extensions', None) or [])
+
+  def _idsMessage(self):
+    ids = self.server.ids
+    msg = 'POST ids?table={}'.format(json.dumps(ids.to_list()))
+    self._ids_version = ids.version
+    return msg
+
+  def _compressedPayload(self, msg):
+    """
+    Returns the zlib-compressed message, compressing
+    the cached schema message only once
+    """
+    cache = self._schema_cache
+    if cache and cache[1] is msg:
+      if cache[2] is None:
+        self._schema_cache = cache = (cache[0], cache[1], zlib.compress(msg.encode('utf-8')))
+      return cache[2]
+
+    return zlib.compress(msg.encode('utf-8'))
+
+  def _payloadMessages(self, msg, sockets):
+    """
+    Yields (websocket, message) pairs for sending the given (large, shared) payload
+    message to the given sockets; pre-compressed to the sockets that opted in to
+    payload compression.
+    """
+    compressed = None
+    compress = self.payload_compression_threshold is not None and len(msg) >= self.payload_compression_threshold
+
+    for websocket in sockets:
+      if compress and websocket in self.compressing_sockets:
+        if compressed is None:
+          compressed = self._compressedPayload(msg)
+        yield websocket, compressed
+      else:
+        yield websocket, msg
+
+  async def _sendPayloadToSockets(self, msg, sockets):
+    for websocket, payload in self._payloadMessages(msg, sockets):
+      await websocket.send(payload)
+
+  async def _sendSchemaChunks(self, websocket, chunk_size):
+    """
+    Sends the schema JSON in a series of messages with the following format:
+      POST schema.json?chunk=<index>&last=<0|1>&data=<json-fragment>
+    The concatenated data of all chunks is the complete schema JSON.
+    """
+    chunks = iter_schema_json(self.server.params, chunk_size=chunk_size)
+    idx = 0
+    chunk = next(chunks)
+    for next_chunk in chunks:
+      await websocket.send('POST schema.json?chunk={}&last=0&data={}'.format(idx, chunk))
+      chunk = next_chunk
+      idx += 1
+
+    await websocket.send('POST schema.json?chunk={}&last=1&data={}'.format(idx, chunk))
+
   def _onValueFromServer(self, path, val):
     """
     This method gets called when our Remote instance gets notified by Server
@@ -159,8 +600,219 @@ class WebsocketServer:
     to all connected websockets.
     """
     logger.debug('onValueFromServer(path={}, val={})'.format(path, val))
-    msg = 'POST {}?value={}'.format(path, val)
-    asyncio.ensure_future(self._sendToAllConnectedSockets(msg))
+    if self._schema_cache is not None:
+      self._stale_paths[path] = True
+    recipients = list(self.unfiltered_sockets)
+    recipients.extend(self.subscriptions.match(path))
+    if not recipients:
+      return
+
+    if self.delta_sockets:
+      recipients = self._sendImageDeltas(path, recipients)
+      if not recipients:
+        return
+
+    ids = self.server.ids
+    id = ids.id(path)
+    param = ids.param(id) if id is not None else get_path(self.server.params, path)
+    priority = priority_of(param)
+
+    if param is not None and param.type == 'g':
+      self._sendImage(path, id, param, recipients, priority)
+      return
+
+    if self.id_sockets:
+      recipients = self._sendIdValues(id, val, recipients, priority)
+      if not recipients:
+        return
+
+    self._callInLoop(self._queue, value_message(path, val), recipients, priority)
+
+  def _sendIdValues(self, id, val, recipients, priority):
+    """
+    Sends the value change (with its param id) to the id sockets
+    among the given recipients and returns the remaining recipients
+    """
+    id_recipients = [ws for ws in recipients if ws in self.id_sockets]
+    if not id_recipients:
+      return recipients
+
+    msg = None if id is None else id_value_message(id, val)
+    if msg is None:
+      return recipients
+
+    self._callInLoop(self._queue, msg, id_recipients, priority)
+    return [ws for ws in recipients if ws not in self.id_sockets]
+
+  def _sendImage(self, path, id, param, recipients, priority):
+    """
+    Queues an image param's value for the given recipients, replacing any
+    of its frames that they didn't receive yet; a retained frame to encode
+    for clients with adaptive image streams, the serialized value (encoded
+    once, only when needed) for the others
+    """
+    serialized = msg = id_msg = None
+    frame = param.value
+
+    sends = []
+    for ws in recipients:
+      encoders = self.adaptive_sockets.get(ws)
+      if encoders is not None and np is not None and isinstance(frame, np.ndarray):
+        encoder = encoders.get(path)
+        if encoder is None:
+          encoder = encoders[path] = AdaptiveImageEncoder(self.image_target_fps, encode=self.encode_image)
+        start = lambda frame, encoder=encoder, version=param.version: self._imageEncodings(path).get(version, frame, encoder.quality, encoder.scale)
+        finish = lambda data, ws=ws, encoder=encoder: self._adaptiveImageMessage(ws, path, encoder, data)
+        sends.append((ws, PendingFrame(param, param.retain(), start, finish)))
+        continue
+
+      if serialized is None:
+        serialized = param.get_serialized()
+
+      if id is not None and ws in self.id_sockets:
+        if id_msg is None:
+          id_msg = id_value_message(id, serialized)
+        if id_msg is not None:
+          sends.append((ws, id_msg))
+          continue
+
+      if msg is None:
+        msg = value_message(path, serialized)
+      sends.append((ws, msg))
+
+    self._callInLoop(self._queueLatest, path, sends, priority)
+
+  def _imageEncodings(self, path):
+    encodings = self.image_encodings.get(path)
+    if encodings is None:
+      encodings = self.image_encodings[path] = SharedEncodings(self.encode_image)
+    return encodings
+
+  def _adaptiveImageMessage(self, websocket, path, encoder, data):
+    lanes = self.lanes.get(websocket)
+    encoder.adapt(len(data), lanes.bandwidth.rate if lanes is not None else None)
+    return 'POST {}?jpeg={}'.format(path, data)
+
+  def _sendImageDeltas(self, path, recipients):
+    """
+    Sends image deltas (or, to sockets that haven't received one yet,
+    a keyframe) for an image param value change to the delta sockets
+    among the given recipients and returns the remaining recipients.
+    Deltas are encoded once per frame, for all delta sockets.
+    """
+    delta_recipients = [ws for ws in recipients if ws in self.delta_sockets]
+    if not delta_recipients:
+      return recipients
+
+    param = get_path(self.server.params, path)
+    if param is None or param.type != 'g':
+      return recipients
+
+    # retained while encoding (see ImageParam.create_pool)
+    frame = param.retain()
+    try:
+      if np is None or not isinstance(frame, np.ndarray):
+        return recipients
+
+      encoder = self.delta_encoders.get(path)
+      if encoder is None:
+        encoder = self.delta_encoders[path] = TileDeltaEncoder(self.delta_tile_size, self.delta_keyframe_interval)
+
+      # (the encoder keeps a copy of the frame)
+      delta = encoder.encode(frame)
+    finally:
+      param.release(frame)
+
+    delta_msg = None if delta is None else 'POST {}?delta={}'.format(path, json.dumps(delta))
+    keyframe_msg = delta_msg if delta is not None and delta['keyframe'] else None
+
+    sends = []
+    for ws in delta_recipients:
+      synced = self.delta_sockets[ws]
+      if path in synced:
+        if delta_msg is not None:
+          sends.append((ws, delta_msg))
+        continue
+
+      if keyframe_msg is None:
+        keyframe_msg = 'POST {}?delta={}'.format(path, json.dumps(encoder.keyframe()))
+      sends.append((ws, keyframe_msg))
+      synced.add(path)
+
+    if sends:
+      self._callInLoop(self._queueEach, sends, PRIORITY_BULK)
+
+    return [ws for ws in recipients if ws not in self.delta_sockets]
+
+  def _callInLoop(self, func, *args):
+    """
+    Calls the given function on the server's event loop; param changes
+    may happen on other threads (ie. the OSC listener's thread)
+    """
+    loop = self._loop
+    if loop is None or not loop.is_running():
+      func(*args)
+      return
+
+    try:
+      running = asyncio.get_running_loop()
+    except RuntimeError:
+      running = None
+
+    if running is loop:
+      func(*args)
+    else:
+      loop.call_soon_threadsafe(func, *args)
+
+  def _queue(self, msg, sockets, priority):
+    """
+    Queues the given msg for the given websockets, in the lane of the
+    given priority; must be called on the server's event loop
+    """
+    for websocket in sockets:
+      lanes = self._lanes(websocket)
+      if lanes is None:
+        _discard(msg)
+        continue
+      lanes.put(msg, priority)
+
+  def _queueEach(self, sends, priority):
+    for websocket, msg in sends:
+      lanes = self._lanes(websocket)
+      if lanes is None:
+        _discard(msg)
+        continue
+      lanes.put(msg, priority)
+
+  def _queueLatest(self, key, sends, priority):
+    for websocket, msg in sends:
+      lanes = self._lanes(websocket)
+      if lanes is None:
+        _discard(msg)
+        continue
+      lanes.put_latest(key, msg, priority)
+
+  def _lanes(self, websocket):
+    """
+    Returns the lanes of the given websocket, or None when it disconnected
+    (messages are queued from call_soon_threadsafe callbacks, which may run
+    after the connection closed)
+    """
+    if websocket not in self.sockets:
+      return None
+
+    lanes = self.lanes.get(websocket)
+    if lanes is None:
+      lanes = self.lanes[websocket] = PriorityLanes(websocket.send)
+    return lanes
+
+  def _resetImageDeltas(self, websocket):
+    """
+    A socket that (temporarily) didn't receive an image's
+    deltas, needs a new keyframe first
+    """
+    if websocket in self.delta_sockets:
+      self.delta_sockets[websocket].clear()
 
   def _onSchemaFromServer(self, schemadata):
     """
@@ -168,15 +820,28 @@ class WebsocketServer:
     instance, about a schema change. We'll send out the schema change
     to all connected websockets.
     """
-    msg = 'POST schema.json?schema={}'.format(json.dumps(schemadata))
-    asyncio.ensure_future(self._sendToAllConnectedSockets(msg))
+    self._schema_version += 1
+    msg = self._schemaMessage(schemadata)
+    self._callInLoop(self._queueEach, list(self._payloadMessages(msg, list(self.sockets))), PRIORITY_HIGH)
+
+    # new params got new ids
+    if self.id_sockets:
+      self.server.ids.update()
+      if self.server.ids.version != self._ids_version:
+        self._callInLoop(self._queue, self._idsMessage(), list(self.id_sockets), PRIORITY_HIGH)
 
   async def _sendToAllConnectedSockets(self, msg):
     """
     This method broadcasts the given msg to all connected websockets
     """
     logger.debug('sendToAllConnectedSockets: {} websocket remote(s): {}'.format(msg, len(self.sockets)))
-    for websocket in self.sockets:
+    await self._sendToSockets(msg, list(self.sockets))
+
+  async def _sendToSockets(self, msg, sockets):
+    """
+    This method sends the given msg to the given websockets
+    """
+    for websocket in sockets:
       await websocket.send(msg)
 
 
@@ -1,5 +1,18 @@
 from .params import *
+from .frames import *
+from .dispatcher import *
 from .schema import *
+from .ids import *
+from .lanes import *
 from .server import *
 from .osc import *
+from .uds import *
+from .recorder import *
 from .http import *
+from .shared import *
+from .presets import *
+from .tween import *
+from .routing import *
+from .image_delta import *
+from .image_stream import *
+from .history import *
@@ -0,0 +1,137 @@
+'''
+Compact binary encoding of param values, shared by the
+persistence, recording and binary transport modules.
+
+Every value is encoded as a one-byte type code (the param type),
+followed by a type-specific payload:
+
+  'i' : signed 64-bit integer
+  'f' : 64-bit float
+  'b' : single byte (0 or 1)
+  's' : u32 length + utf-8 bytes
+  'v' : u32 trigger count (VoidParam)
+  'a' : element type ('f' or 'i') + u32 count + little-endian
+        float32/int32 elements (ArrayParam, requires numpy)
+'''
+import struct
+
+try:
+  import numpy as np
+except:
+  np = None # numpy not supported
+
+from .params import ARRAY_DTYPES
+
+U8 = struct.Struct('<B')
+U16 = struct.Struct('<H')
+U32 = struct.Struct('<I')
+I64 = struct.Struct('<q')
+F64 = struct.Struct('<d')
+
+VALUE_TYPES = ('i', 'f', 'b', 's', 'v', 'a')
+
+def is_packable(type_):
+  return type_ in VALUE_TYPES
+
+def pack_str(s):
+  data = s.encode('utf-8')
+  return U32.pack(len(data)) + data
+
+def unpack_str(buf, offset):
+  size = U32.unpack_from(buf, offset)[0]
+  offset += U32.size
+  return bytes(buf[offset:offset+size]).decode('utf-8'), offset+size
+
+def pack_path(path):
+  data = path.encode('utf-8')
+  return U16.pack(len(data)) + data
+
+def unpack_path(buf, offset):
+  size = U16.unpack_from(buf, offset)[0]
+  offset += U16.size
+  return bytes(buf[offset:offset+size]).decode('utf-8'), offset+size
+
+def pack_array(value, dtype=None):
+  '''
+  Returns the typed-array encoding (element type, count and elements) of the
+  given array; the element type is derived from the array when not specified
+  '''
+  if dtype is None:
+    dtype = 'i' if np.asarray(value).dtype.kind in 'iub' else 'f'
+  data = np.ascontiguousarray(value, dtype=ARRAY_DTYPES[dtype]).reshape(-1)
+  return dtype.encode('ascii') + U32.pack(data.shape[0]) + data.tobytes()
+
+def unpack_array(buf, offset):
+  dtype = chr(buf[offset])
+  count = U32.unpack_from(buf, offset+1)[0]
+  offset += 1 + U32.size
+  value = np.frombuffer(buf, dtype=ARRAY_DTYPES[dtype], count=count, offset=offset).copy()
+  return value, offset + value.nbytes
+
+def value_type(value):
+  '''
+  Returns the type code for packing the given value (see pack_value),
+  or None when the value can't be packed
+  '''
+  if isinstance(value, bool):
+    return 'b'
+  if isinstance(value, int):
+    return 'i'
+  if isinstance(value, float):
+    return 'f'
+  if isinstance(value, str):
+    return 's'
+  if np is not None:
+    if isinstance(value, np.ndarray):
+      return 'a' if value.ndim == 1 else None
+    if isinstance(value, np.bool_):
+      return 'b'
+    if isinstance(value, np.integer):
+      return 'i'
+    if isinstance(value, np.floating):
+      return 'f'
+  return None
+
+def pack_value(type_, value):
+  '''
+  Returns the binary representation (including type code) of the given value
+  '''
+  if type_ == 'i':
+    return b'i' + I64.pack(int(value))
+  if type_ == 'f':
+    return b'f' + F64.pack(float(value))
+  if type_ == 'b':
+    return b'b' + U8.pack(1 if value else 0)
+  if type_ == 's':
+    return b's' + pack_str(str(value))
+  if type_ == 'v':
+    return b'v' + U32.pack(int(value) if value else 0)
+  if type_ == 'a':
+    return b'a' + pack_array(value)
+
+  raise ValueError('Unsupported binary value type: {}'.format(type_))
+
+def unpack_value(buf, offset=0):
+  '''
+  Decodes a value (encoded with pack_value) from the given buffer
+  and returns a (type, value, next-offset) tuple
+  '''
+  type_ = chr(buf[offset])
+  offset += 1
+
+  if type_ == 'i':
+    return type_, I64.unpack_from(buf, offset)[0], offset+I64.size
+  if type_ == 'f':
+    return type_, F64.unpack_from(buf, offset)[0], offset+F64.size
+  if type_ == 'b':
+    return type_, buf[offset] != 0, offset+1
+  if type_ == 's':
+    value, offset = unpack_str(buf, offset)
+    return type_, value, offset
+  if type_ == 'v':
+    return type_, U32.unpack_from(buf, offset)[0], offset+U32.size
+  if type_ == 'a':
+    value, offset = unpack_array(buf, offset)
+    return type_, value, offset
+
+  raise ValueError('Unsupported binary value type: {}'.format(type_))
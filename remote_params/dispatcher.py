@@ -0,0 +1,232 @@
+import logging, threading
+from array import array
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+class Dispatcher:
+  '''
+  Central registry for the value change notifications of a Params tree.
+
+  Every param and group in the tree gets an integer handle. Instead of
+  every param owning events and closures that forward changes to the
+  group it belongs to, a dispatcher keeps a compact owner table (handle
+  of the group every item belongs to, and its id in that group) and walks
+  it to notify all ancestors of a changed param.
+
+  Subscribers register per handle; a subscription on the handle of a group
+  receives the changes of all params in that group's subtree, with paths
+  relative to the group.
+
+  ie.
+
+  params = Params()
+  x = params.float('x')
+  unsubscribe = params.dispatcher.subscribe(params.handle, lambda path, value, param: print(path, value))
+  x.set(0.5) # prints: /x 0.5
+
+  A new (root) Params group has its own dispatcher; when it is added to
+  another group, its whole subtree moves to the dispatcher of that group.
+
+  The absolute path of every changed param is cached (until it is moved to
+  another group), so value changes are delivered to the root group with a
+  single lookup; paths relative to other observed groups are slices of it.
+  Group change events are emitted for every ancestor of a changed param,
+  or at most once per group for all changes inside a batch.
+  '''
+
+  def __init__(self):
+    self.items = []
+    self.owners = array('i')
+    self.ids = []
+    self.paths = []
+    self.subscribers = {}
+    self.free = []
+    # batch state is per thread (see batch)
+    self._batch = threading.local()
+
+  def __len__(self):
+    return len(self.items) - len(self.free)
+
+  def register(self, item, owner=-1, id=None):
+    if self.free:
+      handle = self.free.pop()
+      self.items[handle] = item
+      self.owners[handle] = owner
+      self.ids[handle] = id
+      self.paths[handle] = None
+    else:
+      handle = len(self.items)
+      self.items.append(item)
+      self.owners.append(owner)
+      self.ids.append(id)
+      self.paths.append(None)
+
+    item.dispatcher = self
+    item.handle = handle
+    return handle
+
+  def unregister(self, handle):
+    item = self.items[handle]
+    item.dispatcher = None
+    item.handle = None
+    self.items[handle] = None
+    self.owners[handle] = -1
+    self.ids[handle] = None
+    self.paths[handle] = None
+    self.subscribers.pop(handle, None)
+    self.free.append(handle)
+
+  def owner(self, handle):
+    '''
+    Returns the group the item with the given handle belongs to (or None)
+    '''
+    owner = self.owners[handle]
+    return None if owner < 0 else self.items[owner]
+
+  def attach(self, item, owner, id):
+    '''
+    Registers the given param, or group with all of its (nested) items,
+    as child with the given id of the group with the given handle
+    '''
+    prev = item.dispatcher
+    if prev is not None and prev.owners[item.handle] >= 0:
+      raise ValueError('item already belongs to a group')
+
+    self._move(item, prev, owner, id)
+
+  def detach(self, item):
+    '''
+    Removes the given param, or group with all of its (nested) items;
+    a removed group becomes the root of its own dispatcher
+    '''
+    if isinstance(item, list):
+      Dispatcher()._move(item, self, -1, None)
+      return
+    self.unregister(item.handle)
+
+  def _move(self, item, prev, owner, id):
+    prev_handle = item.handle if prev is not None else None
+    if prev_handle is not None:
+      subscribers = prev.subscribers.pop(prev_handle, None)
+      prev.unregister(prev_handle)
+    else:
+      subscribers = None
+
+    handle = self.register(item, owner, id)
+    if subscribers:
+      self.subscribers[handle] = subscribers
+
+    # groups (Params) are lists of [id, item] pairs
+    if isinstance(item, list):
+      for child_id, child in item:
+        self._move(child, prev, handle, child_id)
+
+  def subscribe(self, handle, func):
+    '''
+    Subscribes the given function (path, value, param) to value changes of the
+    item with the given handle; the path is relative to that item (empty
+    for a param handle). Returns a function that cancels the subscription.
+    '''
+    subscribers = self.subscribers.get(handle)
+    if subscribers is None:
+      subscribers = self.subscribers[handle] = []
+    subscribers.append(func)
+
+    def unsubscribe():
+      if func in subscribers:
+        subscribers.remove(func)
+    return unsubscribe
+
+  def path(self, handle, root=-1):
+    '''
+    Returns the path of the item with the given handle,
+    relative to the given (ancestor) root group handle
+    '''
+    path = self.paths[handle]
+    if path is None:
+      owner = self.owners[handle]
+      path = '' if owner < 0 else self.path(owner) + '/' + self.ids[handle]
+      self.paths[handle] = path
+    return path if root < 0 else path[len(self.path(root)):]
+
+  @contextmanager
+  def batch(self):
+    '''
+    Defers the change events of all groups with changed params in the
+    current thread until the end of the with-block; every group fires
+    its change event only once.
+    '''
+    state = self._batch
+    depth = getattr(state, 'depth', 0)
+    if depth == 0:
+      state.changed = {}
+    state.depth = depth + 1
+    try:
+      yield self
+    finally:
+      state.depth -= 1
+      if state.depth == 0:
+        changed = state.changed
+        state.changed = None
+        for group in changed.values():
+          group._changed()
+
+  def notify_change(self, handle):
+    '''
+    Fires the change events of the group with
+    the given handle and all of its ancestors
+    '''
+    owners, items = self.owners, self.items
+    changed = getattr(self._batch, 'changed', None)
+    while handle >= 0:
+      if changed is not None:
+        if handle in changed:
+          # ancestors are already recorded as well
+          return
+        changed[handle] = items[handle]
+      else:
+        group = items[handle]
+        group.version += 1
+        if group._changeEvent is not None:
+          group._changeEvent()
+      handle = owners[handle]
+
+  def dispatch(self, handle, param):
+    '''
+    Notifies all ancestor groups and subscribers of a param value change
+    '''
+    owners, items, subscribers = self.owners, self.items, self.subscribers
+    value = param.val()
+    path = self.paths[handle]
+    if path is None:
+      path = self.path(handle)
+
+    owner = owners[handle]
+    if owner >= 0:
+      self.notify_change(owner)
+
+    if subscribers:
+      funcs = subscribers.get(handle)
+      if funcs:
+        for func in list(funcs):
+          func('', value, param)
+
+    # groups between the param and the root only get (relative)
+    # paths when something is listening to them
+    while owner >= 0:
+      group = items[owner]
+      next_owner = owners[owner]
+      event = group._valueChangeEvent
+      funcs = subscribers.get(owner) if subscribers else None
+      if event is None and not funcs:
+        owner = next_owner
+        continue
+
+      relpath = path if next_owner < 0 else path[len(self.paths[owner]):]
+      if event is not None:
+        event(relpath, value, param)
+      if funcs:
+        for func in list(funcs):
+          func(relpath, value, param)
+      owner = next_owner
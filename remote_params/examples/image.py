@@ -14,11 +14,14 @@ class App:
     
     self.imageParam = None
     self.cap = None
+    self.captured = None
 
   async def main(self):
     # Params
     params = Params()
     self.imageParam = params.image('image')
+    # reuse frame buffers instead of allocating a new frame for every update
+    self.imageParam.create_pool((200, 300, 3))
     fps = params.float('fps', min=0.0, max=5.0)
     snap = params.void('snap')
 
@@ -59,13 +62,20 @@ class App:
     wss.stop()
 
   def update(self):
-    ret, frame = self.cap.read()
+    # read into the same capture buffer every time
+    ret, self.captured = self.cap.read(self.captured)
     if not ret:
       return
+
+    frame = self.imageParam.acquire()
+    if frame is None:
+      logger.warning('all frame buffers still in use, skipping frame')
+      return
+
     print('setting new image...')
-    frame = cv2.resize(frame, (300,200), interpolation=cv2.INTER_AREA)
+    cv2.resize(self.captured, (300,200), dst=frame, interpolation=cv2.INTER_AREA)
     cv2.imshow('cam', frame)
-    self.imageParam.set(frame)
+    self.imageParam.publish(frame)
 
 def parse_args():
   parser = OptionParser()
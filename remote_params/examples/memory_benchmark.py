@@ -0,0 +1,144 @@
+'''
+Compares memory usage and value change throughput of a large params tree
+(100 groups of 1000 float params, by default) between the Dispatcher based
+event propagation of Params, and the previous approach where every param
+owns a change event and closures that forward its changes to every group
+level (reproduced below as LegacyParams).
+
+python remote_params/examples/memory_benchmark.py --groups 100 --params 1000
+'''
+import gc, time, tracemalloc
+from optparse import OptionParser
+from evento import Event
+
+from remote_params import Params, FloatParam
+from remote_params.params import convertParamNumberVal
+
+class LegacyFloatParam:
+  '''
+  Float param as it was before the Dispatcher; with an eagerly created
+  change event and per-param closures wrapping its setter
+  '''
+  def __init__(self, min=None, max=None):
+    self.type = 'f'
+    self.value = None
+    self.default = None
+    self.opts = {}
+    if min != None: self.opts['min'] = convertParamNumberVal(min, float, None)
+    if max != None: self.opts['max'] = convertParamNumberVal(max, float, None)
+    self.getter = None
+    self.setter = self._makeSafe(self.convert)
+
+    self.changeEvent = Event()
+
+  def set(self, value):
+    value = self.setter(value)
+    if value is self.value:
+      return
+
+    self.value = value
+    self.changeEvent()
+
+  def val(self):
+    return self.value if self.value is not None else self.default
+
+  def convert(self, v):
+    return convertParamNumberVal(v, float, self.value, self.opts)
+
+  def _makeSafe(self, func):
+    def safeFunc(val):
+      try:
+        val = func(val)
+      except ValueError:
+        val = self.value
+
+      return val
+    return safeFunc
+
+class LegacyParams(list):
+  '''
+  Params group with the previous, closure-based change propagation
+  '''
+  def __init__(self):
+    self.changeEvent = Event()
+    self.schemaChangeEvent = Event()
+    self.valueChangeEvent = Event()
+    self.items_by_id = {}
+    self.removers = {}
+
+  def append(self, id, item):
+    cleanups = []
+    self.items_by_id[id] = item
+    list.append(self, [id, item])
+
+    def remover(notify):
+      del self.items_by_id[id]
+      for pair in self:
+        if pair[1] is item:
+          list.remove(self, pair)
+    cleanups.append(remover)
+
+    if isinstance(item, LegacyParams):
+      item.changeEvent += self.changeEvent.fire
+      item.schemaChangeEvent += self.schemaChangeEvent.fire
+      def forwardValChange(path, val, param):
+        self.valueChangeEvent('/'+id+path, val, param)
+      item.valueChangeEvent += forwardValChange
+      def cleanup(notify):
+        item.valueChangeEvent -= forwardValChange
+      cleanups.append(cleanup)
+    else:
+      def onchange():
+        self.changeEvent()
+        self.valueChangeEvent('/'+id, item.val(), item)
+      item.changeEvent += onchange
+      def cleanup(notify):
+        item.changeEvent -= onchange
+      cleanups.append(cleanup)
+
+    def cleanup(notify=True):
+      for c in cleanups:
+        c(notify)
+    self.removers[id] = cleanup
+    return item
+
+def build(group_class, param_class, groups, params):
+  root = group_class()
+  for g in range(groups):
+    group = root.append('group{}'.format(g), group_class())
+    for p in range(params):
+      group.append('param{}'.format(p), param_class())
+  return root
+
+def measure(name, group_class, param_class, groups, params, updates):
+  gc.collect()
+  tracemalloc.start()
+  t = time.perf_counter()
+  root = build(group_class, param_class, groups, params)
+  build_time = time.perf_counter() - t
+  size = tracemalloc.get_traced_memory()[0]
+  tracemalloc.stop()
+
+  received = []
+  root.valueChangeEvent += lambda path, value, param: received.append(path)
+  param = root[-1][1][-1][1]
+  t = time.perf_counter()
+  for i in range(updates):
+    param.set(float(i))
+  update_time = time.perf_counter() - t
+  assert len(received) == updates
+
+  count = groups * params
+  print('{:<10} {:>8.1f} MB ({:>5.0f} bytes/param)  build: {:>6.2f}s  updates: {:>9.0f}/s'.format(
+    name, size / 1024.0 / 1024.0, size / count, build_time, updates / update_time))
+
+if __name__ == '__main__':
+  parser = OptionParser()
+  parser.add_option('-g', '--groups', default=100, type='int')
+  parser.add_option('-p', '--params', default=1000, type='int', help='number of params per group')
+  parser.add_option('-u', '--updates', default=100000, type='int')
+  opts, args = parser.parse_args()
+
+  print('{} params in {} groups'.format(opts.groups * opts.params, opts.groups))
+  measure('legacy', LegacyParams, LegacyFloatParam, opts.groups, opts.params, opts.updates)
+  measure('dispatcher', Params, FloatParam, opts.groups, opts.params, opts.updates)
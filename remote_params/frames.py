@@ -0,0 +1,126 @@
+import logging, threading
+
+try:
+  import numpy as np
+except:
+  np = None # numpy not supported
+
+logger = logging.getLogger(__name__)
+
+class FramePool:
+  '''
+  Pool of preallocated frame buffers with reference counting, so image
+  producers can fill buffers in place without reallocating every frame,
+  while frames that are still in use (ie. the current value of an
+  ImageParam, or frames retained by an encoder or remote) are never
+  handed out for reuse.
+
+  ie.
+
+  pool = FramePool((200, 300, 3))
+  frame = pool.acquire()       # reference held by the producer
+  cv2.resize(src, (300, 200), dst=frame)
+  pool.retain(frame)           # ie. by a consumer that keeps the frame
+  pool.release(frame)          # done by producer
+  pool.release(frame)          # done by consumer; frame is reusable again
+  '''
+
+  def __init__(self, shape, dtype='uint8', size=3, max_size=None):
+    """
+    Parameters
+    ----------
+    shape : tuple
+      shape of the frame buffers, ie. (height, width, channels)
+
+    dtype : str
+      numpy dtype of the frame buffers
+
+    size : int
+      number of initially allocated buffers
+
+    max_size : int
+      maximum number of buffers the pool grows to when all buffers
+      are in use (defaults to four times the initial size)
+    """
+    if np is None:
+      raise RuntimeError('FramePool requires numpy')
+
+    self.shape = tuple(shape)
+    self.dtype = np.dtype(dtype)
+    self.max_size = max_size if max_size else size * 4
+    self.buffers = []
+    self.refs = []
+    self._index = {}
+    self.lock = threading.Lock()
+
+    for _ in range(size):
+      self._allocate()
+
+  def __len__(self):
+    return len(self.buffers)
+
+  def _allocate(self):
+    buf = np.zeros(self.shape, dtype=self.dtype)
+    self._index[id(buf)] = len(self.buffers)
+    self.buffers.append(buf)
+    self.refs.append(0)
+    return len(self.buffers) - 1
+
+  def acquire(self):
+    '''
+    Returns an unused buffer (with a single reference, held by the caller),
+    or None when all buffers are in use and the pool can't grow any further
+    '''
+    with self.lock:
+      for idx, count in enumerate(self.refs):
+        if count == 0:
+          self.refs[idx] = 1
+          return self.buffers[idx]
+
+      if len(self.buffers) >= self.max_size:
+        logger.warning('[FramePool.acquire] all {} buffers in use'.format(len(self.buffers)))
+        return None
+
+      idx = self._allocate()
+      self.refs[idx] = 1
+      return self.buffers[idx]
+
+  def owns(self, frame):
+    return frame is not None and id(frame) in self._index and self.buffers[self._index[id(frame)]] is frame
+
+  def retain(self, frame):
+    '''
+    Adds a reference to the given buffer; returns False
+    when the buffer doesn't belong to this pool
+    '''
+    with self.lock:
+      if not self.owns(frame):
+        return False
+      self.refs[self._index[id(frame)]] += 1
+      return True
+
+  def release(self, frame):
+    '''
+    Removes a reference from the given buffer; a buffer
+    without references is reused by acquire
+    '''
+    with self.lock:
+      if not self.owns(frame):
+        return False
+
+      idx = self._index[id(frame)]
+      if self.refs[idx] == 0:
+        logger.warning('[FramePool.release] buffer {} is not in use'.format(idx))
+        return False
+
+      self.refs[idx] -= 1
+      return True
+
+  def refcount(self, frame):
+    return self.refs[self._index[id(frame)]] if self.owns(frame) else 0
+
+  def available(self):
+    '''
+    Returns the number of buffers that are not in use
+    '''
+    return self.refs.count(0)
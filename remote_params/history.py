@@ -0,0 +1,122 @@
+import logging, time, threading, math
+
+try:
+  import numpy as np
+except:
+  np = None # numpy not supported
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_HISTORY_SIZE = 8192
+DEFAULT_HISTORY_WINDOW = 600.0
+DEFAULT_HISTORY_BUCKETS = 100
+MAX_HISTORY_BUCKETS = 10000
+
+class History:
+  '''
+  Fixed-size ring buffer with the most recent (timestamp, value)
+  samples of a numeric param (see Param.enable_history), which can
+  be queried as min/max/mean buckets for a time window, ie. to plot
+  a sparkline without sending every sample.
+
+  Samples are timestamped with the monotonic clock (see time.monotonic),
+  so they stay ordered when the wall clock is adjusted; query results
+  contain wall clock timestamps.
+
+  ie.
+
+  history = param.enable_history(size=4096)
+  history.query(window=600.0, buckets=100)
+  '''
+
+  def __init__(self, size=DEFAULT_HISTORY_SIZE):
+    self.size = size
+    self.times = np.zeros(size, dtype=np.float64)
+    self.values = np.zeros(size, dtype=np.float64)
+    # number of samples and index of the next sample
+    self.count = 0
+    self.index = 0
+    self.lock = threading.Lock()
+
+  def __len__(self):
+    return self.count
+
+  def add(self, value, t=None):
+    t = time.monotonic() if t is None else t
+    with self.lock:
+      self.times[self.index] = t
+      self.values[self.index] = value
+      self.index = (self.index + 1) % self.size
+      self.count = min(self.count + 1, self.size)
+
+  def samples(self, start=None, end=None):
+    '''
+    Returns (times, values) arrays with the samples between
+    start and end (monotonic timestamps), oldest first
+    '''
+    with self.lock:
+      if self.count < self.size:
+        times, values = self.times[:self.count].copy(), self.values[:self.count].copy()
+      else:
+        times, values = np.roll(self.times, -self.index), np.roll(self.values, -self.index)
+
+    lo = 0 if start is None else np.searchsorted(times, start, side='left')
+    hi = len(times) if end is None else np.searchsorted(times, end, side='right')
+    return times[lo:hi], values[lo:hi]
+
+  def query(self, window=DEFAULT_HISTORY_WINDOW, buckets=DEFAULT_HISTORY_BUCKETS, end=None):
+    '''
+    Returns the samples of the last window seconds (up to end, a monotonic
+    timestamp, defaults to now) downsampled to the given number of equally
+    long buckets, with the window's wall clock start and end timestamps:
+
+    {'start': <timestamp>, 'end': <timestamp>, 'count': [...], 'min': [...], 'max': [...], 'mean': [...]}
+
+    min, max and mean are None for buckets without samples
+    '''
+    # (an infinite window would end up as -Infinity, which isn't valid JSON)
+    if not (window > 0 and math.isfinite(window)):
+      raise ValueError('Invalid history window: {}'.format(window))
+
+    end = time.monotonic() if end is None else end
+    start = end - window
+    buckets = min(max(int(buckets), 1), MAX_HISTORY_BUCKETS)
+    times, values = self.samples(start, end)
+
+    idx = np.minimum(((times - start) * (buckets / window)).astype(np.int64), buckets - 1)
+    count = np.bincount(idx, minlength=buckets)
+    total = np.bincount(idx, weights=values, minlength=buckets)
+    mins = np.full(buckets, np.inf)
+    maxs = np.full(buckets, -np.inf)
+    np.minimum.at(mins, idx, values)
+    np.maximum.at(maxs, idx, values)
+
+    empty = count == 0
+    with np.errstate(invalid='ignore', divide='ignore'):
+      means = total / count
+
+    # monotonic to wall clock time
+    offset = time.time() - time.monotonic()
+    return {
+      'start': start + offset,
+      'end': end + offset,
+      'count': count.tolist(),
+      'min': _with_gaps(mins, empty),
+      'max': _with_gaps(maxs, empty),
+      'mean': _with_gaps(means, empty)}
+
+def _with_gaps(values, empty):
+  values = values.tolist()
+  for idx in np.flatnonzero(empty):
+    values[idx] = None
+  return values
+
+def query_history(params, path, window=DEFAULT_HISTORY_WINDOW, buckets=DEFAULT_HISTORY_BUCKETS):
+  '''
+  Returns the History.query result for the param at the given
+  path, or None when it doesn't exist or doesn't record its history
+  '''
+  from .schema import get_path # (schema imports params, which imports this module)
+  param = get_path(params, path)
+  history = getattr(param, 'history', None)
+  return history.query(window, buckets) if history is not None else None
@@ -1,5 +1,8 @@
-import logging, os.path
+import logging, os.path, json
+from urllib.parse import parse_qs
 from remote_params import Params, Server, Remote, schema_list #, create_sync_params, schema_list
+from .schema import iter_schema_json, schema_page
+from .history import query_history, DEFAULT_HISTORY_WINDOW, DEFAULT_HISTORY_BUCKETS
 from .http_utils import HttpServer as UtilHttpServer
 
 logger = logging.getLogger(__name__)
@@ -43,9 +46,70 @@ class HttpServer:
       # req.respond(200, b'TODO: respond with html file')
       return
 
+    if req.path.split('?')[0] == '/params/schema.json':
+      self.respondWithSchema(req)
+      return
+
+    if req.path.split('?')[0] == '/params/history':
+      self.respondWithHistory(req)
+      return
+
     if req.path == '/params/value':
       # TODO
       req.respond(404, b'TODO: responding to HTTP requests not yet implemented')
 
     req.respond(404, b'WIP')
 
+  def respondWithSchema(self, req):
+    '''
+    Responds with the schema JSON, streamed in chunks, or with a single
+    page of the schema when an offset and/or limit are specified;
+
+    /params/schema.json
+    /params/schema.json?offset=0&limit=100
+    '''
+    query = parse_qs(req.query)
+    headers = {'Content-Type': 'application/json'}
+
+    if not 'offset' in query and not 'limit' in query:
+      req.respondWithChunks(200, iter_schema_json(self.server.params), headers)
+      return
+
+    try:
+      offset = max(int(query.get('offset', ['0'])[0]), 0)
+      limit = max(int(query.get('limit', ['100'])[0]), 1)
+    except ValueError:
+      req.respond(400, b'invalid offset or limit')
+      return
+
+    items = schema_page(self.server.params, offset, limit)
+    page = {
+      'offset': offset,
+      'limit': limit,
+      'items': items,
+      'next': offset+limit if len(items) == limit else None}
+
+    req.respond(200, json.dumps(page).encode('utf-8'), headers)
+
+  def respondWithHistory(self, req):
+    '''
+    Responds with the downsampled value history of a param (see History.query);
+
+    /params/history?path=/sensor&window=600&buckets=100
+    '''
+    query = parse_qs(req.query)
+    path = query.get('path', [None])[0]
+
+    try:
+      window = float(query.get('window', [DEFAULT_HISTORY_WINDOW])[0])
+      buckets = int(query.get('buckets', [DEFAULT_HISTORY_BUCKETS])[0])
+      data = query_history(self.server.params, path, window, buckets) if path else None
+    except ValueError:
+      req.respond(400, b'invalid window or buckets')
+      return
+
+    if data is None:
+      req.respond(404, b'no history for this path')
+      return
+
+    req.respond(200, json.dumps(data).encode('utf-8'), {'Content-Type': 'application/json'})
@@ -63,12 +63,15 @@ class HttpRequest:
   def respondWithCode(self, code):
     self.handler.respond(code)
   
-  def respond(self, code, content):
-    self.handler.respond(code, content)
+  def respond(self, code, content, headers=None):
+    self.handler.respond(code, content, headers)
 
   def respondWithFile(self, filePath):
     self.handler.respondWithFile(filePath)
 
+  def respondWithChunks(self, code, chunks, headers=None):
+    self.handler.respondWithChunks(code, chunks, headers)
+
   def unscope(self, scope):
     if urlsplit == None or urlunsplit == None:
       print('[HttpScope] unscope not working')
@@ -109,6 +112,22 @@ def createRequestHandler(requestCallback, verbose=False):
     def respondWithFile(self, filePath):
       self.respondedWithFile = filePath
 
+    def respondWithChunks(self, code, chunks, headers=None):
+      '''
+      Streams the body from the given iterable of (str or bytes) chunks, without
+      a Content-Length; the end of the body is marked by closing the connection
+      '''
+      self.hasResponded = True
+      self.send_response(code)
+      if headers:
+        for key in headers:
+          self.send_header(key, headers[key])
+      self.send_header('Connection', 'close')
+      self.end_headers()
+
+      for chunk in chunks:
+        self.wfile.write(chunk.encode('utf-8') if isinstance(chunk, str) else chunk)
+
     def process_request(self, method='GET'):
       req = HttpRequest(self.path, self, method=method)
       requestCallback(req)
@@ -162,7 +181,7 @@ class HttpServer(threading.Thread):
     self.start() # start thread
 
   def stopServer(self, joinThread=True):
-    if not self.isAlive():
+    if not self.is_alive():
       return
 
     self.threading_event.clear()
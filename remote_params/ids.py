@@ -0,0 +1,108 @@
+import logging
+
+logger = logging.getLogger(__name__)
+
+class IdTable:
+  '''
+  Maps the paths of all params in a Params tree to small integer ids,
+  so value messages can refer to a param by id instead of by path, and
+  received ids are resolved with a list index instead of a path lookup.
+
+  The table is append-only: new params get the next free id and removed
+  params keep theirs (resolving to None), so an id never changes meaning
+  and clients only need the new entries after a schema change. A param
+  that is added again at the same path gets its previous id back.
+
+  ie.
+
+  ids = IdTable(params)
+  ids.to_list()   # ['/name', '/age', ...]; list index is the id
+  ids.id('/age')  # 1
+  ids.param(1)    # the IntParam at /age
+  '''
+
+  def __init__(self, params):
+    self.params = params
+    self.paths = []
+    self.ids = {}
+    self.items = []
+    # incremented whenever ids are added
+    self.version = 0
+    self.dirty = True
+
+  def __len__(self):
+    self.update()
+    return len(self.paths)
+
+  def invalidate(self):
+    '''
+    Marks the table for an update, after a schema change
+    '''
+    self.dirty = True
+
+  def update(self):
+    '''
+    Assigns ids to new params (when invalidated); returns True when ids were added
+    '''
+    if not self.dirty:
+      return False
+    self.dirty = False
+
+    found = {}
+    _collect_params(self.params, '', found)
+
+    added = False
+    for path, param in found.items():
+      id = self.ids.get(path)
+      if id is None:
+        self.ids[path] = len(self.paths)
+        self.paths.append(path)
+        self.items.append(param)
+        added = True
+      else:
+        self.items[id] = param
+
+    if len(found) < len(self.paths):
+      for id, path in enumerate(self.paths):
+        if path not in found:
+          self.items[id] = None
+
+    if added:
+      self.version += 1
+    return added
+
+  def id(self, path):
+    '''
+    Returns the id for the given param path, or None
+    '''
+    if self.dirty:
+      self.update()
+    return self.ids.get(path)
+
+  def param(self, id):
+    '''
+    Returns the param with the given id, or None
+    '''
+    if self.dirty:
+      self.update()
+    return self.items[id] if isinstance(id, int) and 0 <= id < len(self.items) else None
+
+  def path(self, id):
+    if self.dirty:
+      self.update()
+    return self.paths[id] if 0 <= id < len(self.paths) else None
+
+  def to_list(self):
+    '''
+    Returns the paths of all ids (the list index is the id)
+    '''
+    self.update()
+    return list(self.paths)
+
+def _collect_params(params, scope, result):
+  for id, item in params:
+    path = scope+'/'+id
+    if isinstance(item, list):
+      _collect_params(item, path, result)
+    else:
+      result[path] = item
@@ -0,0 +1,202 @@
+import logging, base64
+
+try:
+  import numpy as np
+except:
+  np = None # numpy not supported
+
+try:
+  import cv2
+except:
+  cv2 = None # not supported
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TILE_SIZE = 64
+DEFAULT_KEYFRAME_INTERVAL = 60
+# when more than this fraction of the tiles changed, a keyframe is cheaper
+DEFAULT_MAX_DELTA_RATIO = 0.5
+
+def changed_tiles(prev, frame, tile_size):
+  '''
+  Returns an (N, 2) array with the (row, column) tile indices
+  of all tiles that differ between the two (same shape) frames
+  '''
+  diff = prev != frame
+  if diff.ndim == 3:
+    diff = diff.any(axis=2)
+
+  h, w = diff.shape
+  rows, cols = -(-h // tile_size), -(-w // tile_size)
+  if rows * tile_size != h or cols * tile_size != w:
+    padded = np.zeros((rows * tile_size, cols * tile_size), dtype=bool)
+    padded[:h, :w] = diff
+    diff = padded
+
+  return np.argwhere(diff.reshape(rows, tile_size, cols, tile_size).any(axis=(1, 3)))
+
+def encode_tile_png(tile):
+  ret, img = cv2.imencode('.png', tile)
+  if not ret:
+    raise ValueError('cv2.imencode failed to encode tile into png format')
+  return base64.b64encode(img).decode('ascii')
+
+def decode_tile_png(data, width, height, channels):
+  buf = np.frombuffer(base64.b64decode(data), dtype=np.uint8)
+  return cv2.imdecode(buf, cv2.IMREAD_UNCHANGED)
+
+def encode_tile_raw(tile):
+  return base64.b64encode(np.ascontiguousarray(tile, dtype=np.uint8).tobytes()).decode('ascii')
+
+def decode_tile_raw(data, width, height, channels):
+  tile = np.frombuffer(base64.b64decode(data), dtype=np.uint8)
+  return tile.reshape((height, width, channels) if channels else (height, width))
+
+TILE_FORMATS = {
+  'png': (encode_tile_png, decode_tile_png),
+  'raw': (encode_tile_raw, decode_tile_raw),
+}
+
+def default_tile_format():
+  return 'png' if cv2 is not None else 'raw'
+
+class TileDeltaEncoder:
+  '''
+  Splits (uint8) image frames into tiles and produces delta messages with
+  only the tiles that changed since the previous frame, using vectorized
+  NumPy diffing. The first frame, frames with a different shape, every
+  keyframe_interval-th frame and frames in which most tiles changed
+  are sent as keyframes (a single tile with the whole frame).
+
+  Delta messages are dicts with the following format:
+
+  {
+    'frame': <frame number>,
+    'keyframe': <bool>,
+    'width': <frame width>,
+    'height': <frame height>,
+    'channels': <channel count, 0 for single-channel 2D frames>,
+    'format': <tile encoding; 'png' or 'raw' (base64 uint8 pixels)>,
+    'tiles': [[<x>, <y>, <width>, <height>, <encoded tile>], ...]
+  }
+
+  see TileDeltaDecoder for reassembling frames.
+  '''
+
+  def __init__(self, tile_size=DEFAULT_TILE_SIZE, keyframe_interval=DEFAULT_KEYFRAME_INTERVAL, max_delta_ratio=DEFAULT_MAX_DELTA_RATIO, format=None):
+    if np is None:
+      raise RuntimeError('TileDeltaEncoder requires numpy')
+
+    self.tile_size = tile_size
+    self.keyframe_interval = keyframe_interval
+    self.max_delta_ratio = max_delta_ratio
+    self.format = format if format else default_tile_format()
+    self.encode_tile = TILE_FORMATS[self.format][0]
+    self.prev = None
+    self.frame_number = -1
+    self.frames_since_keyframe = 0
+
+  def reset(self):
+    '''
+    Forces the next frame to be a keyframe
+    '''
+    self.prev = None
+
+  def encode(self, frame):
+    '''
+    Returns the delta message (see class docs) for the given frame,
+    or None when nothing changed since the previous frame
+    '''
+    frame = np.asarray(frame)
+    keyframe = self.prev is None or self.prev.shape != frame.shape \
+      or (self.keyframe_interval and self.frames_since_keyframe >= self.keyframe_interval)
+
+    tiles = None
+    if not keyframe:
+      tiles = changed_tiles(self.prev, frame, self.tile_size)
+      if len(tiles) == 0:
+        return None
+
+      total = -(-frame.shape[0] // self.tile_size) * -(-frame.shape[1] // self.tile_size)
+      keyframe = len(tiles) > total * self.max_delta_ratio
+
+    self.frame_number += 1
+    self.prev = frame.copy()
+
+    if keyframe:
+      self.frames_since_keyframe = 0
+      return self._message(frame, True, [self._tile(frame, 0, 0, frame.shape[1], frame.shape[0])])
+
+    self.frames_since_keyframe += 1
+    ts = self.tile_size
+    return self._message(frame, False, [self._tile(frame, col * ts, row * ts, ts, ts) for row, col in tiles.tolist()])
+
+  def keyframe(self, frame=None):
+    '''
+    Returns a keyframe message for the given frame (defaults to the
+    previously encoded frame) without affecting the delta state;
+    used for clients that join an existing stream
+    '''
+    frame = self.prev if frame is None else np.asarray(frame)
+    if frame is None:
+      return None
+    return self._message(frame, True, [self._tile(frame, 0, 0, frame.shape[1], frame.shape[0])])
+
+  def _tile(self, frame, x, y, width, height):
+    tile = frame[y:y+height, x:x+width]
+    return [x, y, tile.shape[1], tile.shape[0], self.encode_tile(tile)]
+
+  def _message(self, frame, keyframe, tiles):
+    return {
+      'frame': self.frame_number,
+      'keyframe': keyframe,
+      'width': frame.shape[1],
+      'height': frame.shape[0],
+      'channels': frame.shape[2] if frame.ndim == 3 else 0,
+      'format': self.format,
+      'tiles': tiles
+    }
+
+class TileDeltaDecoder:
+  '''
+  Client-side reassembly of the delta messages produced by TileDeltaEncoder.
+
+  ie.
+
+  decoder = TileDeltaDecoder()
+
+  def onDelta(data):
+    frame = decoder.apply(json.loads(data))
+    if frame is not None:
+      show(frame)
+  '''
+
+  def __init__(self):
+    if np is None:
+      raise RuntimeError('TileDeltaDecoder requires numpy')
+
+    self.frame = None
+    self.frame_number = None
+
+  def apply(self, message):
+    '''
+    Applies the given delta message and returns the reassembled frame,
+    or None while waiting for a keyframe (ie. after a missed delta)
+    '''
+    if not message['keyframe'] and (self.frame is None or message['frame'] != self.frame_number + 1):
+      logger.debug('[TileDeltaDecoder.apply] waiting for keyframe (got frame {})'.format(message['frame']))
+      self.frame = None
+      return None
+
+    decode_tile = TILE_FORMATS[message['format']][1]
+    channels = message['channels']
+
+    if message['keyframe']:
+      shape = (message['height'], message['width'], channels) if channels else (message['height'], message['width'])
+      self.frame = np.zeros(shape, dtype=np.uint8)
+
+    for x, y, width, height, data in message['tiles']:
+      self.frame[y:y+height, x:x+width] = decode_tile(data, width, height, channels)
+
+    self.frame_number = message['frame']
+    return self.frame
@@ -0,0 +1,179 @@
+import logging, base64, asyncio
+
+try:
+  import numpy as np
+except:
+  np = None # numpy not supported
+
+try:
+  import cv2
+except:
+  cv2 = None # not supported
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TARGET_FPS = 15
+DEFAULT_MAX_QUALITY = 85
+DEFAULT_MIN_QUALITY = 20
+DEFAULT_MIN_SCALE = 0.25
+QUALITY_STEP = 10
+SCALE_STEP = 0.75
+# encoded frames smaller than this fraction of the budget allow a better quality
+DEFAULT_HEADROOM = 0.5
+
+def encode_jpeg(frame, quality):
+  '''
+  Returns the base64 encoded JPEG for the given frame
+  '''
+  ret, img = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, int(quality)])
+  if not ret:
+    raise ValueError('cv2.imencode failed to encode image into jpeg format')
+  return base64.b64encode(img).decode('ascii')
+
+def scale_frame(frame, scale):
+  '''
+  Returns the given frame resized by the given factor (<= 1.0)
+  '''
+  if scale >= 1.0:
+    return frame
+
+  h, w = frame.shape[:2]
+  if cv2 is not None:
+    return cv2.resize(frame, (max(int(w * scale), 1), max(int(h * scale), 1)), interpolation=cv2.INTER_AREA)
+
+  step = max(int(round(1.0 / scale)), 1)
+  return frame[::step, ::step]
+
+class AdaptiveImageEncoder:
+  '''
+  Encodes the frames of an image param for a single client, adapting
+  the JPEG quality and resolution to the client's bandwidth (see
+  BandwidthEstimator), so an encoded frame can be sent in 1/target_fps
+  seconds. Lowers the quality first and then the resolution; raises the
+  resolution first when there's enough headroom again.
+
+  Together with latest-frame-only sending (see PriorityLanes.put_latest)
+  the frame rate a client receives follows from its bandwidth.
+
+  ie.
+
+  encoder = AdaptiveImageEncoder(target_fps=15)
+  data = encoder.encode(frame, lanes.bandwidth.rate)
+  '''
+
+  def __init__(self, target_fps=DEFAULT_TARGET_FPS, min_quality=DEFAULT_MIN_QUALITY, max_quality=DEFAULT_MAX_QUALITY,
+    min_scale=DEFAULT_MIN_SCALE, headroom=DEFAULT_HEADROOM, encode=encode_jpeg):
+    """
+    Parameters
+    ----------
+    encode : function
+      encode(frame, quality) -> str; defaults to base64 JPEG (requires cv2)
+    """
+    self.target_fps = target_fps
+    self.min_quality = min_quality
+    self.max_quality = max_quality
+    self.min_scale = min_scale
+    self.headroom = headroom
+    self._encode = encode
+    self.quality = max_quality
+    self.scale = 1.0
+
+  def encode(self, frame, rate=None):
+    '''
+    Encodes the given frame at the current quality and scale, and
+    adapts those to the given bandwidth (in bytes per second)
+    '''
+    data = self._encode(scale_frame(frame, self.scale), self.quality)
+    self.adapt(len(data), rate)
+    return data
+
+  def adapt(self, size, rate):
+    '''
+    Adapts quality and scale after encoding a frame of the given size
+    '''
+    if rate is None:
+      return
+
+    budget = rate / self.target_fps
+    if size > budget:
+      if self.quality > self.min_quality:
+        self.quality = max(self.quality - QUALITY_STEP, self.min_quality)
+      elif self.scale > self.min_scale:
+        self.scale = max(self.scale * SCALE_STEP, self.min_scale)
+      return
+
+    if size < budget * self.headroom:
+      if self.scale < 1.0:
+        self.scale = min(self.scale / SCALE_STEP, 1.0)
+      elif self.quality < self.max_quality:
+        self.quality = min(self.quality + QUALITY_STEP, self.max_quality)
+
+class SharedEncodings:
+  '''
+  Encodings of the latest frame of an image param, one per (quality, scale)
+  level, shared by all clients at the same level. Frames are encoded in
+  the event loop's (default) executor, so encoding doesn't hold up the
+  other messages sent by the loop.
+  '''
+
+  def __init__(self, encode=encode_jpeg):
+    self._encode = encode
+    # param version of the encoded frame, (quality, scale) -> future
+    self.version = None
+    self.futures = {}
+
+  def get(self, version, frame, quality, scale):
+    '''
+    Returns an (asyncio) future with the encoding of the frame of the
+    given param version; the frame should stay retained until it's done
+    '''
+    if self.version is None or version > self.version:
+      self.version = version
+      self.futures = {}
+
+    level = (quality, scale)
+    future = self.futures.get(level) if version == self.version else None
+    if future is None:
+      future = asyncio.get_event_loop().run_in_executor(None, self.encode, frame, quality, scale)
+      if version == self.version:
+        self.futures[level] = future
+    return future
+
+  def encode(self, frame, quality, scale):
+    return self._encode(scale_frame(frame, scale), quality)
+
+class PendingFrame:
+  '''
+  A retained image param frame waiting to be sent (see PriorityLanes.put_latest).
+  When called, it starts the encoding (see SharedEncodings) and returns a coroutine
+  with the message; the frame is released when the encoding is done, or when the
+  pending frame is replaced by a newer one.
+
+  start(frame) -> future with the encoded data
+  finish(data) -> message
+  '''
+
+  def __init__(self, param, frame, start, finish):
+    self.param = param
+    self.frame = frame
+    self._start = start
+    self._finish = finish
+
+  def __call__(self):
+    future = self._start(self.frame)
+    future.add_done_callback(lambda future: self.discard())
+    return self._message(future)
+
+  async def _message(self, future):
+    try:
+      # shielded; the (shared) encoding keeps using the frame when cancelled
+      data = await asyncio.shield(future)
+    except Exception as err:
+      logger.warning('[PendingFrame] failed to encode frame: {}'.format(err))
+      return None
+    return self._finish(data)
+
+  def discard(self):
+    if self.frame is not None:
+      self.param.release(self.frame)
+      self.frame = None
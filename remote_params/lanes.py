@@ -0,0 +1,232 @@
+import logging, asyncio, time, inspect
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+# priority classes; lower is more urgent
+PRIORITY_HIGH = 0   # control values (triggers, toggles, faders)
+PRIORITY_NORMAL = 1 # strings, arrays
+PRIORITY_BULK = 2   # large payloads (images)
+PRIORITIES = (PRIORITY_HIGH, PRIORITY_NORMAL, PRIORITY_BULK)
+
+# sends of smaller messages return before the network is involved,
+# so they say nothing about the bandwidth (see BandwidthEstimator)
+DEFAULT_MIN_MEASURE_SIZE = 16*1024
+
+# default priority by param type (see Param.priority)
+TYPE_PRIORITIES = {
+  'v': PRIORITY_HIGH,
+  'b': PRIORITY_HIGH,
+  'i': PRIORITY_HIGH,
+  'f': PRIORITY_HIGH,
+  's': PRIORITY_NORMAL,
+  'a': PRIORITY_NORMAL,
+  'g': PRIORITY_BULK}
+
+def priority_of(param):
+  '''
+  Returns the priority class of the given param; its own
+  priority when set, otherwise the default for its type
+  '''
+  if param is None:
+    return PRIORITY_NORMAL
+  if param.priority is not None:
+    return param.priority
+  return TYPE_PRIORITIES.get(param.type, PRIORITY_NORMAL)
+
+class BandwidthEstimator:
+  '''
+  Estimates the bandwidth of a connection (in bytes per second) from the
+  duration of sending large messages, as an exponential moving average.
+  Sending only awaits the network when the transport's write buffer is full,
+  so on fast connections this underestimates the duration of a send; the
+  estimate is meant to detect connections that can't keep up.
+  '''
+
+  def __init__(self, alpha=0.25, min_size=DEFAULT_MIN_MEASURE_SIZE):
+    self.alpha = alpha
+    self.min_size = min_size
+    # bytes per second, None until the first measurement
+    self.rate = None
+
+  def add(self, size, duration):
+    '''
+    Adds a measurement; returns False when it was too small to be used
+    '''
+    if size < self.min_size or duration <= 0:
+      return False
+
+    rate = size / duration
+    self.rate = rate if self.rate is None else self.rate + self.alpha * (rate - self.rate)
+    return True
+
+class _Latest:
+  '''
+  Placeholder in a lane for the pending message with the given key (see PriorityLanes.put_latest)
+  '''
+  __slots__ = ('key',)
+
+  def __init__(self, key):
+    self.key = key
+
+class PriorityLanes:
+  '''
+  Outgoing message queues of a single connection, one for every priority
+  class, served by a single sender task which always sends the oldest
+  message of the most urgent non-empty lane. So a queued (control) value
+  waits for at most the message that is currently being sent, instead of
+  for every (bulk) message that was queued before it.
+
+  ie.
+
+  lanes = PriorityLanes(websocket.send)
+  lanes.put(image_msg, PRIORITY_BULK)
+  lanes.put(fader_msg, PRIORITY_HIGH) # sent before image_msg, unless that's already being sent
+
+  Messages queued with put_latest replace any pending message with the same key
+  (ie. the frames of an image param), so a slow connection skips frames instead
+  of building up latency. These can be callables (with an optional discard
+  method) which are called to produce the message when it's about to be sent.
+  A callable can return an awaitable (ie. an encoding running in an executor);
+  while it's pending, messages of more urgent lanes are still sent.
+  '''
+
+  def __init__(self, send):
+    """
+    Parameters
+    ----------
+    send : coroutine function
+      sends a single message, ie. websocket.send
+    """
+    self.send = send
+    self.lanes = [deque() for _ in PRIORITIES]
+    self.wakeup = asyncio.Event()
+    self.task = None
+    self.closed = False
+    # key -> pending message (see put_latest)
+    self.latest = {}
+    # number of messages replaced before they were sent
+    self.dropped = 0
+    self.bandwidth = BandwidthEstimator()
+
+  def __len__(self):
+    return sum(len(lane) for lane in self.lanes)
+
+  def put(self, msg, priority=PRIORITY_NORMAL):
+    '''
+    Queues the given message; must be called from the event loop's thread
+    '''
+    if self.closed:
+      return
+    self.lanes[priority].append(msg)
+    self._wake()
+
+  def put_latest(self, key, msg, priority=PRIORITY_BULK):
+    '''
+    Queues the given message, replacing the pending message with the same key;
+    must be called from the event loop's thread
+    '''
+    if self.closed:
+      _discard(msg)
+      return
+
+    if key in self.latest:
+      _discard(self.latest[key])
+      self.dropped += 1
+    else:
+      self.lanes[priority].append(_Latest(key))
+
+    self.latest[key] = msg
+    self._wake()
+
+  def _wake(self):
+    self.wakeup.set()
+    if self.task is None:
+      self.task = asyncio.ensure_future(self._run())
+
+  def next(self):
+    '''
+    Returns (and removes) the next message to send, or None
+    '''
+    return self._next()[0]
+
+  def _next(self, below=len(PRIORITIES)):
+    # (message, priority) of the next message more urgent than the given priority
+    for priority in range(below):
+      lane = self.lanes[priority]
+      if lane:
+        msg = lane.popleft()
+        return (self.latest.pop(msg.key) if type(msg) is _Latest else msg), priority
+    return None, None
+
+  def clear(self):
+    for lane in self.lanes:
+      lane.clear()
+    for msg in self.latest.values():
+      _discard(msg)
+    self.latest.clear()
+
+  def close(self):
+    self.closed = True
+    self.clear()
+    if self.task is not None:
+      self.task.cancel()
+      self.task = None
+
+  async def _run(self):
+    while not self.closed:
+      msg, priority = self._next()
+      if msg is None:
+        self.wakeup.clear()
+        await self.wakeup.wait()
+        continue
+
+      if callable(msg):
+        msg = msg()
+        if inspect.isawaitable(msg):
+          msg = await self._render(msg, priority)
+        if msg is None:
+          continue
+
+      await self._send(msg)
+
+  async def _render(self, awaitable, priority):
+    '''
+    Awaits the given (message producing) awaitable, while
+    sending the messages that are more urgent than it
+    '''
+    future = asyncio.ensure_future(awaitable)
+    while not future.done() and not self.closed:
+      msg, _ = self._next(priority)
+      if callable(msg):
+        msg = msg()
+        if inspect.isawaitable(msg):
+          msg = await msg
+      if msg is not None:
+        await self._send(msg)
+        continue
+
+      self.wakeup.clear()
+      wakeup = asyncio.ensure_future(self.wakeup.wait())
+      await asyncio.wait((future, wakeup), return_when=asyncio.FIRST_COMPLETED)
+      wakeup.cancel()
+
+    return (await future) if not self.closed else None
+
+  async def _send(self, msg):
+    try:
+      t = time.perf_counter()
+      await self.send(msg)
+      self.bandwidth.add(len(msg), time.perf_counter() - t)
+    except asyncio.CancelledError:
+      raise
+    except Exception as err:
+      # ie. connection closed
+      logger.debug('[PriorityLanes] send failed, dropping {} queued messages: {}'.format(len(self), err))
+      self.closed = True
+      self.clear()
+
+def _discard(msg):
+  discard = getattr(msg, 'discard', None)
+  if discard is not None:
+    discard()
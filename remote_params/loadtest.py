@@ -0,0 +1,392 @@
+'''
+Load generator and soak-test harness for the websocket and OSC transports.
+
+Starts a local params server (in a separate process, so the simulated
+clients don't compete with it for the GIL) and connects N websocket
+and M OSC clients to it. The first S clients subscribe to all value
+changes, the last W clients write values at a fixed rate. Every written
+value carries its writer, sequence number and send time, so subscribers
+can measure end-to-end latency and count dropped messages.
+
+ie.
+
+python -m remote_params.loadtest --ws-clients 100 --osc-clients 10 --subscribers 100 --writers 10 --rate 50 --duration 600
+'''
+import logging, asyncio, time, os, threading, multiprocessing, math
+import websockets
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_WS_PORT = 8091
+DEFAULT_OSC_PORT = 8092
+DEFAULT_OSC_CLIENT_PORT = 9100
+# path pattern that matches no params, for clients that shouldn't receive values
+NO_PARAMS_PATTERN = '/__none__'
+
+def percentile(sorted_values, p):
+  '''
+  Returns the p-th (0-100) percentile of the given sorted values (nearest rank)
+  '''
+  if not sorted_values:
+    return None
+  # (rounded, to prevent ie. 99.9% of 1000 to be slightly over 999)
+  idx = max(int(math.ceil(round(p * len(sorted_values) / 100.0, 6))) - 1, 0)
+  return sorted_values[min(idx, len(sorted_values) - 1)]
+
+class LatencyHistogram:
+  '''
+  Latency histogram with logarithmic buckets (each `precision` wider than
+  the previous one), so percentiles over a run of any length are estimated
+  (within precision) in fixed memory
+  '''
+
+  def __init__(self, min_value=1e-6, max_value=1e3, precision=0.01):
+    self.min_value = min_value
+    self.log_base = math.log1p(precision)
+    self.buckets = [0] * (self._index(max_value) + 1)
+    self.count = 0
+    self.max = None
+
+  def _index(self, value):
+    if value <= self.min_value:
+      return 0
+    return int(math.log(value / self.min_value) / self.log_base) + 1
+
+  def add(self, value):
+    self.buckets[min(self._index(value), len(self.buckets) - 1)] += 1
+    self.count += 1
+    self.max = value if self.max is None else max(self.max, value)
+
+  def extend(self, values):
+    for value in values:
+      self.add(value)
+
+  def percentile(self, p):
+    '''
+    Returns (the upper bound of the bucket of) the p-th (0-100) percentile (nearest rank)
+    '''
+    if not self.count:
+      return None
+    rank = max(int(math.ceil(round(p * self.count / 100.0, 6))), 1)
+    total = 0
+    for idx, count in enumerate(self.buckets):
+      total += count
+      if total >= rank:
+        return min(self.min_value * math.exp(idx * self.log_base), self.max)
+    return self.max
+
+  def summary(self):
+    return {
+      'p50': self.percentile(50),
+      'p99': self.percentile(99),
+      'p999': self.percentile(99.9),
+      'max': self.max}
+
+def rss(pid=None):
+  '''
+  Returns the resident set size (in bytes) of the given
+  process (defaults to this process), or None when unknown
+  '''
+  try:
+    with open('/proc/{}/statm'.format(pid if pid else 'self')) as f:
+      return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+  except (OSError, ValueError, IndexError):
+    return None
+
+def encode_sample(writer, seq):
+  return '{}:{}:{!r}'.format(writer, seq, time.monotonic())
+
+def decode_sample(value):
+  writer, seq, sent = str(value).split(':')
+  return int(writer), int(seq), float(sent)
+
+class LoadStats:
+  '''
+  Thread-safe counters and latency samples, collected per report interval
+  '''
+
+  def __init__(self):
+    self.lock = threading.Lock()
+    self.sent = 0
+    self.received = 0
+    self.errors = 0
+    self.latencies = []
+    self.total_sent = 0
+    self.total_received = 0
+    # latencies of the whole run
+    self.histogram = LatencyHistogram()
+
+  def add_sent(self, count=1):
+    with self.lock:
+      self.sent += count
+      self.total_sent += count
+
+  def add_received(self, value):
+    latency = time.monotonic() - decode_sample(value)[2]
+    with self.lock:
+      self.received += 1
+      self.total_received += 1
+      self.latencies.append(latency)
+
+  def add_error(self):
+    with self.lock:
+      self.errors += 1
+
+  def take(self):
+    '''
+    Returns and resets the counters and (sorted) latencies of the current interval
+    '''
+    with self.lock:
+      sent, received, latencies = self.sent, self.received, self.latencies
+      self.sent, self.received, self.latencies = 0, 0, []
+      self.histogram.extend(latencies)
+    latencies.sort()
+    return sent, received, latencies
+
+def summarize(latencies):
+  return {
+    'p50': percentile(latencies, 50),
+    'p99': percentile(latencies, 99),
+    'p999': percentile(latencies, 99.9),
+    'max': latencies[-1] if latencies else None}
+
+def _run_server(writers, ws_port, osc_port, ready, stop):
+  from .params import Params
+  from .server import Server
+  from .WebsocketServer import WebsocketServer
+
+  params = Params()
+  for idx in range(writers):
+    params.string('w{}'.format(idx))
+  server = Server(params)
+
+  osc_server = None
+  if osc_port:
+    from .osc import OscServer
+    osc_server = OscServer(server, port=osc_port)
+
+  async def main():
+    wss = WebsocketServer(server, host='127.0.0.1', port=ws_port, start=False)
+    await wss.start_async()
+    ready.set()
+    while not stop.is_set():
+      await asyncio.sleep(0.1)
+    wss.stop()
+
+  asyncio.run(main())
+  if osc_server:
+    osc_server.disconnect_listener()
+
+class WebsocketLoadClient:
+  '''
+  Simulated websocket client, speaking the WebsocketServer protocol
+  '''
+
+  def __init__(self, uri, stats, subscribe=True):
+    self.uri = uri
+    self.stats = stats
+    self.subscribe = subscribe
+    self.websocket = None
+
+  async def connect(self):
+    self.websocket = await websockets.connect(self.uri, max_queue=None)
+    await self.websocket.recv() # welcome message
+    if not self.subscribe:
+      await self.websocket.send('POST subscribe?pattern={}'.format(NO_PARAMS_PATTERN))
+
+  async def receive(self):
+    try:
+      async for msg in self.websocket:
+        if isinstance(msg, str) and msg.startswith('POST /w') and '?value=' in msg:
+          self.stats.add_received(msg.split('?value=', 1)[1])
+    except websockets.exceptions.ConnectionClosed:
+      pass
+
+  async def write(self, path, value):
+    await self.websocket.send('POST {}?value={}'.format(path, value))
+
+  async def close(self):
+    await self.websocket.close()
+
+class OscLoadClients:
+  '''
+  Simulated OSC clients, sharing a single listener thread
+  '''
+
+  def __init__(self, host, port, client_port, count, stats):
+    from oscpy.client import OSCClient
+    from oscpy.server import OSCThreadServer
+
+    self.stats = stats
+    self.client = OSCClient(host, port, encoding='utf8')
+    self.ports = [client_port + idx for idx in range(count)]
+    self.listener = OSCThreadServer(encoding='utf8', default_handler=self._onMessage)
+    for p in self.ports:
+      sock = self.listener.listen(address='127.0.0.1', port=p)
+      # respond to heartbeats, so the server keeps the client connected
+      confirm = lambda *args, client_id='127.0.0.1:{}'.format(p): self.client.send_message('/params/confirm', [client_id])
+      self.listener.bind('/params/heartbeat', confirm, sock=sock)
+
+  def _onMessage(self, addr, *args):
+    if addr == b'/params/value' and len(args) == 2:
+      try:
+        self.stats.add_received(args[1])
+      except ValueError:
+        self.stats.add_error()
+
+  def connect(self, idx, subscribe=True):
+    client_id = '127.0.0.1:{}'.format(self.ports[idx])
+    self.client.send_message('/params/connect', [client_id])
+    if not subscribe:
+      self.client.send_message('/params/subscribe', [client_id, NO_PARAMS_PATTERN])
+
+  def write(self, path, value):
+    self.client.send_message('/params/value', [path, value])
+
+  def close(self):
+    self.listener.terminate_server()
+    self.listener.join_server()
+    self.listener.stop_all()
+
+async def _write_loop(write, writer_id, rate, stats, until):
+  path = '/w{}'.format(writer_id)
+  interval = 1.0 / rate
+  next_time = time.monotonic()
+  seq = 0
+  while time.monotonic() < until:
+    try:
+      result = write(path, encode_sample(writer_id, seq))
+      if asyncio.iscoroutine(result):
+        await result
+      stats.add_sent()
+    except Exception as err:
+      logger.debug('[loadtest] write failed: {}'.format(err))
+      stats.add_error()
+    seq += 1
+    next_time += interval
+    await asyncio.sleep(max(next_time - time.monotonic(), 0.0))
+
+async def run_load_test(ws_clients=10, osc_clients=0, subscribers=None, writers=1, rate=10.0,
+  duration=10.0, interval=1.0, drain=1.0, ws_port=DEFAULT_WS_PORT, osc_port=DEFAULT_OSC_PORT,
+  osc_client_port=DEFAULT_OSC_CLIENT_PORT, report=None):
+  '''
+  Runs a load test and returns a summary dict. The given report
+  callback is called with a dict of statistics every interval seconds.
+  '''
+  total = ws_clients + osc_clients
+  subscribers = total if subscribers is None else min(subscribers, total)
+  writers = min(writers, total)
+  stats = LoadStats()
+
+  ready, stop = multiprocessing.Event(), multiprocessing.Event()
+  process = multiprocessing.Process(target=_run_server, args=(writers, ws_port, osc_port if osc_clients else None, ready, stop), daemon=True)
+  process.start()
+
+  osc = None
+  tasks = []
+  try:
+    if not ready.wait(10.0):
+      raise RuntimeError('load test server did not start')
+
+    # clients 0..ws_clients-1 are websocket clients, the rest OSC clients;
+    # the first clients subscribe, the last clients write
+    uri = 'ws://127.0.0.1:{}'.format(ws_port)
+    ws = [WebsocketLoadClient(uri, stats, subscribe=idx < subscribers) for idx in range(ws_clients)]
+    for client in ws:
+      await client.connect()
+      tasks.append(asyncio.ensure_future(client.receive()))
+
+    if osc_clients:
+      osc = OscLoadClients('127.0.0.1', osc_port, osc_client_port, osc_clients, stats)
+      for idx in range(osc_clients):
+        osc.connect(idx, subscribe=ws_clients + idx < subscribers)
+
+    # let subscriptions settle
+    await asyncio.sleep(0.5)
+    start_rss = rss(process.pid)
+    start_time = time.monotonic()
+    until = start_time + duration
+
+    write_funcs = [client.write for client in ws] + ([osc.write] * osc_clients if osc else [])
+    writer_tasks = [asyncio.ensure_future(_write_loop(write_funcs[total - 1 - idx], idx, rate, stats, until)) for idx in range(writers)]
+
+    expected = 0
+    while time.monotonic() < until:
+      await asyncio.sleep(min(interval, max(until - time.monotonic(), 0.0)))
+      sent, received, latencies = stats.take()
+      expected += sent * subscribers
+      if report:
+        elapsed = time.monotonic() - start_time
+        info = {'time': elapsed, 'sent': sent, 'received': received, 'throughput': received / interval, 'errors': stats.errors, 'rss': rss(process.pid)}
+        info.update(summarize(latencies))
+        report(info)
+
+    await asyncio.gather(*writer_tasks)
+    await asyncio.sleep(drain)
+    sent, received, latencies = stats.take()
+    expected += sent * subscribers
+    end_rss = rss(process.pid)
+
+    result = {
+      'clients': total,
+      'subscribers': subscribers,
+      'writers': writers,
+      'sent': stats.total_sent,
+      'received': stats.total_received,
+      'expected': expected,
+      'dropped': max(expected - stats.total_received, 0),
+      'errors': stats.errors,
+      'throughput': stats.total_received / duration,
+      'rss_start': start_rss,
+      'rss_end': end_rss,
+      'rss_growth': end_rss - start_rss if start_rss is not None and end_rss is not None else None}
+    result.update(stats.histogram.summary())
+    return result
+  finally:
+    for task in tasks:
+      task.cancel()
+    if osc:
+      osc.close()
+    stop.set()
+    process.join(5.0)
+    if process.is_alive():
+      process.terminate()
+
+def format_report(info):
+  def ms(v):
+    return '-' if v is None else '{:.2f}ms'.format(v * 1000.0)
+  def mb(v):
+    return '-' if v is None else '{:.1f}MB'.format(v / 1024.0 / 1024.0)
+
+  return 't={:.0f}s sent={} recv={} ({:.0f}/s) p50={} p99={} p999={} max={} errors={} rss={}'.format(
+    info['time'], info['sent'], info['received'], info['throughput'], ms(info['p50']), ms(info['p99']),
+    ms(info['p999']), ms(info['max']), info['errors'], mb(info['rss']))
+
+
+if __name__ == '__main__':
+  from optparse import OptionParser
+  import json
+
+  def parse_args():
+    parser = OptionParser()
+    parser.add_option('--ws-clients', default=10, type='int')
+    parser.add_option('--osc-clients', default=0, type='int')
+    parser.add_option('-s', '--subscribers', default=None, type='int', help='number of clients that receive all value changes (default: all)')
+    parser.add_option('-w', '--writers', default=1, type='int', help='number of clients that write values')
+    parser.add_option('-r', '--rate', default=10.0, type='float', help='writes per second, per writer')
+    parser.add_option('-d', '--duration', default=10.0, type='float', help='duration in seconds')
+    parser.add_option('-i', '--interval', default=1.0, type='float', help='report interval in seconds')
+    parser.add_option('--ws-port', default=DEFAULT_WS_PORT, type='int')
+    parser.add_option('--osc-port', default=DEFAULT_OSC_PORT, type='int')
+    parser.add_option('-v', '--verbose', action='store_true', default=False)
+
+    opts, args = parser.parse_args()
+    logging.basicConfig(level=logging.DEBUG if opts.verbose else logging.WARNING)
+    return opts, args
+
+  opts, args = parse_args()
+  result = asyncio.run(run_load_test(
+    ws_clients=opts.ws_clients, osc_clients=opts.osc_clients, subscribers=opts.subscribers,
+    writers=opts.writers, rate=opts.rate, duration=opts.duration, interval=opts.interval,
+    ws_port=opts.ws_port, osc_port=opts.osc_port, report=lambda info: print(format_report(info))))
+  print(json.dumps(result, indent=2))
@@ -1,12 +1,29 @@
 
 from oscpy.client import OSCClient
 
-import logging, json
+import logging, json, time, threading, weakref
+from collections import OrderedDict
+
+try:
+  import numpy as np
+except:
+  np = None # numpy not supported
+
 from .server import Remote
 from .schema import schema_list
 
 logger = logging.getLogger(__name__)
 
+DEFAULT_OSC_PORT = 8000
+
+# JSON payloads larger than this (in characters) are sent in fragments,
+# so every message fits in a single UDP datagram without IP fragmentation
+DEFAULT_MAX_FRAGMENT_SIZE = 1024
+# number of recent fragmented transfers kept for retransmission
+MAX_STORED_TRANSFERS = 32
+# interval (in seconds) of heartbeats to connected clients (see OscServer)
+DEFAULT_HEARTBEAT_INTERVAL = 2.0
+
 class Client:
   '''
   This Client class performs all server-to-client OSC communications.
@@ -38,6 +55,7 @@ class Client:
       prefix to apply to all outgoing OSC message addresses
     """
 
+    self.osc_server = server
     self.send_raw = server.send
 
     parts = id.split(':')
@@ -50,28 +68,119 @@ class Client:
       self.port = int(parts[1])
       self.isValid = True
 
+    self.id = id
+
     self.connect_confirm_addr = prefix+'/connect/confirm'
     self.disconnect_addr = prefix+'/disconnect'
+    self.heartbeat_addr = prefix+'/heartbeat'
     self.schema_addr = prefix+'/schema'
     self.value_addr = prefix+'/value'
+    self.value_id_addr = prefix+'/v'
+    self.ids_addr = prefix+'/ids'
 
   def send(self, addr, args=()):
     self.send_raw(self.host, self.port, addr, args)
 
   def sendValue(self, path, value):
-    self.send(self.value_addr, (path, value))
+    self.send(self.value_addr, (path, self.encodeValue(value)))
+
+  def sendValueId(self, id, value):
+    self.send(self.value_id_addr, (id, self.encodeValue(value)))
+
+  def encodeValue(self, value):
+    # array values are sent as a blob with the raw (little-endian) typed-array data
+    if np is not None and isinstance(value, np.ndarray) and value.ndim == 1:
+      return bytearray(value.tobytes())
+    return value
+
+  def sendIds(self, paths):
+    if not self.isValid: return
+    self.sendJson(self.ids_addr, json.dumps(paths))
 
   def sendSchema(self, data):
     if not self.isValid: return
-    self.send(self.schema_addr, (json.dumps(data)))
+    self.sendJson(self.schema_addr, json.dumps(data))
 
   def sendConnectConfirmation(self, data):
     if not self.isValid: return
-    self.send(self.connect_confirm_addr, (json.dumps(data)))
+    self.sendJson(self.connect_confirm_addr, json.dumps(data))
+
+  def sendJson(self, addr, text):
+    '''
+    Sends the given JSON text in a single message, or when it is too big,
+    in a sequence of fragment messages with the following format:
+      <addr>/fragment <transfer-id> <index> <count> '<json-fragment>'
+    '''
+    max_size = getattr(self.osc_server, 'max_fragment_size', DEFAULT_MAX_FRAGMENT_SIZE)
+    if not max_size or len(text) <= max_size:
+      self.send(addr, (text,))
+      return
+
+    fragments = [text[i:i+max_size] for i in range(0, len(text), max_size)]
+    transfer_id = self.osc_server.store_transfer(self.id, addr+'/fragment', fragments)
+    self.sendFragments(addr+'/fragment', transfer_id, fragments, range(len(fragments)))
+
+  def sendFragments(self, addr, transfer_id, fragments, indices):
+    for idx in indices:
+      self.send(addr, (transfer_id, idx, len(fragments), fragments[idx]))
 
   def sendDisconnect(self):
     self.send(self.disconnect_addr)
 
+  def sendHeartbeat(self):
+    self.send(self.heartbeat_addr)
+
+class FragmentAssembler:
+  '''
+  Client-side helper for reassembling fragmented JSON transfers
+  (see Client.sendJson).
+
+  ie.
+
+  assembler = FragmentAssembler()
+
+  def onFragment(transfer_id, index, count, data):
+    text = assembler.add(transfer_id, index, count, data)
+    if text is not None:
+      schema = json.loads(text)
+      # acknowledge, so the server can drop the transfer
+      send('/params/confirm', (my_id, transfer_id))
+
+  # after a timeout, request missing fragments
+  send('/params/confirm', (my_id, transfer_id, *assembler.missing(transfer_id)))
+  '''
+
+  def __init__(self):
+    self.transfers = {}
+
+  def add(self, transfer_id, index, count, data):
+    '''
+    Adds a fragment and returns the complete text once
+    all fragments of the transfer have been received
+    '''
+    fragments = self.transfers.get(transfer_id)
+    if fragments is None or len(fragments) != count:
+      fragments = [None] * count
+      self.transfers[transfer_id] = fragments
+
+    if index < 0 or index >= count:
+      logger.warning('[FragmentAssembler.add] invalid fragment index {} of {}'.format(index, count))
+      return None
+
+    fragments[index] = data
+    if any(f is None for f in fragments):
+      return None
+
+    del self.transfers[transfer_id]
+    return ''.join(fragments)
+
+  def missing(self, transfer_id):
+    fragments = self.transfers.get(transfer_id, [])
+    return [idx for idx, f in enumerate(fragments) if f is None]
+
+  def discard(self, transfer_id):
+    self.transfers.pop(transfer_id, None)
+
 class Connection:
   '''
   The Connection class responds to all server-to-client
@@ -79,10 +188,16 @@ class Connection:
   '''
   def __init__(self, osc_server, id, connect=True):
     logger.debug('[Connection.__init__] id: {}'.format(id))
+    self.id = id
     self.osc_server = osc_server
     self.server = osc_server.server
     self.client = Client(osc_server, id)
     self.isActive = self.client.isValid and connect
+    # version of the id table last sent to the client, or
+    # None while the client didn't request ids (see enable_ids)
+    self.ids_version = None
+    # time.monotonic() of the last message from the client (see OscServer.check_liveness)
+    self.last_seen = time.monotonic()
 
     r = Remote()
     r.outgoing.sendConnectConfirmationEvent += self.onConnectConfimToRemote
@@ -98,20 +213,44 @@ class Connection:
     self.disconnect()
 
   def disconnect(self):
-    self.osc_server = None # break circular dependency
-    # self.osc_server.connections.remove(self)
+    osc_server, self.osc_server = self.osc_server, None # break circular dependency
+    if osc_server is not None:
+      osc_server.forget(self)
     self.isActive = False
 
     if self.remote and self.server:
       self.server.disconnect(self.remote)
 
+  def enable_ids(self):
+    '''
+    Sends the id table and from now on sends values
+    with param ids instead of paths (see IdTable)
+    '''
+    if not self.isActive: return
+    self.sendIds()
+
+  def sendIds(self):
+    ids = self.server.ids
+    self.client.sendIds(ids.to_list())
+    self.ids_version = ids.version
+
   def onValueToRemote(self, path, value):
     if not self.isActive: return
+    if self.ids_version is not None:
+      id = self.server.ids.id(path)
+      if id is not None:
+        self.client.sendValueId(id, value)
+        return
     self.client.sendValue(path, value)
 
   def onSchemaToRemote(self, schema_data):
     if not self.isActive: return
     self.client.sendSchema(schema_data)
+    # new params got new ids
+    if self.ids_version is not None:
+      self.server.ids.update()
+      if self.server.ids.version != self.ids_version:
+        self.sendIds()
 
   def onConnectConfimToRemote(self, schema_data):
     if not self.isActive: return
@@ -123,7 +262,7 @@ class Connection:
     self.disconnect()
     self.client.sendDisconnect()
 
-def create_osc_listener(port=8000, callback=None):
+def create_osc_listener(port=DEFAULT_OSC_PORT, callback=None):
   '''
   Create a threaded OSC server that listens for incoming UDP messages
   '''
@@ -151,11 +290,41 @@ def create_osc_listener(port=8000, callback=None):
 
   return osc, disconnect
 
+def _run_heartbeats(ref, stop, interval):
+  # holds only a weak reference, so the OscServer can be garbage collected
+  while not stop.wait(interval):
+    osc_server = ref()
+    if osc_server is None:
+      return
+    osc_server.heartbeat()
+    del osc_server
+
 class OscServer:
-  def __init__(self, server, prefix=None, capture_sends=None, listen=True):
+  '''
+  Serves params to OSC clients (see docs/OSC.md).
+
+  With a connection_timeout (disabled by default), connected clients receive
+  a heartbeat message every heartbeat_interval seconds, to which they respond
+  with a confirm message. Clients that didn't send any message that identifies
+  them (with their host:port) for connection_timeout seconds are disconnected
+  (see check_liveness), so value changes are only sent to live clients.
+  Clients that don't confirm heartbeats (ie. that only send values, which
+  don't identify the client) should only be used without a connection_timeout.
+  '''
+
+  def __init__(self, server, prefix=None, capture_sends=None, listen=True, max_fragment_size=DEFAULT_MAX_FRAGMENT_SIZE, port=DEFAULT_OSC_PORT,
+    heartbeat_interval=DEFAULT_HEARTBEAT_INTERVAL, connection_timeout=None):
     self.server = server
     self.capture_sends = capture_sends
-    self.connections = []
+    # client id (host:port) -> Connection
+    self.connections = {}
+    self.lock = threading.RLock()
+    self.heartbeat_interval = heartbeat_interval
+    self.connection_timeout = connection_timeout
+    self.max_fragment_size = max_fragment_size
+    # recent fragmented transfers, for retransmission on request
+    self.transfers = OrderedDict()
+    self.next_transfer_id = 1
     self.remote = Remote()
     # register our remote instance, through which we'll
     # inform the server about incoming information
@@ -166,21 +335,36 @@ class OscServer:
     self.connect_addr = self.prefix+'/connect'
     self.disconnect_addr = self.prefix+'/disconnect'
     self.value_addr = self.prefix+'/value'
+    self.value_id_addr = self.prefix+'/v'
+    self.ids_addr = self.prefix+'/ids'
+    self.range_addr = self.prefix+'/range'
     self.schema_addr = self.prefix+'/schema'
+    self.subscribe_addr = self.prefix+'/subscribe'
+    self.unsubscribe_addr = self.prefix+'/unsubscribe'
+    self.confirm_addr = self.prefix+'/confirm'
 
     self.disconnect_listener = None
     if listen:
-      server, disconnect = create_osc_listener(callback=self.receive)
+      server, disconnect = create_osc_listener(port=port, callback=self.receive)
 
       self.disconnect_listener = disconnect
 
+    self._stop_heartbeats = None
+    # heartbeats are only needed to keep clients connected
+    if listen and heartbeat_interval and connection_timeout:
+      self._stop_heartbeats = threading.Event()
+      threading.Thread(target=_run_heartbeats, args=(weakref.ref(self), self._stop_heartbeats, heartbeat_interval), daemon=True).start()
+
   def __del__(self):
     # this triggers cleanup in destructor of the Connection instances
     self.connection = [] 
     if self.server and self.remote:
       self.server.disconnect(self.remote)
 
-    for c in self.connections:
+    if self._stop_heartbeats:
+      self._stop_heartbeats.set()
+
+    for c in list(self.connections.values()):
       c.disconnect()
     self.connections.clear()
 
@@ -210,6 +394,33 @@ class OscServer:
         logger.warning('[OscServer.receive] received value message ({}) with invalid number ({}) of arguments: {}. Expecting one arguments (value)'.format(addr,len(args), args))
       return      
 
+    # Param value with an interned param id; <id> <value> (see IdTable)
+    if addr == self.value_id_addr:
+      if len(args) == 2:
+        self.remote.incoming.valueIdEvent(args[0], args[1])
+      else:
+        logger.warning('[OscServer.receive] received value message ({}) with invalid number ({}) of arguments: {}. Expecting two arguments (id and value)'.format(addr, len(args), args))
+      return
+
+    # Id table request; <host:port>
+    if addr == self.ids_addr:
+      connection = self.get_connection(args[0]) if len(args) == 1 else None
+      if connection:
+        self.touch(args[0])
+        connection.enable_ids()
+      else:
+        logger.warning('[OscServer.receive] got id table request for unknown connection: {}'.format(args))
+      return
+
+    # Partial array value; <path> <start-index> <blob> or <path> <start-index> <value> [<value> ...]
+    if addr == self.range_addr:
+      if len(args) >= 3:
+        values = args[2] if len(args) == 3 and isinstance(args[2], (bytes, str)) else list(args[2:])
+        self.remote.incoming.valueRangeEvent(args[0], args[1], values)
+      else:
+        logger.warning('[OscServer.receive] received range message ({}) with invalid number ({}) of arguments: {}. Expecting path, start index and values'.format(addr, len(args), args))
+      return
+
     # Connect request?
     if addr == self.connect_addr:
       if len(args) == 1:
@@ -218,9 +429,34 @@ class OscServer:
         logger.warning('[OscServer.receive] got connect message without host/port info')
       return
 
+    # Disconnect request; <host:port>
+    if addr == self.disconnect_addr:
+      if len(args) == 1:
+        self.onDisconnect(args[0])
+      else:
+        logger.warning('[OscServer.receive] got disconnect message without host/port info')
+      return
+
     # Schema request?
     if addr == self.schema_addr and len(args) == 1:
       self.onSchemaRequest(args[0])
+      return
+
+    # Confirmation (ack) or retransmit request?
+    if addr == self.confirm_addr:
+      if len(args) >= 1:
+        self.onConfirm(args[0], args[1:])
+      else:
+        # (the ack of value and schema messages) doesn't identify the client
+        logger.debug('[OscServer.receive] got confirm message without host/port info')
+      return
+
+    # (Un-)subscribe request?
+    if addr in (self.subscribe_addr, self.unsubscribe_addr):
+      if len(args) == 2:
+        self.onSubscription(args[0], args[1], addr == self.subscribe_addr)
+      else:
+        logger.warning('[OscServer.receive] received subscription message ({}) with invalid number ({}) of arguments: {}. Expecting two arguments (host:port and pattern)'.format(addr, len(args), args))
 
   def send(self, host, port, addr, args=()):
     logger.debug('[OscServer.send host={} port={}] {} {}'.format(host,port,addr,args))
@@ -229,19 +465,132 @@ class OscServer:
       self.capture_sends(host, port, addr, args)
       return
 
-    client = OSCClient(host, port)
+    client = OSCClient(host, port, encoding='utf8')
     client.send_message(bytes(addr, 'utf-8'), args)
 
   def onConnect(self, response_info):
-    connection = Connection(self, response_info)
-    if connection.isActive:
-      self.connections.append(connection)
+    with self.lock:
+      connection = self.connections.get(response_info)
+      if connection is not None:
+        # repeated connect (ie. a restarted client); confirm again
+        connection.last_seen = time.monotonic()
+        connection.onConnectConfimToRemote(schema_list(self.server.params))
+        return
+
+      connection = Connection(self, response_info)
+      if connection.isActive:
+        self.connections[response_info] = connection
+
+  def onDisconnect(self, response_info):
+    connection = self.get_connection(response_info)
+    if connection is None:
+      logger.warning('[OscServer.onDisconnect] unknown connection: {}'.format(response_info))
+      return
+    connection.disconnect()
+
+  def forget(self, connection):
+    '''
+    Removes the given (disconnected) connection
+    '''
+    with self.lock:
+      if self.connections.get(connection.id) is connection:
+        del self.connections[connection.id]
+
+  def touch(self, response_info, now=None):
+    '''
+    Marks the connection of the given client as alive
+    '''
+    connection = self.connections.get(response_info)
+    if connection is not None:
+      connection.last_seen = time.monotonic() if now is None else now
+
+  def check_liveness(self, now=None):
+    '''
+    Disconnects and returns the connections that didn't
+    send anything for longer than connection_timeout seconds
+    '''
+    if not self.connection_timeout:
+      return []
+
+    now = time.monotonic() if now is None else now
+    with self.lock:
+      dead = [c for c in self.connections.values() if now - c.last_seen > self.connection_timeout]
+
+    for connection in dead:
+      logger.info('[OscServer.check_liveness] evicting unresponsive client: {}'.format(connection.id))
+      connection.disconnect()
+    return dead
+
+  def heartbeat(self, now=None):
+    '''
+    Evicts unresponsive connections and sends a heartbeat to the others;
+    called every heartbeat_interval seconds when listening
+    '''
+    self.check_liveness(now)
+    with self.lock:
+      connections = list(self.connections.values())
+
+    for connection in connections:
+      connection.client.sendHeartbeat()
 
   def onValueReceived(self, path, value):
     logger.debug('[OscServer.onValueReceived path={} value={}]'.format(path, value))
     # pass it on to the server through our remote instance
     self.remote.incoming.valueEvent(path, value)
   
+  def onSubscription(self, response_info, pattern, subscribe=True):
+    connection = self.get_connection(response_info)
+    if not connection:
+      logger.warning('[OscServer.onSubscription] unknown connection: {}'.format(response_info))
+      return
+
+    self.touch(response_info)
+    if subscribe:
+      connection.remote.incoming.subscribeEvent(pattern)
+    else:
+      connection.remote.incoming.unsubscribeEvent(pattern)
+
+  def store_transfer(self, client_id, addr, fragments):
+    '''
+    Stores a fragmented transfer for retransmission and returns its id
+    '''
+    transfer_id = self.next_transfer_id
+    self.next_transfer_id += 1
+    self.transfers[transfer_id] = (client_id, addr, fragments)
+
+    while len(self.transfers) > MAX_STORED_TRANSFERS:
+      self.transfers.popitem(last=False)
+
+    return transfer_id
+
+  def onConfirm(self, response_info, args):
+    '''
+    /params/confirm <host:port> acknowledges a heartbeat
+    /params/confirm <host:port> <transfer-id> acknowledges a complete transfer
+    /params/confirm <host:port> <transfer-id> <index> [<index> ...] requests retransmission
+    '''
+    self.touch(response_info)
+    if len(args) == 0:
+      return
+
+    transfer_id = args[0]
+    transfer = self.transfers.get(transfer_id)
+    if not transfer or transfer[0] != response_info:
+      logger.warning('[OscServer.onConfirm] unknown transfer {} for {}'.format(transfer_id, response_info))
+      return
+
+    client_id, addr, fragments = transfer
+    indices = [idx for idx in args[1:] if isinstance(idx, int) and 0 <= idx < len(fragments)]
+
+    if not indices:
+      del self.transfers[transfer_id]
+      return
+
+    Client(self, client_id).sendFragments(addr, transfer_id, fragments, indices)
+
+  def get_connection(self, response_info):
+    return self.connections.get(response_info)
+
   def onSchemaRequest(self, responseInfo):
     Client(self, responseInfo).sendSchema(schema_list(self.server.params))
 
@@ -1,5 +1,5 @@
 from evento import Event
-import logging, distutils, base64
+import logging, distutils, base64, hashlib, json
 
 try:
   import cv2
@@ -11,6 +11,10 @@ try:
 except:
   np = None # numpy not supported
 
+from .frames import FramePool
+from .dispatcher import Dispatcher
+from .history import History, DEFAULT_HISTORY_SIZE
+
 logger = logging.getLogger(__name__)
 
 class Param:
@@ -24,19 +28,42 @@ class Param:
     def isInvalid(cls, value):
       return isinstance(value, cls)
 
+  # priority class of outgoing value messages (see lanes.PRIORITY_*);
+  # None for the default of the param's type (see lanes.TYPE_PRIORITIES)
+  priority = None
+  # recorded values (see enable_history)
+  history = None
+
   def __init__(self, type_, default=None, opts={}, getter=None, setter=None):
     self.type = type_
     self.value = None
     self.default = default
     self.opts = opts if opts else {}
-    self.getter = self._makeSafe(getter) if getter else None
-    self.setter = self._makeSafe(setter) if setter else None
-
-    self.changeEvent = Event()
+    self.getter = getter
+    self.setter = setter
+    # number of value changes
+    self.version = 0
+
+    # created on first use (see changeEvent); most params
+    # are only observed through their group (see Dispatcher)
+    self._changeEvent = None
+    self.dispatcher = None
+    self.handle = None
+
+  @property
+  def changeEvent(self):
+    if self._changeEvent is None:
+      self._changeEvent = Event()
+    return self._changeEvent
+
+  @changeEvent.setter
+  def changeEvent(self, event):
+    # (assigned by ie. `param.changeEvent += func`)
+    self._changeEvent = event
 
   def set(self, value):
     if self.setter:
-      settervalue = self.setter(value)
+      settervalue = self._safe(self.setter, value)
       if Param.InvalidValue.isInvalid(settervalue):
         logger.warning('[Param.set value={}] InvalidValue'.format(value))
         return
@@ -49,12 +76,52 @@ class Param:
       return
     
     self.value = value
-    logger.debug('[Param.set] changevent')
-    self.changeEvent()
+    self.version += 1
+    if self.history is not None:
+      self.history.add(value)
+    if self.dispatcher is not None:
+      self.dispatcher.dispatch(self.handle, self)
+    if self._changeEvent is not None:
+      self._changeEvent()
 
   def equals(self, v1, v2):
-    return v1 is v2
-    # return v1 == v2
+    if v1 is v2:
+      return True
+
+    if np is not None and (isinstance(v1, np.ndarray) or isinstance(v2, np.ndarray)):
+      return isinstance(v1, np.ndarray) and isinstance(v2, np.ndarray) \
+        and v1.shape == v2.shape and v1.dtype == v2.dtype and np.array_equal(v1, v2)
+
+    # don't consider ie. 1 and True, or 1 and 1.0 equal
+    if type(v1) is not type(v2):
+      return False
+
+    try:
+      return bool(v1 == v2)
+    except (TypeError, ValueError):
+      return False
+
+  def enable_history(self, size=DEFAULT_HISTORY_SIZE):
+    '''
+    Starts recording the values of this (int, float or bool) param
+    in a ring buffer of the given size and returns its History
+    '''
+    if np is None:
+      logger.warning('[Param.enable_history] requires numpy')
+      return None
+
+    if self.type not in ('i', 'f', 'b'):
+      logger.warning('[Param.enable_history] not supported for params of type: {}'.format(self.type))
+      return None
+
+    if self.history is None:
+      self.history = History(size)
+      # lets clients know they can query the history
+      self.opts = dict(self.opts, history=size)
+      if self.value is not None:
+        self.history.add(self.value)
+
+    return self.history
 
   def onchange(self, func):
     def funcWithValue():
@@ -66,7 +133,7 @@ class Param:
 
   def val(self):
     v = self.value if self.is_initialized() else self.default
-    return self.getter(v) if self.getter else v
+    return self._safe(self.getter, v) if self.getter else v
 
   def to_dict(self):
     d = {'type': self.type}
@@ -79,15 +146,11 @@ class Param:
 
     return d
 
-  def _makeSafe(self, func):
-    def safeFunc(val):
-      try:
-        val = func(val)
-      except ValueError:
-        val = self.value
-
-      return val
-    return safeFunc
+  def _safe(self, func, val):
+    try:
+      return func(val)
+    except ValueError:
+      return self.value
 
 def convertParamNumberVal(v, converter, fallback, opts={}):
   try:
@@ -103,6 +166,17 @@ def convertParamNumberVal(v, converter, fallback, opts={}):
 
   return v
 
+def convertParamBoolVal(v):
+  if type(v) == type(True) or type(v) == type(False):
+    return v
+  if str(v).lower() in ['true', '1', 'yes', 'y']:
+    return True
+  if str(v).lower() in ['false', '0', 'no', 'n']:
+    return False
+  return Param.InvalidValue(v)
+
+  # if distutils.util.strtobool(v) == 1 if 'util' in dir(distutils) else str(v) in ['True', 'true', '1'])
+
 class IntParam(Param):
   def __init__(self, min=None, max=None):
     opts = {}
@@ -114,15 +188,25 @@ class IntParam(Param):
     return convertParamNumberVal(v, int, self.value, self.opts)
 
 class FloatParam(Param):
-  def __init__(self, min=None, max=None):
+  def __init__(self, min=None, max=None, epsilon=None):
+    '''
+    When an epsilon is specified, new values that differ less than
+    epsilon from the current value are ignored (deadband)
+    '''
     opts = {}
     if min != None: opts['min'] = convertParamNumberVal(min, float, None)
     if max != None: opts['max'] = convertParamNumberVal(max, float, None)
+    self.epsilon = epsilon
 
     Param.__init__(self, 'f',
       opts=opts,
       setter=self.convert)
 
+  def equals(self, v1, v2):
+    if self.epsilon and v1 is not None and v2 is not None:
+      return abs(v1 - v2) <= self.epsilon
+    return Param.equals(self, v1, v2)
+
   def convert(self, v):
     # print(f'converting: {v} with {self.opts}')
     vv = convertParamNumberVal(v, float, self.value, self.opts)
@@ -143,10 +227,192 @@ class VoidParam(Param):
   def ontrigger(self, func):
     self.changeEvent += func
 
+# wire (and storage) dtypes of the ArrayParam element types
+ARRAY_DTYPES = {'f': '<f4', 'i': '<i4'}
+
+class ArrayParam(Param):
+  '''
+  Fixed-length numeric array param (type 'a'), backed by a NumPy array.
+  Used for vectors, colors and channel arrays (ie. a DMX universe).
+
+  Min and max can be a single number (applied to all elements)
+  or a sequence with a limit for every element.
+
+  Values are stored as read-only arrays, so a new array is
+  needed (see set_range) to change a value.
+  '''
+  def __init__(self, length, dtype='f', min=None, max=None, default=None, kind='array'):
+    if np is None:
+      raise RuntimeError('ArrayParam requires numpy')
+
+    if dtype not in ARRAY_DTYPES:
+      raise ValueError('Unsupported array dtype: {}'.format(dtype))
+
+    self.length = int(length)
+    self.dtype = np.dtype(ARRAY_DTYPES[dtype])
+
+    opts = {'kind': kind, 'dtype': dtype, 'length': self.length}
+    if min is not None: opts['min'] = self._limit_opt(min)
+    if max is not None: opts['max'] = self._limit_opt(max)
+    self.mins = None if min is None else np.array(min, dtype=np.float64)
+    self.maxs = None if max is None else np.array(max, dtype=np.float64)
+
+    Param.__init__(self, 'a', opts=opts, setter=self.convert)
+    self.default = self.convert(np.zeros(self.length) if default is None else default)
+    if Param.InvalidValue.isInvalid(self.default):
+      raise ValueError('Invalid default for array of length {}: {}'.format(self.length, default))
+
+  @staticmethod
+  def _limit_opt(limit):
+    return limit.tolist() if isinstance(limit, np.ndarray) else (list(limit) if isinstance(limit, (list, tuple)) else limit)
+
+  def convert(self, v):
+    '''
+    Accepts arrays, sequences, JSON strings (ie. '[0.5, 1.0]')
+    and raw (little-endian, see ARRAY_DTYPES) typed-array bytes
+    '''
+    if isinstance(v, str):
+      v = json.loads(v)
+    elif isinstance(v, (bytes, bytearray, memoryview)):
+      v = np.frombuffer(v, dtype=self.dtype)
+
+    arr = np.array(v, dtype=np.float64).reshape(-1)
+    if arr.shape[0] != self.length:
+      return Param.InvalidValue(v)
+
+    if self.mins is not None or self.maxs is not None:
+      arr = np.clip(arr,
+        -np.inf if self.mins is None else self.mins,
+        np.inf if self.maxs is None else self.maxs)
+
+    if self.dtype.kind == 'i':
+      arr = np.rint(arr)
+
+    arr = arr.astype(self.dtype)
+    arr.flags.writeable = False
+    return arr
+
+  def set_range(self, start, values):
+    '''
+    Updates the elements from the given start index with the given values
+    '''
+    values = self.convert_range(values)
+    start = int(start)
+    if start < 0 or start + len(values) > self.length:
+      logger.warning('[ArrayParam.set_range] range {}-{} out of bounds (length {})'.format(start, start+len(values), self.length))
+      return
+
+    arr = np.array(self.val(), dtype=np.float64)
+    arr[start:start+len(values)] = values
+    self.set(arr)
+
+  def convert_range(self, values):
+    if isinstance(values, str):
+      values = json.loads(values)
+    elif isinstance(values, (bytes, bytearray, memoryview)):
+      values = np.frombuffer(values, dtype=self.dtype)
+    return np.array(values, dtype=np.float64).reshape(-1)
+
+  def tobytes(self):
+    '''
+    Returns the raw (little-endian) typed-array bytes of the current value
+    '''
+    return self.val().tobytes()
+
+  def to_dict(self):
+    d = Param.to_dict(self)
+    if 'value' in d:
+      d['value'] = d['value'].tolist()
+    return d
+
 class ImageParam(Param):
-  def __init__(self, opts={}):
+  def __init__(self, opts={}, dedup=True):
+    '''
+    With dedup enabled, setting an image with the same content as
+    the current image (by content hash) does not trigger a change
+    '''
     Param.__init__(self, 'g', opts=opts)
-  
+    self.dedup = dedup
+    self.hash = None
+    self.pool = None
+
+  def set(self, value):
+    if self.dedup:
+      digest = self.content_hash(value)
+      if digest is not None and digest == self.hash:
+        return
+      self.hash = digest
+
+    prev = self.value
+    Param.set(self, value)
+
+    # the current value holds a reference to its pool buffer
+    if self.pool is not None and self.value is not prev:
+      self.pool.retain(self.value)
+      self.pool.release(prev)
+
+  def create_pool(self, shape, dtype='uint8', size=3, max_size=None):
+    '''
+    Creates a FramePool for producers that fill frames in place:
+
+    frame = param.acquire()
+    cap.read(frame)
+    param.publish(frame)
+
+    Consumers that keep a frame after its change notification
+    (ie. to serialize it later) should use retain and release.
+    '''
+    self.pool = FramePool(shape, dtype=dtype, size=size, max_size=max_size)
+    return self.pool
+
+  def acquire(self):
+    '''
+    Returns a reusable frame buffer to fill in place,
+    or None when all buffers are still in use
+    '''
+    return self.pool.acquire() if self.pool is not None else None
+
+  def publish(self, frame):
+    '''
+    Sets the given acquired frame buffer as new value and
+    gives up the reference obtained by acquire
+    '''
+    self.set(frame)
+    if self.pool is not None:
+      self.pool.release(frame)
+
+  def retain(self):
+    '''
+    Returns the current frame and prevents its buffer from
+    being reused until it is passed to release
+    '''
+    frame = self.value
+    if self.pool is not None:
+      self.pool.retain(frame)
+    return frame
+
+  def release(self, frame):
+    if self.pool is not None:
+      self.pool.release(frame)
+
+  def equals(self, v1, v2):
+    # with dedup, set() already compared content hashes; a refilled
+    # buffer is a new frame, even when it is the same array object
+    return False if self.dedup else Param.equals(self, v1, v2)
+
+  @staticmethod
+  def content_hash(value):
+    if np is not None and isinstance(value, np.ndarray):
+      h = hashlib.blake2b(digest_size=16)
+      h.update('{}{}'.format(value.shape, value.dtype).encode('ascii'))
+      h.update(np.ascontiguousarray(value))
+      return h.digest()
+
+    if isinstance(value, str):
+      return hashlib.blake2b(value.encode('utf-8'), digest_size=16).digest()
+
+    return None
+
   # def convert(self, v):
   #   if cv2 is not None and np is not None:
   #     if type(v) == type(np.array([])):
@@ -169,7 +435,13 @@ class ImageParam(Param):
   #   return None
 
   def get_serialized(self):
-    return self.serialize_value(self.val())
+    # retained while encoding, so a publish (ie. on another
+    # thread) can't hand out the frame's buffer for reuse
+    frame = self.retain()
+    try:
+      return self.serialize_value(frame)
+    finally:
+      self.release(frame)
 
   def set_serialized(self, v) -> None:
     pass # TODO
@@ -193,99 +465,104 @@ class ImageParam(Param):
     # no supported image processor 
     return value
 
-def create_child(params, id, item):
+class Params(list):
   '''
-  This function performs all logic for adding a new item (param or sub-params-group)
-  to a Params groups and returns a single function the performs all cleanups for removing the item
+  Group of (uniquely identified) params and nested groups, stored
+  as a list of [id, item] pairs. Value changes of all params in a
+  group's subtree are announced through its valueChangeEvent
+  (path, value, param), with paths relative to the group.
   '''
-  cleanups = []
-
-  # add
-  params.items_by_id[id] = item
-  list.append(params, [id, item])
-  # create remover
-  def remover():
-    del params.items_by_id[id]
-    for pair in params:
-      key, val = pair
-      if val == item:
-        list.remove(params, pair)
-
-    params.schemaChangeEvent()
-    params.changeEvent()
-  cleanups.append(remover)
-
-  # a single param added?
-  if isinstance(item, Param):
-    def onchange():
-      params.changeEvent()
-      params.valueChangeEvent('/'+id, item.val(), item)
-    item.changeEvent += onchange
-    
-    # register cleanup logic
-    def cleanup():
-      item.changeEvent -= onchange
-    cleanups.append(cleanup)
 
-  # another sub-params-group added?
-  if isinstance(item, Params):
-    item.changeEvent += params.changeEvent.fire
-    item.schemaChangeEvent += params.schemaChangeEvent.fire
-    def forwardValChange(path, val, param):
-      params.valueChangeEvent('/'+id+path, val, param)
-    item.valueChangeEvent += forwardValChange
-
-    # record cleanup logic
-    def cleanup():
-      item.valueChangeEvent -= forwardValChange
-    cleanups.append(cleanup)
-
-  params.schemaChangeEvent()
-  params.changeEvent()
-
-  def cleanup():
-    for c in cleanups:
-      c()
-
-  return cleanup
-
-class Params(list):
   def __init__(self):
-    self.changeEvent = Event()
     self.schemaChangeEvent = Event()
-    self.valueChangeEvent = Event()
+    # number of (coalesced) changes
+    self.version = 0
+    # change events are created on first use
+    self._changeEvent = None
+    self._valueChangeEvent = None
 
     self.items_by_id = {}
-    self.removers = {}
+    # every group starts as the root of its own tree
+    Dispatcher().register(self)
+
+  @property
+  def changeEvent(self):
+    '''
+    Fired when anything in the group's subtree changed;
+    once per batch (see Dispatcher.batch)
+    '''
+    if self._changeEvent is None:
+      self._changeEvent = Event()
+    return self._changeEvent
+
+  @changeEvent.setter
+  def changeEvent(self, event):
+    self._changeEvent = event
+
+  @property
+  def valueChangeEvent(self):
+    '''
+    Fired with (path, value, param) for every value change in the
+    group's subtree, with the path relative to this group
+    '''
+    if self._valueChangeEvent is None:
+      self._valueChangeEvent = Event()
+    return self._valueChangeEvent
+
+  @valueChangeEvent.setter
+  def valueChangeEvent(self, event):
+    self._valueChangeEvent = event
+
+  def _changed(self):
+    self.version += 1
+    if self._changeEvent is not None:
+      self._changeEvent()
+
+  def append(self, id, item, notify=True):
+    '''
+    Adds a param or a (sub-)group. When notify is False,
+    no (schema) change events are fired for adding the item
+    '''
+    if id in self.items_by_id:
+      logging.warning('Params already has an item with ID: {}'.format(id))
+      return
 
-  def __del__(self):
-    for id in self.removers:
-      remover =self.removers[id]
-      remover()
+    if item.dispatcher is not None and item.dispatcher.owner(item.handle) is not None:
+      logging.warning('[Params.append] item `{}` already belongs to another group'.format(id))
+      return
 
-    self.removers = {}
+    self.items_by_id[id] = item
+    list.append(self, [id, item])
+    self.dispatcher.attach(item, self.handle, id)
 
-  def append(self, id, item):
-    if id in self.removers:
-      logging.warning('Params already has an item with ID: {}'.format(id))
-      return
+    if isinstance(item, Params):
+      item.schemaChangeEvent += self.schemaChangeEvent.fire
+
+    if notify:
+      self.schemaChangeEvent()
+      self.dispatcher.notify_change(self.handle)
 
-    # create_child returns a single function which removes
-    # the child relationship again, which we save for calls to self.remove
-    remover = create_child(self, id, item)
-    self.removers[id] = remover
     return item
 
-  def remove(self, id):
-    if not id in self.removers:
+  def remove(self, id, notify=True):
+    item = self.items_by_id.pop(id, None)
+    if item is None:
       logging.warning('[Params.remove] could not find item with id `{}` to remove'.format(id))
       return
 
-    # find remover (are created in self.append)
-    remover = self.removers[id]
-    del self.removers[id]
-    # run remover
-    remover()
+    for pair in self:
+      if pair[1] is item:
+        list.remove(self, pair)
+        break
+
+    self.dispatcher.detach(item)
+
+    if isinstance(item, Params):
+      item.schemaChangeEvent -= self.schemaChangeEvent.fire
+
+    if notify:
+      self.schemaChangeEvent()
+      self.dispatcher.notify_change(self.handle)
 
   def append_param(self, id, type_, setter=None, opts={}):
     p = Param(type_, setter=setter, opts=opts)
@@ -299,27 +576,40 @@ class Params(list):
     return self.append(id, IntParam(min, max))
 
   def bool(self, id):
-    def converter(v):
-      if type(v) == type(True) or type(v) == type(False):
-        return v
-      if str(v).lower() in ['true', '1', 'yes', 'y']:
-        return True
-      if str(v).lower() in ['false', '0', 'no', 'n']:
-        return False
-      return Param.InvalidValue(v)
-
-      # if distutils.util.strtobool(v) == 1 if 'util' in dir(distutils) else str(v) in ['True', 'true', '1'])
+    return self.append_param(id, 'b', setter=convertParamBoolVal)
 
-    return self.append_param(id, 'b', setter=converter)
-
-  def float(self, id, min=None, max=None):
-    return self.append(id, FloatParam(min, max))
+  def float(self, id, min=None, max=None, epsilon=None):
+    return self.append(id, FloatParam(min, max, epsilon=epsilon))
 
   def void(self, id):
     return self.append(id, VoidParam())
 
-  def image(self, id):
-    return self.append(id, ImageParam())
+  def array(self, id, length, dtype='f', min=None, max=None, default=None, kind='array'):
+    return self.append(id, ArrayParam(length, dtype=dtype, min=min, max=max, default=default, kind=kind))
+
+  def floats(self, id, length, min=None, max=None):
+    return self.array(id, length, 'f', min=min, max=max)
+
+  def ints(self, id, length, min=None, max=None):
+    return self.array(id, length, 'i', min=min, max=max)
+
+  def vec2(self, id, min=None, max=None):
+    return self.array(id, 2, min=min, max=max, kind='vec2')
+
+  def vec3(self, id, min=None, max=None):
+    return self.array(id, 3, min=min, max=max, kind='vec3')
+
+  def vec4(self, id, min=None, max=None):
+    return self.array(id, 4, min=min, max=max, kind='vec4')
+
+  def color(self, id):
+    '''
+    RGBA color with float components in the range [0, 1]
+    '''
+    return self.array(id, 4, min=0.0, max=1.0, default=[0.0, 0.0, 0.0, 1.0], kind='color')
+
+  def image(self, id, dedup=True):
+    return self.append(id, ImageParam(dedup=dedup))
 
   def group(self, id, params):
     self.append(id, params)
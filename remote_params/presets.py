@@ -0,0 +1,342 @@
+import logging, os, mmap, time, struct, threading
+
+from .params import Param, Params
+from .binary import U32, F64, pack_path, unpack_path, pack_value, unpack_value
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_MAGIC = b'RPSN'
+JOURNAL_MAGIC = b'RPJL'
+FORMAT_VERSION = 1
+SNAPSHOT_HEADER = struct.Struct('<4sHI') # magic, format version, entry count
+JOURNAL_HEADER = struct.Struct('<4sH') # magic, format version
+
+# voids are triggers and images are too big; neither gets persisted
+PERSISTED_TYPES = ('i', 'f', 'b', 's', 'a')
+
+def iter_persisted(params, scope='/'):
+  '''
+  Generator yielding (path, param) tuples for all persistable
+  params in the given Params tree
+  '''
+  for id, item in params:
+    if isinstance(item, Param) and item.type in PERSISTED_TYPES:
+      yield scope+id, item
+    elif isinstance(item, Params):
+      yield from iter_persisted(item, scope+id+'/')
+
+def write_snapshot(params, file_path):
+  '''
+  Writes the values of all (initialized) persistable params to a binary
+  snapshot file. The file is replaced atomically.
+
+  Returns the number of written values
+  '''
+  entries = []
+  for path, param in iter_persisted(params):
+    value = param.val()
+    if value is not None:
+      entries.append(pack_path(path) + pack_value(param.type, value))
+
+  tmp_path = file_path + '.tmp'
+  with open(tmp_path, 'wb') as f:
+    f.write(SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, FORMAT_VERSION, len(entries)))
+    f.write(b''.join(entries))
+    f.flush()
+    os.fsync(f.fileno())
+
+  os.replace(tmp_path, file_path)
+  return len(entries)
+
+class Snapshot:
+  '''
+  Read-only, memory-mapped view of a snapshot file written by write_snapshot.
+  Only the path index is built on load, values are decoded on access.
+  '''
+
+  def __init__(self, file_path):
+    self.file_path = file_path
+    self.file = open(file_path, 'rb')
+    self.buf = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    magic, version, count = SNAPSHOT_HEADER.unpack_from(self.buf, 0)
+    if magic != SNAPSHOT_MAGIC or version != FORMAT_VERSION:
+      self.close()
+      raise ValueError('Not a (supported) snapshot file: {}'.format(file_path))
+
+    self.index = {}
+    offset = SNAPSHOT_HEADER.size
+    for _ in range(count):
+      path, offset = unpack_path(self.buf, offset)
+      self.index[path] = offset
+      _, _, offset = unpack_value(self.buf, offset)
+
+  def __del__(self):
+    self.close()
+
+  def __len__(self):
+    return len(self.index)
+
+  def __contains__(self, path):
+    return path in self.index
+
+  def get(self, path):
+    offset = self.index.get(path)
+    if offset is None:
+      return None
+    return unpack_value(self.buf, offset)[1]
+
+  def items(self):
+    for path, offset in self.index.items():
+      yield path, unpack_value(self.buf, offset)[1]
+
+  def to_dict(self):
+    '''
+    Returns a flat dict of path -> value
+    '''
+    return dict(self.items())
+
+  def close(self):
+    buf = getattr(self, 'buf', None)
+    if buf:
+      buf.close()
+      self.buf = None
+
+    f = getattr(self, 'file', None)
+    if f:
+      f.close()
+      self.file = None
+
+class Journal:
+  '''
+  Append-only log of value changes. Records are buffered in memory and
+  written and fsync'ed in batches; whenever fsync_interval seconds have passed
+  since the previous sync, or the buffer exceeds max_buffer_size bytes. Buffered
+  records are synced by a timer when no more records are appended, so they
+  reach the disk within fsync_interval seconds.
+  '''
+
+  def __init__(self, file_path, fsync_interval=1.0, max_buffer_size=64*1024):
+    self.file_path = file_path
+    self.fsync_interval = fsync_interval
+    self.max_buffer_size = max_buffer_size
+    self.buffer = bytearray()
+    self.last_sync = time.time()
+    self.lock = threading.RLock()
+    # pending sync of the buffered records (see append)
+    self._timer = None
+    self._open('ab')
+
+  def __del__(self):
+    self.close()
+
+  def _open(self, mode):
+    self.file = open(self.file_path, mode)
+    if self.file.tell() == 0:
+      self.file.write(JOURNAL_HEADER.pack(JOURNAL_MAGIC, FORMAT_VERSION))
+
+  def append(self, path, type_, value, timestamp=None):
+    if type_ not in PERSISTED_TYPES or value is None:
+      return
+
+    record = F64.pack(time.time() if timestamp is None else timestamp) + pack_path(path) + pack_value(type_, value)
+    with self.lock:
+      # length-prefixed, so a partially written last record can be detected
+      self.buffer += U32.pack(len(record))
+      self.buffer += record
+
+      if len(self.buffer) >= self.max_buffer_size or time.time() - self.last_sync >= self.fsync_interval:
+        self.sync()
+      elif self._timer is None and self.file:
+        self._timer = threading.Timer(max(self.last_sync + self.fsync_interval - time.time(), 0.0), self._onTimer)
+        self._timer.daemon = True
+        self._timer.start()
+
+  def _onTimer(self):
+    with self.lock:
+      self._timer = None
+      if self.buffer:
+        self.sync()
+
+  def sync(self):
+    '''
+    Writes all buffered records to disk and fsyncs the file
+    '''
+    with self.lock:
+      self._cancelTimer()
+      if not self.file:
+        return
+
+      if self.buffer:
+        self.file.write(self.buffer)
+        self.buffer = bytearray()
+
+      self.file.flush()
+      os.fsync(self.file.fileno())
+      self.last_sync = time.time()
+
+  def _cancelTimer(self):
+    if self._timer is not None:
+      self._timer.cancel()
+      self._timer = None
+
+  def truncate(self):
+    '''
+    Discards all records (ie. after a checkpoint snapshot was written)
+    '''
+    with self.lock:
+      self.buffer = bytearray()
+      self.file.close()
+      self._open('wb')
+      self.sync()
+
+  def attach(self, params):
+    '''
+    Journals all value changes in the given Params tree.
+    Returns a function which stops journaling again.
+    '''
+    def onValueChange(path, value, param):
+      self.append(path, param.type, value)
+
+    return params.valueChangeEvent.add(onValueChange)
+
+  def close(self):
+    f = getattr(self, 'file', None)
+    if not f:
+      return
+
+    with self.lock:
+      self.sync()
+      f.close()
+      self.file = None
+
+def read_journal(file_path):
+  '''
+  Generator yielding (timestamp, path, value) tuples for all complete
+  records in the given journal file. An incomplete trailing record
+  (ie. after a crash) is ignored.
+  '''
+  with open(file_path, 'rb') as f:
+    data = f.read()
+
+  if len(data) < JOURNAL_HEADER.size:
+    return
+
+  magic, version = JOURNAL_HEADER.unpack_from(data, 0)
+  if magic != JOURNAL_MAGIC or version != FORMAT_VERSION:
+    raise ValueError('Not a (supported) journal file: {}'.format(file_path))
+
+  offset = JOURNAL_HEADER.size
+  while offset + U32.size <= len(data):
+    size = U32.unpack_from(data, offset)[0]
+    offset += U32.size
+    if offset + size > len(data):
+      logger.warning('[read_journal] ignoring incomplete record at end of {}'.format(file_path))
+      return
+
+    timestamp = F64.unpack_from(data, offset)[0]
+    path, value_offset = unpack_path(data, offset+F64.size)
+    _, value, _ = unpack_value(data, value_offset)
+    offset += size
+    yield timestamp, path, value
+
+class PresetStore:
+  '''
+  Stores named presets as binary snapshot files in a directory
+  and optionally journals all value changes for crash recovery.
+
+  ie.
+
+  store = PresetStore('presets/')
+  store.save('intro', params)
+  store.recall('intro', server) # single batched update
+
+  store.recover(server)
+  store.start_journal(params)
+  ...
+  store.checkpoint(params)
+  '''
+
+  EXTENSION = '.snapshot'
+  CHECKPOINT = '_checkpoint'
+  JOURNAL = '_journal.bin'
+
+  def __init__(self, directory, fsync_interval=1.0):
+    self.directory = directory
+    self.fsync_interval = fsync_interval
+    self.journal = None
+    self._stop_journal = None
+    os.makedirs(directory, exist_ok=True)
+
+  def __del__(self):
+    self.stop_journal()
+
+  def path_for(self, name):
+    return os.path.join(self.directory, name+self.EXTENSION)
+
+  def names(self):
+    return sorted(
+      f[:-len(self.EXTENSION)] for f in os.listdir(self.directory)
+      if f.endswith(self.EXTENSION) and f != self.CHECKPOINT+self.EXTENSION)
+
+  def save(self, name, params):
+    return write_snapshot(params, self.path_for(name))
+
+  def load(self, name):
+    return Snapshot(self.path_for(name))
+
+  def remove(self, name):
+    os.remove(self.path_for(name))
+
+  def recall(self, name, server):
+    '''
+    Applies the named preset to the given Server's params
+    as a single batched update
+    '''
+    snapshot = self.load(name)
+    try:
+      server.apply_values(snapshot.to_dict())
+    finally:
+      snapshot.close()
+
+  def start_journal(self, params):
+    self.stop_journal()
+    self.journal = Journal(os.path.join(self.directory, self.JOURNAL), fsync_interval=self.fsync_interval)
+    self._stop_journal = self.journal.attach(params)
+
+  def stop_journal(self):
+    if self._stop_journal:
+      self._stop_journal()
+      self._stop_journal = None
+
+    if self.journal:
+      self.journal.close()
+      self.journal = None
+
+  def checkpoint(self, params):
+    '''
+    Writes a checkpoint snapshot and clears the journal
+    '''
+    self.save(self.CHECKPOINT, params)
+    if self.journal:
+      self.journal.truncate()
+
+  def recover(self, server):
+    '''
+    Restores the last checkpoint followed by all journaled changes,
+    as a single batched update. Returns the number of restored values.
+    '''
+    values = {}
+
+    if os.path.isfile(self.path_for(self.CHECKPOINT)):
+      snapshot = self.load(self.CHECKPOINT)
+      values.update(snapshot.to_dict())
+      snapshot.close()
+
+    journal_path = os.path.join(self.directory, self.JOURNAL)
+    if os.path.isfile(journal_path):
+      for timestamp, path, value in read_journal(journal_path):
+        values[path] = value
+
+    server.apply_values(values)
+    return len(values)
@@ -0,0 +1,346 @@
+'''
+Recording and replaying of Remote traffic.
+
+A recording is an append-only binary log, starting with a header (magic,
+format version and start time) followed by u32 length-prefixed records:
+
+  <f64 seconds since start> <u8 kind> <u32 remote id> <payload>
+
+with the following kinds and payloads:
+
+  'p' : path definition; <u32 path id> <u16 length> <path>
+  'c' : remote connected; <u8 serialize flag>
+  'd' : remote disconnected
+  'v' : incoming value; <u32 path id> <value> (see binary.pack_value),
+        also for values received with an interned param id (see IdTable)
+  'r' : incoming partial array value; <u32 path id> <u32 start index> <array value>
+  'q' : incoming schema request
+  'u' : incoming subscribe; <u32 length> <pattern>
+  'x' : incoming unsubscribe; <u32 length> <pattern>
+  'V' : outgoing value; <u32 path id> <value>
+  'S' : outgoing schema; <u32 length> <json>
+
+Every path is defined (with a 'p' record) only once,
+after which records refer to it by its id.
+'''
+import logging, time, struct, json, threading, asyncio
+
+from .server import Remote
+from .binary import U8, U32, pack_str, unpack_str, pack_path, unpack_path, pack_value, unpack_value, value_type
+
+logger = logging.getLogger(__name__)
+
+RECORDING_MAGIC = b'RPRC'
+FORMAT_VERSION = 1
+RECORDING_HEADER = struct.Struct('<4sHd') # magic, format version, start time
+RECORD_HEADER = struct.Struct('<dcI') # time since start, kind, remote id
+
+INCOMING_KINDS = (b'c', b'd', b'v', b'r', b'q', b'u', b'x')
+
+def _pack_any(value):
+  type_ = value_type(value)
+  if type_ is None:
+    # ie. serialized images, or values of unknown types
+    type_, value = 's', str(value)
+  return pack_value(type_, value)
+
+class Recorder:
+  '''
+  Records all (incoming and optionally outgoing) Remote traffic of
+  a Server to a binary log (see module docs). Records are buffered
+  and written in batches.
+
+  ie.
+
+  recorder = Recorder(server, 'show.rec')
+  ...
+  recorder.close()
+  '''
+
+  def __init__(self, server, file_path, outgoing=True, max_buffer_size=64*1024, flush_interval=1.0):
+    """
+    Parameters
+    ----------
+    server : Server
+      server whose remotes' traffic is recorded
+
+    file_path : str
+      recording file (overwritten)
+
+    outgoing : bool
+      also record outgoing (server-to-remote) values and schemas
+
+    max_buffer_size, flush_interval :
+      buffered records are written when the buffer exceeds max_buffer_size
+      bytes or flush_interval seconds have passed since the previous write
+    """
+    self.server = server
+    self.outgoing = outgoing
+    self.max_buffer_size = max_buffer_size
+    self.flush_interval = flush_interval
+    self.start_time = time.time()
+    self.last_flush = self.start_time
+    self.buffer = bytearray()
+    self.lock = threading.RLock()
+    self.path_ids = {}
+    self.remote_ids = {}
+    self.next_remote_id = 1
+    self.remote_cleanups = {}
+
+    self.file = open(file_path, 'wb')
+    self.file.write(RECORDING_HEADER.pack(RECORDING_MAGIC, FORMAT_VERSION, self.start_time))
+
+    self.cleanups = [
+      server.connectEvent.add(self.onConnect),
+      server.disconnectEvent.add(self.onDisconnect)]
+
+    # remotes that are already connected
+    for remote in list(server.connections):
+      self.onConnect(remote)
+
+  def __del__(self):
+    self.close()
+
+  def record(self, kind, remote_id, payload=b''):
+    with self.lock:
+      record = RECORD_HEADER.pack(time.time() - self.start_time, kind, remote_id) + payload
+      self.buffer += U32.pack(len(record))
+      self.buffer += record
+
+      if len(self.buffer) >= self.max_buffer_size or time.time() - self.last_flush >= self.flush_interval:
+        self._flush()
+
+  def path_id(self, path):
+    with self.lock:
+      path_id = self.path_ids.get(path)
+      if path_id is None:
+        path_id = self.path_ids[path] = len(self.path_ids)
+        self.record(b'p', 0, U32.pack(path_id) + pack_path(path))
+      return path_id
+
+  def flush(self):
+    with self.lock:
+      self._flush()
+
+  def _flush(self):
+    if self.file and self.buffer:
+      self.file.write(self.buffer)
+      self.file.flush()
+      self.buffer = bytearray()
+    self.last_flush = time.time()
+
+  def close(self):
+    for remote in list(self.remote_cleanups):
+      self._detach(remote)
+
+    for func in getattr(self, 'cleanups', []):
+      func()
+    self.cleanups = []
+
+    f = getattr(self, 'file', None)
+    if f:
+      self.flush()
+      f.close()
+      self.file = None
+
+  def onConnect(self, remote):
+    if remote in self.remote_ids:
+      return
+
+    remote_id = self.remote_ids[remote] = self.next_remote_id
+    self.next_remote_id += 1
+    self.record(b'c', remote_id, U8.pack(1 if remote.serialize else 0))
+
+    def onValue(path, value):
+      self.record(b'v', remote_id, U32.pack(self.path_id(path)) + _pack_any(value))
+
+    def onValueId(id, value):
+      # recorded by path; ids are only valid for the current schema
+      path = self.server.ids.path(id) if isinstance(id, int) else None
+      if path is not None:
+        onValue(path, value)
+
+    def onValueRange(path, start, values):
+      self.record(b'r', remote_id, U32.pack(self.path_id(path)) + U32.pack(int(start)) + pack_value('a', values))
+
+    cleanups = [
+      remote.incoming.valueEvent.add(onValue),
+      remote.incoming.valueIdEvent.add(onValueId),
+      remote.incoming.valueRangeEvent.add(onValueRange),
+      remote.incoming.requestSchemaEvent.add(lambda: self.record(b'q', remote_id)),
+      remote.incoming.subscribeEvent.add(lambda pattern: self.record(b'u', remote_id, pack_str(pattern))),
+      remote.incoming.unsubscribeEvent.add(lambda pattern: self.record(b'x', remote_id, pack_str(pattern)))]
+
+    if self.outgoing:
+      def onSendValue(path, value):
+        self.record(b'V', remote_id, U32.pack(self.path_id(path)) + _pack_any(value))
+
+      def onSendSchema(schema_data):
+        self.record(b'S', remote_id, pack_str(json.dumps(schema_data)))
+
+      cleanups.append(remote.outgoing.sendValueEvent.add(onSendValue))
+      cleanups.append(remote.outgoing.sendSchemaEvent.add(onSendSchema))
+
+    self.remote_cleanups[remote] = cleanups
+
+  def onDisconnect(self, remote):
+    remote_id = self.remote_ids.pop(remote, None)
+    if remote_id is None:
+      return
+    self._detach(remote)
+    self.record(b'd', remote_id)
+
+  def _detach(self, remote):
+    for func in self.remote_cleanups.pop(remote, []):
+      func()
+
+def read_recording(file_path):
+  '''
+  Generator yielding (time since start, kind, remote id, data) tuples for all
+  complete records in the given recording, where data is a tuple with the
+  kind-specific payload; ie. (path, value) for value records. Path definition
+  records are resolved and not yielded. An incomplete trailing record is ignored.
+  '''
+  with open(file_path, 'rb') as f:
+    data = f.read()
+
+  if len(data) < RECORDING_HEADER.size:
+    return
+
+  magic, version, start_time = RECORDING_HEADER.unpack_from(data, 0)
+  if magic != RECORDING_MAGIC or version != FORMAT_VERSION:
+    raise ValueError('Not a (supported) recording file: {}'.format(file_path))
+
+  paths = {}
+  offset = RECORDING_HEADER.size
+  while offset + U32.size <= len(data):
+    size = U32.unpack_from(data, offset)[0]
+    offset += U32.size
+    if offset + size > len(data):
+      logger.warning('[read_recording] ignoring incomplete record at end of {}'.format(file_path))
+      return
+
+    t, kind, remote_id = RECORD_HEADER.unpack_from(data, offset)
+    payload_offset = offset + RECORD_HEADER.size
+    offset += size
+
+    if kind == b'p':
+      path_id = U32.unpack_from(data, payload_offset)[0]
+      paths[path_id], _ = unpack_path(data, payload_offset + U32.size)
+      continue
+
+    if kind in (b'v', b'V'):
+      path = paths[U32.unpack_from(data, payload_offset)[0]]
+      _, value, _ = unpack_value(data, payload_offset + U32.size)
+      yield t, kind, remote_id, (path, value)
+    elif kind == b'r':
+      path = paths[U32.unpack_from(data, payload_offset)[0]]
+      start = U32.unpack_from(data, payload_offset + U32.size)[0]
+      _, values, _ = unpack_value(data, payload_offset + 2 * U32.size)
+      yield t, kind, remote_id, (path, start, values)
+    elif kind in (b'u', b'x', b'S'):
+      yield t, kind, remote_id, (unpack_str(data, payload_offset)[0],)
+    elif kind == b'c':
+      yield t, kind, remote_id, (data[payload_offset] != 0,)
+    else:
+      yield t, kind, remote_id, ()
+
+class Replayer:
+  '''
+  Re-injects the incoming traffic of a recording into a Server, through
+  a Remote instance for every recorded remote; in real time (optionally
+  sped up) or as fast as possible. Outgoing records are skipped, those are
+  produced by the server again.
+
+  ie.
+
+  Replayer('show.rec').replay(server, speed=None)
+  '''
+
+  def __init__(self, file_path):
+    self.file_path = file_path
+    self.remotes = {}
+
+  def events(self):
+    return (record for record in read_recording(self.file_path) if record[1] in INCOMING_KINDS)
+
+  def replay(self, server, speed=1.0):
+    """
+    Replays the recording (blocking) and returns the number of replayed events
+
+    Parameters
+    ----------
+    server : Server
+      server to inject the recorded traffic into
+
+    speed : float
+      replay speed relative to real time, or None to replay as fast as possible
+    """
+    start = time.time()
+    count = 0
+    for record in self.events():
+      if speed:
+        delay = record[0] / speed - (time.time() - start)
+        if delay > 0:
+          time.sleep(delay)
+      self.inject(server, *record)
+      count += 1
+
+    self.disconnect_all(server)
+    return count
+
+  async def replay_async(self, server, speed=1.0):
+    '''
+    Same as replay, but sleeps asynchronously
+    '''
+    start = time.time()
+    count = 0
+    for record in self.events():
+      if speed:
+        delay = record[0] / speed - (time.time() - start)
+        if delay > 0:
+          await asyncio.sleep(delay)
+      self.inject(server, *record)
+      count += 1
+
+    self.disconnect_all(server)
+    return count
+
+  def inject(self, server, t, kind, remote_id, data):
+    if kind == b'c':
+      remote = self.remotes[remote_id] = Remote(serialize=data[0])
+      server.connect(remote)
+      return
+
+    remote = self.remotes.get(remote_id)
+    if remote is None:
+      # recording started after the remote connected
+      remote = self.remotes[remote_id] = Remote()
+      server.connect(remote)
+
+    if kind == b'd':
+      server.disconnect(remote)
+      del self.remotes[remote_id]
+    elif kind == b'v':
+      remote.incoming.valueEvent(*data)
+    elif kind == b'r':
+      remote.incoming.valueRangeEvent(*data)
+    elif kind == b'q':
+      remote.incoming.requestSchemaEvent()
+    elif kind == b'u':
+      remote.incoming.subscribeEvent(*data)
+    elif kind == b'x':
+      remote.incoming.unsubscribeEvent(*data)
+
+  def disconnect_all(self, server):
+    for remote in self.remotes.values():
+      server.disconnect(remote)
+    self.remotes.clear()
+
+
+if __name__ == '__main__':
+  import sys
+
+  # print the records of a recording
+  for t, kind, remote_id, data in read_recording(sys.argv[1]):
+    print('{:.6f} {} remote={} {}'.format(t, kind.decode('ascii'), remote_id, data))
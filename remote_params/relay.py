@@ -0,0 +1,230 @@
+import logging, json, time, asyncio, websockets
+from evento import Event
+
+from .params import Params
+from .server import Server
+from .schema import get_path, apply_schema_list
+from .binary import unpack_path, unpack_value
+from .WebsocketServer import WebsocketServer, value_message, BINARY_VALUE, DEFAULT_PORT
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PING_INTERVAL = 1.0
+
+class Mirror:
+  '''
+  Mirrored Params, kept in sync with schema and value updates from an
+  upstream source, which are re-served to clients through a local Server
+  and WebsocketServer. Writes from those clients (or any other local
+  value change) are announced through writeEvent (path, value), so they
+  can be forwarded upstream.
+  '''
+
+  def __init__(self, host='0.0.0.0', port=DEFAULT_PORT, **websocket_opts):
+    """
+    Parameters
+    ----------
+    host, port :
+      address for the local WebsocketServer
+
+    websocket_opts :
+      additional WebsocketServer options (ie. compression)
+    """
+    self.params = Params()
+    self.server = Server(self.params)
+    self.websocket_server = WebsocketServer(self.server, host=host, port=port, start=False, **websocket_opts)
+    self.writeEvent = Event()
+
+    # True while applying upstream updates, which should not be echoed back
+    self._applying = False
+    self.params.valueChangeEvent += self._onLocalValue
+
+  def __del__(self):
+    self.params.valueChangeEvent -= self._onLocalValue
+
+  async def start_async(self):
+    return await self.websocket_server.start_async()
+
+  def stop(self):
+    self.websocket_server.stop()
+
+  def apply_schema(self, schema_data):
+    self._applying = True
+    try:
+      apply_schema_list(self.params, schema_data)
+    finally:
+      self._applying = False
+
+  def apply_value(self, path, value):
+    param = get_path(self.params, path)
+    if param is None:
+      logger.warning('[Mirror.apply_value] unknown path: {}'.format(path))
+      return
+
+    self._applying = True
+    try:
+      param.set(value)
+    finally:
+      self._applying = False
+
+  def _onLocalValue(self, path, value, param):
+    if not self._applying:
+      self.writeEvent(path, value)
+
+class Relay:
+  '''
+  A relay node connects to an upstream WebsocketServer (the origin server,
+  or another relay), keeps a mirror of its params and re-serves those to
+  its own websocket clients, while forwarding their writes upstream.
+  Relays can be chained into a tree to spread the fan-out to many clients
+  over multiple processes/hosts.
+
+  The latency to the upstream server is measured (websocket ping/pong)
+  every ping_interval seconds. Every relay reports its total latency to the
+  origin server to its own clients ('GET latency'), so downstream relays
+  add up the latencies of all hops.
+
+  ie.
+
+  relay = Relay('ws://origin:8081', port=8082)
+  await relay.start_async()
+  '''
+
+  def __init__(self, upstream_uri, host='0.0.0.0', port=DEFAULT_PORT, ping_interval=DEFAULT_PING_INTERVAL, **websocket_opts):
+    self.upstream_uri = upstream_uri
+    self.ping_interval = ping_interval
+    self.mirror = Mirror(host=host, port=port, **websocket_opts)
+    self.mirror.writeEvent += self._onWrite
+    self.params = self.mirror.params
+
+    # round-trip time to upstream and latency of upstream to the origin server
+    self.rtt = None
+    self.upstream_latency = 0.0
+    self.latencyEvent = Event()
+
+    self.websocket = None
+    self._tasks = []
+
+  @property
+  def latency(self):
+    '''
+    Estimated (one-way) latency to the origin server, in seconds
+    '''
+    return self.mirror.websocket_server.upstream_latency
+
+  async def start_async(self):
+    '''
+    Connects to the upstream server, requests its schema and
+    starts serving the mirrored params
+    '''
+    self.websocket = await websockets.connect(self.upstream_uri)
+    await self.websocket.send('GET schema.json')
+    await self.mirror.start_async()
+
+    self._tasks.append(asyncio.ensure_future(self._receive()))
+    if self.ping_interval:
+      self._tasks.append(asyncio.ensure_future(self._pingLoop()))
+
+  async def stop_async(self):
+    for task in self._tasks:
+      task.cancel()
+    self._tasks.clear()
+
+    if self.websocket:
+      await self.websocket.close()
+      self.websocket = None
+
+    self.mirror.stop()
+
+  async def _receive(self):
+    try:
+      async for msg in self.websocket:
+        self._onUpstreamMessage(msg)
+    except websockets.exceptions.ConnectionClosed:
+      logger.warning('[Relay] upstream connection closed')
+
+  def _onUpstreamMessage(self, msg):
+    if isinstance(msg, (bytes, bytearray)):
+      if msg[0] == BINARY_VALUE:
+        path, offset = unpack_path(msg, 1)
+        _, value, _ = unpack_value(msg, offset)
+        self.mirror.apply_value(path, value)
+      return
+
+    if msg.startswith('POST schema.json?schema='):
+      self.mirror.apply_schema(json.loads(msg[len('POST schema.json?schema='):]))
+      return
+
+    if msg.startswith('POST latency?value='):
+      self.upstream_latency = float(msg[len('POST latency?value='):])
+      self._updateLatency()
+      return
+
+    if msg.startswith('POST /') and '?value=' in msg:
+      path, value = msg[len('POST '):].split('?value=', 1)
+      self.mirror.apply_value(path, value)
+      return
+
+    logger.debug('[Relay] ignoring upstream message: {}'.format(msg[:64]))
+
+  def _onWrite(self, path, value):
+    if not self.websocket:
+      logger.warning('[Relay] not connected, dropping write for {}'.format(path))
+      return
+    asyncio.ensure_future(self.websocket.send(value_message(path, value)))
+
+  async def measure_latency(self):
+    '''
+    Measures the round-trip time to the upstream server and requests
+    its latency to the origin server; returns the round-trip time
+    '''
+    t = time.perf_counter()
+    pong_waiter = await self.websocket.ping()
+    await pong_waiter
+    self.rtt = time.perf_counter() - t
+    self._updateLatency()
+    await self.websocket.send('GET latency')
+    return self.rtt
+
+  def _updateLatency(self):
+    if self.rtt is None:
+      return
+    self.mirror.websocket_server.upstream_latency = self.rtt / 2.0 + self.upstream_latency
+    self.latencyEvent(self.latency)
+
+  async def _pingLoop(self):
+    try:
+      while True:
+        await self.measure_latency()
+        await asyncio.sleep(self.ping_interval)
+    except websockets.exceptions.ConnectionClosed:
+      pass
+
+
+if __name__ == '__main__':
+  from optparse import OptionParser
+
+  def parse_args():
+    parser = OptionParser()
+    parser.add_option('-u', '--upstream', default='ws://127.0.0.1:8081')
+    parser.add_option('-p', '--port', default=8082, type='int')
+    parser.add_option('--host', default='0.0.0.0')
+    parser.add_option('-v', '--verbose', action='store_true', default=False)
+
+    opts, args = parser.parse_args()
+    logging.basicConfig(level=logging.DEBUG if opts.verbose else logging.INFO)
+    return opts, args
+
+  async def main(opts):
+    relay = Relay(opts.upstream, host=opts.host, port=opts.port)
+    relay.latencyEvent += lambda latency: logger.debug('latency to origin: {:.2f}ms'.format(latency * 1000.0))
+    await relay.start_async()
+    logger.info('Relaying {} on port {}'.format(opts.upstream, opts.port))
+    while True:
+      await asyncio.sleep(1.0)
+
+  opts, args = parse_args()
+  try:
+    asyncio.run(main(opts))
+  except KeyboardInterrupt:
+    print('Received Ctrl+C... exiting')
@@ -0,0 +1,110 @@
+import fnmatch
+
+GLOB_CHARS = '*?['
+
+def split_path(path):
+  return [part for part in path.split('/') if part]
+
+def is_glob(segment):
+  return any(c in segment for c in GLOB_CHARS)
+
+class _Node:
+  __slots__ = ('children', 'globs', 'subscribers')
+
+  def __init__(self):
+    self.children = {}
+    self.globs = {}
+    # dict used as an insertion-ordered set
+    self.subscribers = {}
+
+  def is_empty(self):
+    return not self.children and not self.globs and not self.subscribers
+
+class SubscriptionTrie:
+  '''
+  Maps path patterns to subscribers. A pattern matches its own path and
+  every path below it (prefix), so '/' matches everything. Pattern segments
+  may contain glob wildcards (*, ? and [...]), which match a single segment.
+
+  ie.
+
+  trie.subscribe(remote, '/page1')         # /page1, /page1/fader, ...
+  trie.subscribe(remote, '/deck*/volume')  # /deckA/volume, /deckB/volume, ...
+
+  Looking up the subscribers for a path costs O(path depth),
+  regardless of the total number of subscribers.
+  '''
+
+  def __init__(self):
+    self.root = _Node()
+    self.patterns = {}
+
+  def subscribe(self, subscriber, pattern):
+    node = self.root
+    for segment in split_path(pattern):
+      table = node.globs if is_glob(segment) else node.children
+      if segment not in table:
+        table[segment] = _Node()
+      node = table[segment]
+
+    node.subscribers[subscriber] = True
+    self.patterns.setdefault(subscriber, set()).add(pattern)
+
+  def unsubscribe(self, subscriber, pattern):
+    if pattern not in self.patterns.get(subscriber, ()):
+      return False
+
+    self._remove(self.root, split_path(pattern), subscriber)
+    self.patterns[subscriber].discard(pattern)
+    if not self.patterns[subscriber]:
+      del self.patterns[subscriber]
+    return True
+
+  def unsubscribe_all(self, subscriber):
+    for pattern in list(self.patterns.get(subscriber, ())):
+      self.unsubscribe(subscriber, pattern)
+
+  def _remove(self, node, segments, subscriber):
+    if not segments:
+      node.subscribers.pop(subscriber, None)
+      return
+
+    segment = segments[0]
+    table = node.globs if is_glob(segment) else node.children
+    child = table.get(segment)
+    if child is None:
+      return
+
+    self._remove(child, segments[1:], subscriber)
+    if child.is_empty():
+      del table[segment]
+
+  def has_subscriptions(self, subscriber):
+    return subscriber in self.patterns
+
+  def match(self, path):
+    '''
+    Returns an (insertion-ordered) dict with all subscribers
+    that have a pattern matching the given path as keys
+    '''
+    result = dict(self.root.subscribers)
+    nodes = [self.root]
+
+    for segment in split_path(path):
+      next_nodes = []
+      for node in nodes:
+        child = node.children.get(segment)
+        if child is not None:
+          next_nodes.append(child)
+        for pattern, child in node.globs.items():
+          if fnmatch.fnmatchcase(segment, pattern):
+            next_nodes.append(child)
+
+      if not next_nodes:
+        break
+
+      for node in next_nodes:
+        result.update(node.subscribers)
+      nodes = next_nodes
+
+    return result
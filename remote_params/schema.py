@@ -1,29 +1,67 @@
-import logging
-from .params import Param, Params, IntParam, FloatParam, ImageParam
+import logging, gc, json, itertools
+from .params import Param, Params, IntParam, FloatParam, ImageParam, ArrayParam, convertParamBoolVal
 
 
 logger = logging.getLogger(__name__)
 
 def schema_list(params):
-  result = []
+  return list(iter_schema(params))
+
+def schema_list_append(schema, scope, id, item):
+  schema.extend(iter_schema_item(scope, id, item))
+
+def iter_schema(params, scope='/'):
+  '''
+  Generator yielding the schema data (see schema_list) of
+  every param in the given Params, one item at a time
+  '''
   for pair in params:
     id, item = pair
-    schema_list_append(result, '/', id, item)
-  return result
+    yield from iter_schema_item(scope, id, item)
 
-def schema_list_append(schema, scope, id, item):
+def iter_schema_item(scope, id, item):
   if isinstance(item, Param):
     info = item.to_dict()
     info['path'] = scope+id
     if 'value' in info and item.type == 'g':
       info['value'] = ImageParam.serialize_value(info['value'])
-    schema.append(info)
+    yield info
     return
-  
+
   if isinstance(item, Params):
-    for pair in item:
-      sub_id, sub_item = pair
-      schema_list_append(schema, scope+id+'/', sub_id, sub_item)
+    yield from iter_schema(item, scope+id+'/')
+
+def iter_schema_json(params, chunk_size=64*1024):
+  '''
+  Generator yielding the JSON encoded schema list in chunks of (roughly, at
+  least one item per chunk) chunk_size characters. Joined together, the chunks
+  are equal to json.dumps(schema_list(params)), but the full schema list
+  (or its JSON) never has to be in memory at once.
+  '''
+  parts = ['[']
+  size = 1
+
+  for idx, info in enumerate(iter_schema(params)):
+    encoded = json.dumps(info)
+    if idx > 0:
+      encoded = ', '+encoded
+
+    if size + len(encoded) > chunk_size and size > 0:
+      yield ''.join(parts)
+      parts = []
+      size = 0
+
+    parts.append(encoded)
+    size += len(encoded)
+
+  parts.append(']')
+  yield ''.join(parts)
+
+def schema_page(params, offset=0, limit=100):
+  '''
+  Returns a single page (list) of the schema data
+  '''
+  return list(itertools.islice(iter_schema(params), offset, offset+limit))
 
 def get_path(params, path):
   parts = path.split('/')[1:]
@@ -37,11 +75,12 @@ def get_path(params, path):
   return current
 
 def set_path(params, path, param):
-  parent_ids = '/'.join(path.split('/')[1:-1])
+  parent_ids = path.split('/')[1:-1]
   current = params
   for id in parent_ids:
     current = current.get(id)
-    if not current or not isinstance(current, Params):
+    # note; an empty Params group is falsy
+    if current is None or not isinstance(current, Params):
       logger.warning('[set_path path=`{}`] could not set path because parent {} is not a Params group'.format(path, id))
       return
   
@@ -53,8 +92,8 @@ def remove_path(params, path):
   parent_path = '/'.join(path.split('/')[0:-1])
   param_id = path.split('/')[-1]
 
-  parent = params.get(parent_path)
-  if not parent:
+  parent = get_path(params, parent_path) if parent_path else params
+  if parent is None:
     logger.warning('[remove_path] could not find parent with path: {}'.format(parent_path))
     return
 
@@ -64,15 +103,26 @@ def create_param(param_data):
   if not 'type' in param_data:
     return None
 
+  # min/max can be specified at top-level or (like in schema_list) in opts
+  opts = param_data['opts'] if 'opts' in param_data else {}
+  def opt(key):
+    return param_data[key] if key in param_data else opts.get(key)
+
   if param_data['type'] == 'i':
-    return IntParam(
-      min=param_data['min'] if 'min' in param_data else None,
-      max=param_data['max'] if 'max' in param_data else None)
+    return IntParam(min=opt('min'), max=opt('max'))
 
   if param_data['type'] == 'f':
-    return FloatParam(
-      min=param_data['min'] if 'min' in param_data else None,
-      max=param_data['max'] if 'max' in param_data else None)
+    return FloatParam(min=opt('min'), max=opt('max'))
+
+  if param_data['type'] == 's':
+    return Param('s', setter=str)
+
+  if param_data['type'] == 'b':
+    return Param('b', setter=convertParamBoolVal)
+
+  if param_data['type'] == 'a':
+    return ArrayParam(opts.get('length', 0), dtype=opts.get('dtype', 'f'),
+      min=opt('min'), max=opt('max'), kind=opts.get('kind', 'array'))
 
   return Param(param_data['type'])
 
@@ -81,34 +131,206 @@ def update_param(param, param_data):
     param.set(param_data['value'])
   # TODO; also apply config changes like min/max/default?
 
+def index_paths(params, scope='/', index=None):
+  '''
+  Returns a dict which maps the path of every param and
+  (sub-)group in the given Params to a (parent, id, item) tuple
+  '''
+  index = {} if index is None else index
+
+  for pair in params:
+    id, item = pair
+    path = scope+id
+    index[path] = (params, id, item)
+    if isinstance(item, Params):
+      index_paths(item, path+'/', index)
+
+  return index
+
+def ensure_group(params, path, index):
+  '''
+  Returns the Params group at the given path, creating (without
+  notifications) any missing groups along the way. Newly created
+  groups are added to the given path index.
+  '''
+  current = params
+  current_path = ''
+
+  for id in path.split('/')[1:]:
+    current_path += '/'+id
+    entry = index.get(current_path)
+    if entry is None:
+      group = Params()
+      current.append(id, group, notify=False)
+      index[current_path] = (current, id, group)
+      current = group
+      continue
+
+    current = entry[2]
+    if not isinstance(current, Params):
+      logger.warning('[ensure_group path=`{}`] {} is not a Params group'.format(path, current_path))
+      return None
+
+  return current
+
+def _has_ancestor_in(path, paths):
+  while '/' in path:
+    path = path.rsplit('/', 1)[0]
+    if path in paths:
+      return True
+  return False
+
 def apply_schema_list(params, schema_data):
-  logger.debug('[apply_schema_list] schema_data={}'.format(schema_data))
+  '''
+  Updates the given params (ie. a client-side mirror) to match the given
+  schema data in a single pass; creating missing params (and groups),
+  replacing params whose type changed, applying values and removing
+  params that are not in the schema data.
 
-  def add_new_items_and_values(params, schema_data):
-    for param_data in schema_data:
-      param = get_path(params, param_data['path'])
-      
-      # create if doesn't exist
-      if not param:
-        param = create_param(param_data)
-        set_path(params, param_data['path'], param)
+  Only a single schema change notification is fired (at the end) when
+  any params were created or removed.
+  '''
+  logger.debug('[apply_schema_list] {} items'.format(len(schema_data)))
+  index = index_paths(params)
+  seen = set()
+  schema_changed = False
+
+  for param_data in schema_data:
+    path = param_data['path']
+    entry = index.get(path)
+
+    # replace when the type changed
+    if entry is not None and (not isinstance(entry[2], Param) or entry[2].type != param_data.get('type')):
+      parent, id, item = entry
+      parent.remove(id, notify=False)
+      entry = None
+      schema_changed = True
 
+    if entry is None:
+      param = create_param(param_data)
+      if param is None:
+        continue
+
+      parent_path, id = path.rsplit('/', 1)
+      parent = ensure_group(params, parent_path, index) if parent_path else params
+      if parent is None:
+        continue
+
+      # apply value before adding, so no value change propagates
+      update_param(param, param_data)
+      parent.append(id, param, notify=False)
+      index[path] = (parent, id, param)
+      schema_changed = True
+    else:
       # update (apply value etc.)
+      param = entry[2]
+      update_param(param, param_data)
+
+    # mark the param and its parent groups as seen
+    while path and path not in seen:
+      seen.add(path)
+      path = path.rsplit('/', 1)[0]
+
+  # remove everything that wasn't in the schema data;
+  # (sorted) parents before their children
+  removed = set()
+  for path in sorted(index.keys()):
+    if path in seen or _has_ancestor_in(path, removed):
+      continue
+
+    parent, id, item = index[path]
+    parent.remove(id, notify=False)
+    removed.add(path)
+    schema_changed = True
+
+  if schema_changed:
+    params.schemaChangeEvent()
+    params.dispatcher.notify_change(params.handle)
+
+def build_params(schema_data):
+  '''
+  Builds a new Params tree (including nested groups) from the given schema
+  data (see schema_list) in a single pass. Values in the schema data are
+  applied before the params are added, so no per-item events are fired;
+  only a single schema change notification at the end.
+  '''
+  params = Params()
+  groups = {'': params}
+
+  # the garbage collector would otherwise repeatedly scan
+  # the growing tree while allocating all new params
+  gc_enabled = gc.isenabled()
+  gc.disable()
+  try:
+    for param_data in schema_data:
+      param = create_param(param_data)
+      if param is None:
+        logger.warning('[build_params] invalid param data: {}'.format(param_data))
+        continue
+
       update_param(param, param_data)
+      parent_path, id = param_data['path'].rsplit('/', 1)
+      parent = groups.get(parent_path)
+      if parent is None:
+        parent = _build_group(groups, parent_path)
+      parent.append(id, param, notify=False)
+  finally:
+    if gc_enabled:
+      gc.enable()
+
+  params.schemaChangeEvent()
+  return params
+
+def _build_group(groups, path):
+  parent_path, id = path.rsplit('/', 1)
+  parent = groups.get(parent_path)
+  if parent is None:
+    parent = _build_group(groups, parent_path)
 
-  def remove_items_not_in_schema_list(params, schema_data):
-    dummy = Params()
-    add_new_items_and_values(dummy, schema_data)
+  group = Params()
+  parent.append(id, group, notify=False)
+  groups[path] = group
+  return group
+
+def spec_schema_list(spec, scope='/'):
+  '''
+  Converts a nested dict spec into schema data (see schema_list).
+  Values in the spec are either a type string, a dict with a 'type'
+  (and optionally 'value', 'min', 'max' and/or 'opts') or, for
+  sub-groups, a nested spec dict.
+
+  ie.
+
+  {
+    'name': 's',
+    'count': {'type': 'i', 'min': 0, 'value': 3},
+    'light': {
+      'intensity': {'type': 'f', 'min': 0.0, 'max': 1.0},
+      'on': 'b'
+    }
+  }
+  '''
+  result = []
 
-    # loop over all items in schema
-    for item in schema_list(params):
-      # if specified item doesn't appear in dummy
-      if not get_path(dummy, item['path']):
-        remove_path(params, item['path'])
+  for id, item in spec.items():
+    if isinstance(item, str):
+      result.append({'path': scope+id, 'type': item})
+    elif isinstance(item, dict) and isinstance(item.get('type'), str):
+      param_data = dict(item)
+      param_data['path'] = scope+id
+      result.append(param_data)
+    elif isinstance(item, dict):
+      result.extend(spec_schema_list(item, scope+id+'/'))
+    else:
+      logger.warning('[spec_schema_list] invalid spec for {}: {}'.format(scope+id, item))
 
+  return result
 
-  add_new_items_and_values(params, schema_data)
-  remove_items_not_in_schema_list(params, schema_data)
+def build_params_from_spec(spec):
+  '''
+  Builds a new Params tree from a nested dict spec (see spec_schema_list)
+  '''
+  return build_params(spec_schema_list(spec))
 
 def get_values(params):
   values = {}
@@ -119,6 +341,8 @@ def get_values(params):
     if isinstance(item, Param):
       if item.type == 'g':
         values[id] = item.get_serialized()
+      elif item.type == 'a':
+        values[id] = item.val().tolist()
       else:
         values[id] = item.val()
     
@@ -142,3 +366,18 @@ def set_values(params, vals):
       else:
         param.set(v)
 
+
+def flatten_values(values, scope='/'):
+  '''
+  Converts a nested values dict (see get_values) into
+  a flat dict of path -> value
+  '''
+  result = {}
+
+  for k, v in values.items():
+    if type(v) is dict:
+      result.update(flatten_values(v, scope+k+'/'))
+    else:
+      result[scope+k] = v
+
+  return result
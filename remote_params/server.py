@@ -1,7 +1,10 @@
 from evento import Event
+from contextlib import contextmanager
 from .params import Params
 from .schema import schema_list, get_path, apply_schema_list
-import logging
+from .routing import SubscriptionTrie
+from .ids import IdTable
+import logging, threading
 
 logger = logging.getLogger(__name__)
 
@@ -11,9 +14,14 @@ class Remote:
       def __init__(self):
         # events for remote-to-server communications
         self.valueEvent = Event()
+        self.valueRangeEvent = Event()
+        # value with an interned param id instead of a path (see IdTable)
+        self.valueIdEvent = Event()
         self.disconnectEvent = Event()
         self.confirmEvent = Event()
         self.requestSchemaEvent = Event()
+        self.subscribeEvent = Event()
+        self.unsubscribeEvent = Event()
 
     class Outgoing:
       def __init__(self):
@@ -77,6 +85,15 @@ def create_connection(server, remote):
   unsub = remote.incoming.valueEvent.add(value_handler)
   cleanups.append(unsub)
 
+  # register handler when receiving partial (array) value from remote
+  def value_range_handler(path, start, values):
+    server.handle_remote_value_range(remote, path, start, values)
+  cleanups.append(remote.incoming.valueRangeEvent.add(value_range_handler))
+
+  def value_id_handler(id, value):
+    server.handle_remote_value_id(remote, id, value)
+  cleanups.append(remote.incoming.valueIdEvent.add(value_id_handler))
+
   # register handler when receiving schema request from remote
   def schema_request_handler():
     logger.debug('[Server.connect.schema_request_handler]')
@@ -84,11 +101,26 @@ def create_connection(server, remote):
   unsub = remote.incoming.requestSchemaEvent.add(schema_request_handler)
   cleanups.append(unsub)
 
-  # add remote to server list
-  server.connected_remotes.append(remote)
+  # register handlers for (un-)subscribing to specific paths
+  def subscribe_handler(pattern):
+    server.handle_remote_subscribe(remote, pattern)
+  cleanups.append(remote.incoming.subscribeEvent.add(subscribe_handler))
+
+  def unsubscribe_handler(pattern):
+    server.handle_remote_unsubscribe(remote, pattern)
+  cleanups.append(remote.incoming.unsubscribeEvent.add(unsubscribe_handler))
+
+  # add remote to server list; until the remote subscribes
+  # to specific paths, it receives all value changes
+  with server.lock:
+    server.connected_remotes.append(remote)
+    server.unfiltered_remotes[remote] = True
   def remove():
-    if remote in server.connected_remotes:
-      server.connected_remotes.remove(remote)
+    with server.lock:
+      if remote in server.connected_remotes:
+        server.connected_remotes.remove(remote)
+      server.unfiltered_remotes.pop(remote, None)
+      server.subscriptions.unsubscribe_all(remote)
   cleanups.append(remove)
 
   # done, send confirmation to remote with schema data
@@ -107,8 +139,19 @@ class Server:
     self.params = params
     self.queueIncomingValuesUntilUpdate=queueIncomingValuesUntilUpdate
     self.connected_remotes = []
+    # remotes without subscriptions; these receive all value changes
+    self.unfiltered_remotes = {}
+    self.subscriptions = SubscriptionTrie()
+    # interned param ids for compact value messages
+    self.ids = IdTable(params)
 
     self.connections = {}
+    # guards the connections and remote lists above; remotes may (dis)connect
+    # on other threads (ie. OSC heartbeat evictions) than the value changes
+    self.lock = threading.RLock()
+    # (remote) notifications, ie. for recording traffic
+    self.connectEvent = Event()
+    self.disconnectEvent = Event()
 
     self.cleanups = []
     self.cleanups.append(self.params.schemaChangeEvent.add(self.broadcast_schema))
@@ -116,8 +159,11 @@ class Server:
 
     self.updateFuncs = []
 
+    # batch state is per thread (see batch)
+    self._batch = threading.local()
+
   def __del__(self):
-    for r in self.connected_remotes:
+    for r in list(self.connected_remotes):
       self.disconnect(r)
 
     for func in self.cleanups:
@@ -126,23 +172,27 @@ class Server:
   def connect(self, remote):
     logger.debug('[Server.connect]')
 
-    if remote in self.connections:
-      logger.warning('[Server.connect] remote already connected')
-      return
+    with self.lock:
+      if remote in self.connections:
+        logger.warning('[Server.connect] remote already connected')
+        return
 
-    # create and save new connection
-    self.connections[remote] = create_connection(self, remote)
+      # create and save new connection
+      self.connections[remote] = create_connection(self, remote)
+    self.connectEvent(remote)
 
   def disconnect(self, remote):
     logger.debug('[Server.disconnect]')
 
-    if not remote in self.connections:
+    with self.lock:
+      disconnector = self.connections.pop(remote, None)
+
+    if disconnector is None:
       logger.warning('[Server.disconnect] could not find connection')
       return
 
-    disconnector = self.connections[remote]
     disconnector()
-    del self.connections[remote]
+    self.disconnectEvent(remote)
 
   def update(self):
     for f in self.updateFuncs:
@@ -151,14 +201,67 @@ class Server:
 
   def broadcast_schema(self):
     logger.debug('[Server.broadcast_schema]')
+    self.ids.invalidate()
     schema_data = schema_list(self.params)
-    for r in self.connected_remotes:
+    with self.lock:
+      remotes = list(self.connected_remotes)
+    for r in remotes:
       r.outgoing.send_schema(schema_data)
 
+  @contextmanager
+  def batch(self):
+    '''
+    Defers all value broadcasts (of the current thread) until the end of the
+    with-block and coalesces them, so every changed param is broadcasted only once.
+
+    ie.
+
+    with server.batch():
+      for path, value in values.items():
+        get_path(server.params, path).set(value)
+    '''
+    state = self._batch
+    depth = getattr(state, 'depth', 0)
+    if depth == 0:
+      state.values = {}
+    state.depth = depth + 1
+    try:
+      # also coalesces the change events of the params' groups
+      with self.params.dispatcher.batch():
+        yield self
+    finally:
+      state.depth -= 1
+      if state.depth == 0:
+        batched = state.values
+        state.values = None
+        for path, (value, param) in batched.items():
+          self.broadcast_value_change(path, value, param)
+
+  def apply_values(self, values):
+    '''
+    Applies a dict of path -> value in a single batched update
+    '''
+    with self.batch():
+      for path, value in values.items():
+        param = get_path(self.params, path)
+        if not param:
+          logger.warning('[Server.apply_values] unknown path: {}'.format(path))
+          continue
+        param.set(value)
+
   def broadcast_value_change(self, path, value, param):
-    logger.debug('[Server.broadcast_value_change] to {} connected remotes'.format(len(self.connected_remotes)))
+    batched = getattr(self._batch, 'values', None)
+    if batched is not None:
+      batched[path] = (value, param)
+      return
+
+    with self.lock:
+      recipients = list(self.unfiltered_remotes)
+      recipients.extend(self.subscriptions.match(path))
+
+    logger.debug('[Server.broadcast_value_change] to {} of {} connected remotes'.format(len(recipients), len(self.connected_remotes)))
     serialized_value = None
-    for r in self.connected_remotes:
+    for r in recipients:
       if param.type == 'g' and r.serialize:
         if serialized_value is None:
           serialized_value = param.get_serialized()
@@ -181,6 +284,65 @@ class Server:
 
     processNow()
 
+  def handle_remote_value_id(self, remote, id, value):
+    '''
+    Applies a value received with an interned param id (see IdTable)
+    '''
+    def processNow():
+      param = self.ids.param(id)
+      if param is None:
+        logger.warning('[Server.handle_remote_value_id] unknown param id: {}'.format(id))
+        return
+      param.set(value)
+
+    if self.queueIncomingValuesUntilUpdate:
+      self.updateFuncs.append(processNow)
+      return
+
+    processNow()
+
+  def handle_remote_value_range(self, remote, path, start, values):
+    '''
+    Applies a partial update of an (array) param,
+    starting at the given element index
+    '''
+    def processNow():
+      param = get_path(self.params, path)
+      if not hasattr(param, 'set_range'):
+        logger.warning('[Server.handle_remote_value_range] unknown array path: {}'.format(path))
+        return
+
+      # remote input; malformed ranges shouldn't break the transport's connection or thread
+      try:
+        if not 0 <= int(start) < param.length:
+          raise ValueError('start index out of range')
+        param.set_range(start, values)
+      except (ValueError, TypeError) as err:
+        logger.warning('[Server.handle_remote_value_range] invalid range for {} (start={}): {}'.format(path, start, err))
+
+    if self.queueIncomingValuesUntilUpdate:
+      self.updateFuncs.append(processNow)
+      return
+
+    processNow()
+
+  def handle_remote_subscribe(self, remote, pattern):
+    '''
+    Limits the value changes sent to the remote to the params matching
+    its subscribed patterns (see SubscriptionTrie)
+    '''
+    logger.debug('[Server.handle_remote_subscribe] pattern={}'.format(pattern))
+    with self.lock:
+      self.unfiltered_remotes.pop(remote, None)
+      self.subscriptions.subscribe(remote, pattern)
+
+  def handle_remote_unsubscribe(self, remote, pattern):
+    logger.debug('[Server.handle_remote_unsubscribe] pattern={}'.format(pattern))
+    # note that a remote without any subscriptions left receives nothing;
+    # to receive everything again, it can subscribe to '/'
+    with self.lock:
+      self.subscriptions.unsubscribe(remote, pattern)
+
   def handle_remote_schema_request(self, remote):
     logger.debug('[Server.handle_remote_schema_request]')
     schema_data = schema_list(self.params)
@@ -0,0 +1,258 @@
+import logging, json, struct, math, threading
+
+try:
+  from multiprocessing import shared_memory
+except ImportError:
+  shared_memory = None # python < 3.8
+
+from .params import Param, Params
+from .schema import get_path
+
+logger = logging.getLogger(__name__)
+
+# shared memory block layout (all little-endian):
+#   magic (4 bytes), slot count (u32), layout size (u32), reserved (u32)
+#   sequence counter (u64); odd while the owner is writing
+#   layout json; a list of [path, type] pairs in slot order, padded to 8 bytes
+#   values; one float64 per slot
+HEADER = struct.Struct('<4sIII')
+SEQ = struct.Struct('<Q')
+MAGIC = b'RPSB'
+SEQ_OFFSET = HEADER.size
+LAYOUT_OFFSET = SEQ_OFFSET + SEQ.size
+SUPPORTED_TYPES = ('i', 'f', 'b')
+
+# names of the blocks created by banks in this process
+_created_names = set()
+
+def shared_layout(params):
+  '''
+  Returns a list of [path, type] pairs for all numeric and
+  bool params in the given Params tree, in tree order
+  '''
+  result = []
+
+  def walk(scope, group):
+    for id, item in group:
+      if isinstance(item, Param) and item.type in SUPPORTED_TYPES:
+        result.append([scope+id, item.type])
+      elif isinstance(item, Params):
+        walk(scope+id+'/', item)
+
+  walk('/', params)
+  return result
+
+def _pad(size):
+  return (size + 7) & ~7
+
+def _to_slot(value):
+  if value is None:
+    return math.nan
+
+  try:
+    return float(value)
+  except (TypeError, ValueError):
+    return math.nan
+
+def _from_slot(type_, value):
+  if math.isnan(value):
+    return None # uninitialized
+  if type_ == 'i':
+    return int(value)
+  if type_ == 'b':
+    return value != 0.0
+  return value
+
+class SharedParamBank:
+  '''
+  The SharedParamBank mirrors all numeric and bool param values of a Params
+  tree into a block of shared memory, which can be read by other processes
+  using a SharedParamReader, without any IPC messages.
+
+  The layout (which params are mirrored) is fixed at creation time; params
+  added to the tree afterwards are not mirrored.
+  '''
+
+  def __init__(self, params, name=None):
+    """
+    Parameters
+    ----------
+    params : Params
+      Params tree to mirror
+
+    name : str
+      optional name for the shared memory block, a random name is
+      generated when omitted. Readers need this name to attach.
+    """
+    if shared_memory is None:
+      raise RuntimeError('SharedParamBank requires multiprocessing.shared_memory (python 3.8+)')
+
+    self.params = params
+    self.layout = shared_layout(params)
+    self.offsets = {}
+
+    layout_bytes = json.dumps(self.layout).encode('utf-8')
+    values_offset = LAYOUT_OFFSET + _pad(len(layout_bytes))
+    for idx, (path, type_) in enumerate(self.layout):
+      self.offsets[path] = values_offset + idx * 8
+
+    size = values_offset + max(len(self.layout), 1) * 8
+    self.shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+    self.name = self.shm.name
+    self.seq = 0
+    # a seqlock allows a single writer only; values change on multiple
+    # threads (ie. of the OSC, websocket and Unix socket transports)
+    self.lock = threading.Lock()
+    _created_names.add(self.name)
+
+    buf = self.shm.buf
+    HEADER.pack_into(buf, 0, MAGIC, len(self.layout), len(layout_bytes), 0)
+    SEQ.pack_into(buf, SEQ_OFFSET, self.seq)
+    buf[LAYOUT_OFFSET:LAYOUT_OFFSET+len(layout_bytes)] = layout_bytes
+
+    # write initial values
+    self.publish_many([(path, self._current(path)) for path, type_ in self.layout])
+
+    self.cleanups = [self.params.valueChangeEvent.add(self._onValueChange)]
+
+  def __del__(self):
+    self.close()
+
+  def _current(self, path):
+    param = get_path(self.params, path)
+    return param.val() if param else None
+
+  def _onValueChange(self, path, value, param):
+    if path in self.offsets:
+      self.publish(path, value)
+
+  def publish(self, path, value):
+    '''
+    Writes a single value into shared memory
+    '''
+    self.publish_many(((path, value),))
+
+  def publish_many(self, items):
+    '''
+    Writes a list of (path, value) pairs into shared memory,
+    inside a single seqlock write section
+    '''
+    with self.lock:
+      if not self.shm:
+        return
+
+      buf = self.shm.buf
+      self.seq += 1 # odd; readers will retry
+      SEQ.pack_into(buf, SEQ_OFFSET, self.seq)
+
+      for path, value in items:
+        offset = self.offsets.get(path)
+        if offset is not None:
+          struct.pack_into('<d', buf, offset, _to_slot(value))
+
+      self.seq += 1 # even; consistent again
+      SEQ.pack_into(buf, SEQ_OFFSET, self.seq)
+
+  def close(self, unlink=True):
+    '''
+    Stops mirroring and releases the shared memory block
+    '''
+    for func in getattr(self, 'cleanups', []):
+      func()
+    self.cleanups = []
+
+    lock = getattr(self, 'lock', None)
+    if lock is None:
+      return
+    # (not while writing)
+    with lock:
+      shm, self.shm = self.shm, None
+    if not shm:
+      return
+
+    shm.close()
+    if unlink:
+      shm.unlink()
+      _created_names.discard(self.name)
+
+class SharedParamReader:
+  '''
+  Attaches to a shared memory block created by a SharedParamBank
+  (possibly in another process) and reads param values from it.
+  '''
+
+  def __init__(self, name):
+    if shared_memory is None:
+      raise RuntimeError('SharedParamReader requires multiprocessing.shared_memory (python 3.8+)')
+
+    self.shm = shared_memory.SharedMemory(name=name)
+    if self.shm.name not in _created_names:
+      _untrack(self.shm)
+
+    buf = self.shm.buf
+    magic, count, layout_size, _ = HEADER.unpack_from(buf, 0)
+    if magic != MAGIC:
+      self.shm.close()
+      raise ValueError('Shared memory block {} is not a SharedParamBank'.format(name))
+
+    self.layout = json.loads(bytes(buf[LAYOUT_OFFSET:LAYOUT_OFFSET+layout_size]).decode('utf-8'))
+    self.types = {path: type_ for path, type_ in self.layout}
+    values_offset = LAYOUT_OFFSET + _pad(layout_size)
+    self.indices = {path: idx for idx, (path, type_) in enumerate(self.layout)}
+    # zero-copy view of all slot values
+    self.values = buf[values_offset:values_offset+count*8].cast('d')
+
+  def __del__(self):
+    self.close()
+
+  @property
+  def version(self):
+    '''
+    Number of completed publish operations by the owner
+    '''
+    return SEQ.unpack_from(self.shm.buf, SEQ_OFFSET)[0] // 2
+
+  def _consistent(self, func):
+    buf = self.shm.buf
+    while True:
+      before = SEQ.unpack_from(buf, SEQ_OFFSET)[0]
+      if before & 1:
+        continue # owner is writing
+      result = func()
+      if SEQ.unpack_from(buf, SEQ_OFFSET)[0] == before:
+        return result
+
+  def get(self, path):
+    '''
+    Returns the current value for the given path, or None
+    when the path is not mirrored
+    '''
+    idx = self.indices.get(path)
+    if idx is None:
+      return None
+    return _from_slot(self.types[path], self._consistent(lambda: self.values[idx]))
+
+  def snapshot(self):
+    '''
+    Returns a consistent dict of path -> value for all mirrored params
+    '''
+    raw = self._consistent(lambda: self.values.tolist())
+    return {path: _from_slot(type_, raw[idx]) for idx, (path, type_) in enumerate(self.layout)}
+
+  def close(self):
+    shm = getattr(self, 'shm', None)
+    if not shm:
+      return
+
+    self.values.release()
+    self.shm = None
+    shm.close()
+
+def _untrack(shm):
+  # the resource tracker of an attaching process would otherwise
+  # unlink the block when that process exits (python < 3.13)
+  try:
+    from multiprocessing import resource_tracker
+    resource_tracker.unregister(shm._name, 'shared_memory')
+  except Exception:
+    pass
@@ -0,0 +1,200 @@
+import logging, time
+
+try:
+  import numpy as np
+except:
+  np = None # numpy not supported
+
+from .params import Param
+from .schema import get_path, flatten_values
+
+logger = logging.getLogger(__name__)
+
+TWEEN_TYPES = ('i', 'f')
+
+EASINGS = {
+  'linear': lambda t: t,
+  'ease_in': lambda t: t * t,
+  'ease_out': lambda t: t * (2.0 - t),
+  'ease_in_out': lambda t: np.where(t < 0.5, 2.0 * t * t, -1.0 + (4.0 - 2.0 * t) * t),
+  'smoothstep': lambda t: t * t * (3.0 - 2.0 * t),
+}
+
+def to_flat_values(values):
+  '''
+  Accepts a nested values dict (see get_values), a flat dict of path -> value
+  or a preset Snapshot and returns a flat dict of path -> value
+  '''
+  if hasattr(values, 'to_dict'):
+    values = values.to_dict()
+
+  if any(not k.startswith('/') or type(v) is dict for k, v in values.items()):
+    return flatten_values(values)
+
+  return values
+
+def _limit(opts, key, fallback):
+  value = opts.get(key)
+  return fallback if value is None else value
+
+class Tween:
+  '''
+  Interpolates all numeric (int and float) params that appear in both
+  the start and the end values, using vectorized NumPy operations.
+  Results are clamped to the params' min/max and applied through
+  a single batched Server update per tick.
+  '''
+
+  def __init__(self, server, start, end, duration=1.0, easing='linear', start_time=None):
+    """
+    Parameters
+    ----------
+    server : Server
+      Server instance whose params will be updated
+
+    start, end :
+      values to interpolate from and to; nested dicts (see get_values),
+      flat dicts of path -> value or preset Snapshot instances
+
+    duration : float
+      duration of the tween in seconds
+
+    easing : str or callable
+      name of one of the EASINGS curves, or a function mapping
+      an array of progress values in [0, 1] to eased values
+
+    start_time : float
+      start time in seconds (time.time() based), defaults to now
+    """
+    if np is None:
+      raise RuntimeError('Tween requires numpy')
+
+    self.server = server
+    self.duration = max(float(duration), 0.0)
+    self.easing = EASINGS[easing] if isinstance(easing, str) else easing
+    self.start_time = time.time() if start_time is None else start_time
+
+    start = to_flat_values(start)
+    end = to_flat_values(end)
+
+    self.paths = []
+    self.params = []
+    starts, ends, mins, maxs, ints = [], [], [], [], []
+
+    for path, end_value in end.items():
+      if path not in start:
+        continue
+
+      param = get_path(server.params, path)
+      if not isinstance(param, Param) or param.type not in TWEEN_TYPES:
+        continue
+
+      try:
+        a, b = float(start[path]), float(end_value)
+      except (TypeError, ValueError):
+        logger.warning('[Tween] skipping non-numeric value(s) for {}'.format(path))
+        continue
+
+      self.paths.append(path)
+      self.params.append(param)
+      starts.append(a)
+      ends.append(b)
+      mins.append(_limit(param.opts, 'min', -np.inf))
+      maxs.append(_limit(param.opts, 'max', np.inf))
+      ints.append(param.type == 'i')
+
+    self.start = np.array(starts, dtype=np.float64)
+    self.delta = np.array(ends, dtype=np.float64) - self.start
+    self.mins = np.array(mins, dtype=np.float64)
+    self.maxs = np.array(maxs, dtype=np.float64)
+    self.ints = np.array(ints, dtype=bool)
+    self.last = None
+    self.done = False
+
+  def progress(self, t=None):
+    if self.duration <= 0.0:
+      return 1.0
+    t = time.time() if t is None else t
+    return min(max((t - self.start_time) / self.duration, 0.0), 1.0)
+
+  def values_at(self, progress):
+    '''
+    Returns an array with the (eased and clamped) value
+    of every tweened param at the given progress
+    '''
+    eased = self.easing(np.float64(progress))
+    values = np.clip(self.start + self.delta * eased, self.mins, self.maxs)
+    return np.where(self.ints, np.rint(values), values)
+
+  def update(self, t=None):
+    '''
+    Applies the values for time t (defaults to now).
+    Returns False once the tween has finished.
+    '''
+    if self.done:
+      return False
+
+    with self.server.batch():
+      self.apply(self.progress(t))
+
+    return not self.done
+
+  def apply(self, progress):
+    '''
+    Applies the values for the given progress, without batching;
+    only params whose value changed since the previous tick are set
+    '''
+    values = self.values_at(progress)
+    changed = np.arange(len(values)) if self.last is None else np.flatnonzero(values != self.last)
+    self.last = values
+
+    for idx in changed.tolist():
+      v = values[idx]
+      self.params[idx].set(int(v) if self.ints[idx] else float(v))
+
+    if progress >= 1.0:
+      self.done = True
+
+class TweenEngine:
+  '''
+  Runs any number of tweens, applying all of them
+  in a single batched Server update per tick.
+
+  ie.
+
+  engine = TweenEngine(server)
+  engine.crossfade(get_values(params), store.load('scene2'), duration=5.0, easing='ease_in_out')
+
+  while True:
+    engine.update()
+    time.sleep(1.0/60)
+  '''
+
+  def __init__(self, server):
+    self.server = server
+    self.tweens = []
+
+  def crossfade(self, start, end, duration=1.0, easing='linear', start_time=None):
+    tween = Tween(self.server, start, end, duration=duration, easing=easing, start_time=start_time)
+    self.tweens.append(tween)
+    return tween
+
+  def cancel(self, tween):
+    if tween in self.tweens:
+      self.tweens.remove(tween)
+
+  def update(self, t=None):
+    '''
+    Applies all running tweens for time t (defaults to now)
+    and returns the number of tweens that are still running
+    '''
+    if not self.tweens:
+      return 0
+
+    t = time.time() if t is None else t
+    with self.server.batch():
+      for tween in self.tweens:
+        tween.apply(tween.progress(t))
+
+    self.tweens = [tween for tween in self.tweens if not tween.done]
+    return len(self.tweens)
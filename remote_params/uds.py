@@ -0,0 +1,433 @@
+'''
+Unix domain socket transport for high-rate control by processes on the
+same host.
+
+Every message is a frame with a u32 (little-endian) length prefix,
+followed by a payload starting with a one-byte message type:
+
+  'V' : value; <u16 path length> <path> <value> (see binary.pack_value)
+  'R' : partial array value; <u16 path length> <path> <u32 start index> <array value>
+  'S' : schema; utf-8 json (see schema_list)
+  'G' : schema request (client to server)
+  'U' : subscribe; <u32 length> <pattern> (client to server, see SubscriptionTrie)
+  'X' : unsubscribe; <u32 length> <pattern> (client to server)
+
+Frames written from any thread are gathered and sent in as few socket
+writes as possible (see FrameWriter).
+'''
+import logging, json, os, socket, threading
+from evento import Event
+
+from .params import Params
+from .server import Remote
+from .schema import get_path, apply_schema_list
+from .binary import U32, F64, pack_str, unpack_str, pack_path, unpack_path, pack_value, unpack_value, value_type
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SOCKET_PATH = '/tmp/remote_params.sock'
+READ_SIZE = 256*1024
+
+MSG_VALUE = ord('V')
+MSG_RANGE = ord('R')
+MSG_SCHEMA = ord('S')
+MSG_SCHEMA_REQUEST = ord('G')
+MSG_SUBSCRIBE = ord('U')
+MSG_UNSUBSCRIBE = ord('X')
+
+def pack_frame(payload):
+  return U32.pack(len(payload)) + payload
+
+_packed_paths = {}
+MAX_PACKED_PATHS = 10000
+
+def _pack_path(path):
+  packed = _packed_paths.get(path)
+  if packed is None:
+    if len(_packed_paths) >= MAX_PACKED_PATHS:
+      _packed_paths.clear()
+    packed = _packed_paths[path] = b'V' + pack_path(path)
+  return packed
+
+def value_frame(path, value, type_=None):
+  '''
+  Returns the value frame for the given path and value, or None when the
+  value can't be packed; the type is derived from the value when not specified
+  '''
+  if type_ is None:
+    # fast path for the most common (float) control values
+    if type(value) is float:
+      payload = _pack_path(path) + b'f' + F64.pack(value)
+      return U32.pack(len(payload)) + payload
+    type_ = value_type(value)
+    if type_ is None:
+      return None
+
+  payload = _pack_path(path) + pack_value(type_, value)
+  return U32.pack(len(payload)) + payload
+
+def range_frame(path, start, values):
+  return pack_frame(b'R' + pack_path(path) + U32.pack(start) + pack_value('a', values))
+
+def schema_frame(schema_data):
+  return pack_frame(b'S' + json.dumps(schema_data).encode('utf-8'))
+
+class FrameWriter:
+  '''
+  Batches frames written from any thread into as few socket writes as
+  possible; while the writer thread is sending, new frames accumulate
+  in a buffer that is sent with the next single write.
+  '''
+
+  def __init__(self, sock):
+    self.sock = sock
+    self.buffer = bytearray()
+    self.condition = threading.Condition(threading.Lock())
+    self.closed = False
+    self.thread = threading.Thread(target=self._run, daemon=True)
+    self.thread.start()
+
+  def write(self, data):
+    with self.condition:
+      if self.closed:
+        return
+      # the writer thread only waits for an empty buffer
+      if not self.buffer:
+        self.condition.notify()
+      self.buffer += data
+
+  def close(self):
+    with self.condition:
+      self.closed = True
+      self.condition.notify()
+
+  def _run(self):
+    while True:
+      with self.condition:
+        while not self.buffer and not self.closed:
+          self.condition.wait()
+        if self.closed and not self.buffer:
+          return
+        data = self.buffer
+        self.buffer = bytearray()
+
+      try:
+        self.sock.sendall(data)
+      except OSError as err:
+        logger.debug('[FrameWriter] write failed: {}'.format(err))
+        with self.condition:
+          self.closed = True
+        return
+
+def read_frames(sock, callback, batch=None):
+  '''
+  Reads frames from the given socket until the connection closes,
+  calling the given callback with every (complete) frame payload.
+
+  When a batch context manager factory is given (ie. Server.batch),
+  all frames received at once are processed in a single batch.
+  '''
+  buf = bytearray()
+  while True:
+    try:
+      chunk = sock.recv(READ_SIZE)
+    except OSError:
+      return
+    if not chunk:
+      return
+
+    buf += chunk
+    if batch is None:
+      offset = _read_buffered_frames(buf, callback)
+    else:
+      with batch():
+        offset = _read_buffered_frames(buf, callback)
+
+    if offset:
+      del buf[:offset]
+
+def _read_buffered_frames(buf, callback):
+  offset = 0
+  while len(buf) - offset >= U32.size:
+    size = U32.unpack_from(buf, offset)[0]
+    end = offset + U32.size + size
+    if end > len(buf):
+      break
+    callback(bytes(buf[offset+U32.size:end]))
+    offset = end
+  return offset
+
+class UnixSocketConnection:
+  '''
+  Server-side connection with a single client;
+  connects its own Remote instance to the Server
+  '''
+
+  def __init__(self, uds_server, sock):
+    self.uds_server = uds_server
+    self.server = uds_server.server
+    self.sock = sock
+    self.writer = FrameWriter(sock)
+    self.isActive = True
+
+    r = Remote(serialize=True)
+    r.outgoing.sendConnectConfirmationEvent += self.onSchemaToRemote
+    r.outgoing.sendSchemaEvent += self.onSchemaToRemote
+    r.outgoing.sendValueEvent += self.onValueToRemote
+    r.outgoing.sendDisconnectEvent += self.onDisconnectToRemote
+    self.remote = r
+
+    self.server.connect(self.remote)
+    self.thread = threading.Thread(target=self._read, daemon=True)
+    self.thread.start()
+
+  def _read(self):
+    try:
+      # coalesce the broadcasts of all values received at once
+      read_frames(self.sock, self.onPayload, batch=self.server.batch)
+    finally:
+      # also when reading failed, so the Remote doesn't stay connected
+      logger.debug('[UnixSocketConnection] connection closed')
+      self.disconnect()
+
+  def disconnect(self):
+    if not self.isActive:
+      return
+    self.isActive = False
+    self.server.disconnect(self.remote)
+    self._close()
+
+  def _close(self):
+    self.writer.close()
+    try:
+      self.sock.shutdown(socket.SHUT_RDWR)
+    except OSError:
+      pass
+    self.sock.close()
+    self.uds_server.onDisconnected(self)
+
+  def onPayload(self, payload):
+    if not payload:
+      logger.warning('[UnixSocketConnection] received empty message')
+      return
+
+    msg_type = payload[0]
+
+    try:
+      if msg_type == MSG_VALUE:
+        path, offset = unpack_path(payload, 1)
+        _, value, _ = unpack_value(payload, offset)
+        self.remote.incoming.valueEvent(path, value)
+        return
+
+      if msg_type == MSG_RANGE:
+        path, offset = unpack_path(payload, 1)
+        start = U32.unpack_from(payload, offset)[0]
+        _, values, _ = unpack_value(payload, offset+U32.size)
+        self.remote.incoming.valueRangeEvent(path, start, values)
+        return
+
+      if msg_type == MSG_SCHEMA_REQUEST:
+        self.remote.incoming.requestSchemaEvent()
+        return
+
+      if msg_type in (MSG_SUBSCRIBE, MSG_UNSUBSCRIBE):
+        pattern, _ = unpack_str(payload, 1)
+        if msg_type == MSG_SUBSCRIBE:
+          self.remote.incoming.subscribeEvent(pattern)
+        else:
+          self.remote.incoming.unsubscribeEvent(pattern)
+        return
+    except Exception as err:
+      logger.warning('[UnixSocketConnection] invalid message ({}): {}'.format(chr(msg_type), err))
+      return
+
+    logger.warning('[UnixSocketConnection] unknown message type: {}'.format(chr(msg_type)))
+
+  def onValueToRemote(self, path, value):
+    if not self.isActive: return
+    data = self.uds_server.encode_value(path, value)
+    if data is not None:
+      self.writer.write(data)
+
+  def onSchemaToRemote(self, schema_data):
+    if not self.isActive: return
+    self.writer.write(schema_frame(schema_data))
+
+  def onDisconnectToRemote(self):
+    # disconnected by the server
+    if not self.isActive: return
+    self.isActive = False
+    self._close()
+
+class UnixSocketServer:
+  '''
+  Accepts Unix domain socket connections and connects a Remote instance
+  to the given Server for every client (see UnixSocketClient).
+  '''
+
+  def __init__(self, server, path=DEFAULT_SOCKET_PATH, start=True):
+    self.server = server
+    self.path = path
+    self.connections = []
+    self.sock = None
+    self.thread = None
+    self.running = False
+    self.lock = threading.Lock()
+    # the same value is broadcasted to every connection; encode it only once
+    self._last_encoded = (None, None, None)
+
+    if start:
+      self.start()
+
+  def __del__(self):
+    self.stop()
+
+  def start(self):
+    if os.path.exists(self.path):
+      os.unlink(self.path)
+
+    self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    self.sock.bind(self.path)
+    self.sock.listen()
+    self.sock.settimeout(0.2)
+    self.running = True
+    self.thread = threading.Thread(target=self._accept, daemon=True)
+    self.thread.start()
+
+  def stop(self):
+    if not self.running:
+      return
+
+    self.running = False
+    if self.thread:
+      self.thread.join()
+      self.thread = None
+
+    for connection in list(self.connections):
+      connection.disconnect()
+
+    self.sock.close()
+    self.sock = None
+    if os.path.exists(self.path):
+      os.unlink(self.path)
+
+  def _accept(self):
+    while self.running:
+      try:
+        sock, _ = self.sock.accept()
+      except socket.timeout:
+        continue
+      except OSError:
+        return
+
+      sock.settimeout(None)
+      logger.debug('[UnixSocketServer] new connection')
+      connection = UnixSocketConnection(self, sock)
+      with self.lock:
+        self.connections.append(connection)
+
+  def onDisconnected(self, connection):
+    with self.lock:
+      if connection in self.connections:
+        self.connections.remove(connection)
+
+  def encode_value(self, path, value):
+    last_path, last_value, data = self._last_encoded
+    if path is last_path and value is last_value:
+      return data
+
+    data = value_frame(path, value)
+    if data is None:
+      logger.debug('[UnixSocketServer] can not encode value for {}'.format(path))
+    self._last_encoded = (path, value, data)
+    return data
+
+class UnixSocketClient:
+  '''
+  Client for UnixSocketServer, which keeps a mirror of the server's
+  params (see params) and sends values with batched writes.
+
+  ie.
+
+  client = UnixSocketClient('/tmp/remote_params.sock')
+  for i in range(100000):
+    client.send_value('/axis/x', i * 0.001)
+  '''
+
+  def __init__(self, path=DEFAULT_SOCKET_PATH, connect=True):
+    self.path = path
+    self.params = Params()
+    self.valueEvent = Event()
+    self.schemaEvent = Event()
+    self.sock = None
+    self.writer = None
+    self.thread = None
+
+    if connect:
+      self.connect()
+
+  def __del__(self):
+    self.close()
+
+  def connect(self):
+    self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    self.sock.connect(self.path)
+    self.writer = FrameWriter(self.sock)
+    self.thread = threading.Thread(target=read_frames, args=(self.sock, self.onPayload), daemon=True)
+    self.thread.start()
+
+  def close(self):
+    if not self.sock:
+      return
+    self.writer.close()
+    self.writer.thread.join()
+    try:
+      self.sock.shutdown(socket.SHUT_RDWR)
+    except OSError:
+      pass
+    self.sock.close()
+    self.sock = None
+
+  def send_value(self, path, value, type_=None):
+    data = value_frame(path, value, type_)
+    if data is None:
+      logger.warning('[UnixSocketClient.send_value] can not encode value for {}: {}'.format(path, value))
+      return
+    self.writer.write(data)
+
+  def send_range(self, path, start, values):
+    self.writer.write(range_frame(path, start, values))
+
+  def request_schema(self):
+    self.writer.write(pack_frame(b'G'))
+
+  def subscribe(self, pattern):
+    self.writer.write(pack_frame(b'U' + pack_str(pattern)))
+
+  def unsubscribe(self, pattern):
+    self.writer.write(pack_frame(b'X' + pack_str(pattern)))
+
+  def onPayload(self, payload):
+    if not payload:
+      logger.warning('[UnixSocketClient] received empty message')
+      return
+
+    msg_type = payload[0]
+
+    if msg_type == MSG_VALUE:
+      path, offset = unpack_path(payload, 1)
+      _, value, _ = unpack_value(payload, offset)
+      param = get_path(self.params, path)
+      if param is not None:
+        param.set(value)
+      self.valueEvent(path, value)
+      return
+
+    if msg_type == MSG_SCHEMA:
+      schema_data = json.loads(payload[1:].decode('utf-8'))
+      apply_schema_list(self.params, schema_data)
+      self.schemaEvent(schema_data)
+      return
+
+    logger.warning('[UnixSocketClient] unknown message type: {}'.format(chr(msg_type)))
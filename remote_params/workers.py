@@ -0,0 +1,200 @@
+import logging, asyncio, pickle, threading, queue, multiprocessing
+from multiprocessing.connection import wait
+
+from .server import Remote
+from .WebsocketServer import DEFAULT_PORT
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_WORKER_COUNT = 2
+# seconds to wait for all workers to serve
+DEFAULT_START_TIMEOUT = 30.0
+
+class WorkerPool:
+  '''
+  Serves the params of a Server through multiple worker processes, which
+  all accept websocket connections on the same port (SO_REUSEPORT, so the
+  kernel spreads connections over the workers; Linux and BSD only). This
+  spreads the per-client encoding and framing work over multiple cores.
+
+  Every worker keeps a Mirror of the params, updated with the schema and
+  value changes published by the pool over a pipe per worker (pickled once,
+  for all workers). Writes from the websocket clients of a worker are sent
+  back over its pipe and applied to the Server in this process.
+
+  ie.
+
+  pool = WorkerPool(server, port=8081, workers=4)
+  pool.start()
+  ...
+  pool.stop()
+  '''
+
+  def __init__(self, server, host='0.0.0.0', port=DEFAULT_PORT, workers=DEFAULT_WORKER_COUNT, **websocket_opts):
+    """
+    Parameters
+    ----------
+    workers : int
+      number of worker processes
+
+    websocket_opts :
+      additional WebsocketServer options (ie. compression)
+    """
+    self.server = server
+    self.host = host
+    self.port = port
+    self.count = workers
+    self.websocket_opts = websocket_opts
+
+    # (process, pipe connection, outgoing queue)
+    self.workers = []
+    self.threads = []
+    self.running = False
+
+    self.remote = Remote(serialize=True)
+    self.remote.outgoing.sendConnectConfirmationEvent += self._onSchema
+    self.remote.outgoing.sendSchemaEvent += self._onSchema
+    self.remote.outgoing.sendValueEvent += self._onValue
+
+  def start(self, timeout=DEFAULT_START_TIMEOUT):
+    '''
+    Starts the worker processes and waits until all of them serve
+    '''
+    ctx = multiprocessing.get_context('spawn')
+    opts = dict(self.websocket_opts, reuse_port=True)
+
+    for idx in range(self.count):
+      conn, child_conn = ctx.Pipe()
+      process = ctx.Process(target=run_worker, args=(child_conn, self.host, self.port, opts), daemon=True)
+      process.start()
+      child_conn.close()
+      self.workers.append((process, conn, queue.SimpleQueue()))
+
+    for process, conn, _ in self.workers:
+      try:
+        # a worker that died closed its pipe (poll returns True, recv raises)
+        ready = conn.poll(timeout) and pickle.loads(conn.recv_bytes()) == ('ready',)
+      except (EOFError, OSError):
+        ready = False
+
+      if not ready:
+        self.stop()
+        raise RuntimeError('[WorkerPool.start] worker {} failed to start'.format(process.pid))
+
+    self.running = True
+    for process, conn, q in self.workers:
+      self._startThread(self._pump, conn, q)
+    self._startThread(self._receive)
+
+    # sends the schema (see _onSchema)
+    self.server.connect(self.remote)
+    logger.info('[WorkerPool] {} workers serving on port {}'.format(len(self.workers), self.port))
+
+  def stop(self, timeout=5.0):
+    self.server.disconnect(self.remote)
+    self.running = False
+
+    stop_msg = pickle.dumps(('stop',))
+    for process, conn, q in self.workers:
+      if self.threads:
+        # sent by the pump, which must be the only thread writing to the pipe
+        q.put(stop_msg)
+      else:
+        # not pumping (yet), ie. when starting failed
+        try:
+          conn.send_bytes(stop_msg)
+        except (OSError, ValueError):
+          pass
+      q.put(None)
+
+    for thread in self.threads:
+      thread.join(timeout)
+    self.threads.clear()
+
+    for process, conn, q in self.workers:
+      process.join(timeout)
+      if process.is_alive():
+        process.terminate()
+      conn.close()
+    self.workers.clear()
+
+  def _startThread(self, func, *args):
+    thread = threading.Thread(target=func, args=args, daemon=True)
+    thread.start()
+    self.threads.append(thread)
+
+  def publish(self, msg):
+    '''
+    Sends the given message to all workers
+    '''
+    data = pickle.dumps(msg, protocol=pickle.HIGHEST_PROTOCOL)
+    for process, conn, q in self.workers:
+      q.put(data)
+
+  def _onSchema(self, schema_data):
+    self.publish(('schema', schema_data))
+
+  def _onValue(self, path, value):
+    self.publish(('value', path, value))
+
+  def _pump(self, conn, q):
+    # per worker, so a slow worker doesn't hold up the others (or the Server)
+    while True:
+      data = q.get()
+      if data is None:
+        return
+      try:
+        conn.send_bytes(data)
+      except (OSError, ValueError) as err:
+        logger.warning('[WorkerPool] failed to send to worker: {}'.format(err))
+        return
+
+  def _receive(self):
+    conns = [conn for process, conn, q in self.workers]
+    while self.running and conns:
+      for conn in wait(conns, timeout=0.5):
+        try:
+          msg = pickle.loads(conn.recv_bytes())
+        except (EOFError, OSError):
+          conns.remove(conn)
+          continue
+
+        if msg[0] == 'value':
+          self.remote.incoming.valueEvent(msg[1], msg[2])
+
+def run_worker(conn, host, port, websocket_opts):
+  '''
+  Entry point of a worker process (see WorkerPool)
+  '''
+  from .relay import Mirror
+
+  async def main():
+    mirror = Mirror(host=host, port=port, **websocket_opts)
+    mirror.writeEvent += lambda path, value: conn.send_bytes(pickle.dumps(('value', path, value)))
+    await mirror.start_async()
+
+    stopped = asyncio.Event()
+
+    def receive():
+      while conn.poll():
+        try:
+          msg = pickle.loads(conn.recv_bytes())
+        except (EOFError, OSError):
+          msg = ('stop',)
+
+        if msg[0] == 'value':
+          mirror.apply_value(msg[1], msg[2])
+        elif msg[0] == 'schema':
+          mirror.apply_schema(msg[1])
+        elif msg[0] == 'stop':
+          stopped.set()
+          return
+
+    loop = asyncio.get_event_loop()
+    loop.add_reader(conn.fileno(), receive)
+    conn.send_bytes(pickle.dumps(('ready',)))
+    await stopped.wait()
+    loop.remove_reader(conn.fileno())
+    mirror.stop()
+
+  asyncio.run(main())
@@ -0,0 +1,176 @@
+#!/usr/bin/env python
+import unittest, threading
+from remote_params import Params, Dispatcher
+
+class TestDispatcher(unittest.TestCase):
+  def test_handles(self):
+    params = Params()
+    x = params.float('x')
+    sub = Params()
+    y = sub.int('y')
+    params.group('sub', sub)
+
+    d = params.dispatcher
+    self.assertIs(x.dispatcher, d)
+    self.assertIs(sub.dispatcher, d)
+    self.assertIs(y.dispatcher, d)
+    self.assertEqual(len(set([params.handle, x.handle, sub.handle, y.handle])), 4)
+    self.assertEqual(d.path(y.handle), '/sub/y')
+    self.assertEqual(d.path(y.handle, sub.handle), '/y')
+    self.assertIs(d.owner(y.handle), sub)
+    self.assertIsNone(d.owner(params.handle))
+
+  def test_subscribe_per_handle_and_subtree(self):
+    params = Params()
+    x = params.float('x')
+    sub = Params()
+    params.group('sub', sub)
+    y = sub.int('y')
+
+    log = []
+    d = params.dispatcher
+    d.subscribe(y.handle, lambda path, value, param: log.append(('y', path, value)))
+    d.subscribe(sub.handle, lambda path, value, param: log.append(('sub', path, value)))
+    unsubscribe = d.subscribe(params.handle, lambda path, value, param: log.append(('root', path, value)))
+
+    y.set(3)
+    self.assertEqual(log, [('y', '', 3), ('sub', '/y', 3), ('root', '/sub/y', 3)])
+
+    del log[:]
+    unsubscribe()
+    x.set(1.0)
+    y.set(4)
+    self.assertEqual(log, [('y', '', 4), ('sub', '/y', 4)])
+
+  def test_group_events(self):
+    params = Params()
+    sub = Params()
+    params.group('sub', sub)
+    y = sub.int('y')
+
+    values, sub_values = [], []
+    params.valueChangeEvent += lambda path, value, param: values.append((path, value))
+    sub.valueChangeEvent += lambda path, value, param: sub_values.append((path, value))
+    count = params.version
+
+    y.set(5)
+    self.assertEqual(values, [('/sub/y', 5)])
+    self.assertEqual(sub_values, [('/y', 5)])
+    self.assertEqual(params.version, count + 1)
+
+  def test_lazy_param_change_event(self):
+    params = Params()
+    x = params.float('x')
+    self.assertIsNone(x._changeEvent)
+    x.set(1.0)
+    x.set(2.0)
+    self.assertIsNone(x._changeEvent)
+    self.assertEqual(x.version, 2)
+
+    # created on first use; notifies about later changes
+    log = []
+    x.changeEvent += lambda: log.append(x.val())
+    x.set(3.0)
+    self.assertEqual(log, [3.0])
+
+  def test_moves_subtree_with_subscriptions(self):
+    sub = Params()
+    y = sub.int('y')
+    log = []
+    sub.dispatcher.subscribe(y.handle, lambda path, value, param: log.append(value))
+
+    params = Params()
+    params.group('sub', sub)
+    self.assertIs(y.dispatcher, params.dispatcher)
+    y.set(1)
+    self.assertEqual(log, [1])
+
+    # a removed group gets its own dispatcher
+    values = []
+    params.valueChangeEvent += lambda path, value, param: values.append(path)
+    params.remove('sub')
+    self.assertIsNot(sub.dispatcher, params.dispatcher)
+    self.assertIs(y.dispatcher, sub.dispatcher)
+    y.set(2)
+    self.assertEqual(log, [1, 2])
+    self.assertEqual(values, [])
+
+  def test_remove_param(self):
+    params = Params()
+    x = params.float('x')
+    handle = x.handle
+    params.remove('x')
+    self.assertIsNone(x.dispatcher)
+    x.set(1.0) # no notifications
+
+    # handles are reused
+    y = params.float('y')
+    self.assertEqual(y.handle, handle)
+    self.assertEqual(len(params.dispatcher), 2)
+
+  def test_cached_paths_follow_regrouping(self):
+    sub = Params()
+    y = sub.int('y')
+    paths = []
+    sub.valueChangeEvent += lambda path, value, param: paths.append(path)
+    y.set(1)
+    self.assertEqual(sub.dispatcher.path(y.handle), '/y')
+
+    params = Params()
+    params.group('sub', sub)
+    root_paths = []
+    params.valueChangeEvent += lambda path, value, param: root_paths.append(path)
+    y.set(2)
+    self.assertEqual(params.dispatcher.path(y.handle), '/sub/y')
+    self.assertEqual(paths, ['/y', '/y'])
+    self.assertEqual(root_paths, ['/sub/y'])
+
+    other = Params()
+    params.remove('sub')
+    other.group('other', sub)
+    y.set(3)
+    self.assertEqual(other.dispatcher.path(y.handle), '/other/y')
+    self.assertEqual(root_paths, ['/sub/y'])
+
+  def test_batch_coalesces_group_changes(self):
+    params = Params()
+    sub = Params()
+    params.group('sub', sub)
+    x, y = sub.int('x'), sub.int('y')
+    count, sub_count = params.version, sub.version
+
+    values = []
+    params.valueChangeEvent += lambda path, value, param: values.append(path)
+    with params.dispatcher.batch():
+      x.set(1)
+      y.set(2)
+      x.set(3)
+      # value changes are not deferred
+      self.assertEqual(values, ['/sub/x', '/sub/y', '/sub/x'])
+      self.assertEqual(params.version, count)
+
+    self.assertEqual(params.version, count + 1)
+    self.assertEqual(sub.version, sub_count + 1)
+
+  def test_batch_is_per_thread(self):
+    params = Params()
+    x, y = params.int('x'), params.int('y')
+    count = params.version
+
+    with params.dispatcher.batch():
+      x.set(1)
+      thread = threading.Thread(target=lambda: y.set(2))
+      thread.start()
+      thread.join()
+      self.assertEqual(params.version, count + 1)
+    self.assertEqual(params.version, count + 2)
+
+  def test_single_owner(self):
+    x = Params().float('x')
+    params = Params()
+    self.assertIsNone(params.append('x', x))
+    self.assertEqual(len(params), 0)
+
+# run just the tests in this file
+if __name__ == '__main__':
+    unittest.main()
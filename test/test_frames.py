@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+import unittest
+from remote_params import Params, FramePool
+
+class TestFramePool(unittest.TestCase):
+  def test_acquire_and_release(self):
+    pool = FramePool((2, 2, 3), size=2, max_size=3)
+    a = pool.acquire()
+    b = pool.acquire()
+    self.assertIsNot(a, b)
+    self.assertEqual(a.shape, (2, 2, 3))
+    self.assertEqual(pool.available(), 0)
+
+    c = pool.acquire() # grows
+    self.assertEqual(len(pool), 3)
+    self.assertIsNone(pool.acquire()) # max_size reached
+
+    pool.release(b)
+    self.assertIs(pool.acquire(), b)
+
+  def test_retain(self):
+    pool = FramePool((2, 2), size=1)
+    a = pool.acquire()
+    pool.retain(a)
+    pool.release(a)
+    self.assertEqual(pool.refcount(a), 1)
+    self.assertIsNot(pool.acquire(), a)
+    pool.release(a)
+    self.assertEqual(pool.refcount(a), 0)
+    self.assertFalse(pool.retain(a.copy())) # not from this pool
+
+class TestImageParamPool(unittest.TestCase):
+  def test_publish(self):
+    param = Params().image('cam')
+    pool = param.create_pool((2, 2, 3), size=2)
+
+    first = param.acquire()
+    first[:] = 1
+    param.publish(first)
+    self.assertIs(param.val(), first)
+    self.assertEqual(pool.refcount(first), 1) # held by the param
+    self.assertEqual(param.version, 1)
+
+    # the current frame is not reused
+    second = param.acquire()
+    self.assertIsNot(second, first)
+    second[:] = 2
+    param.publish(second)
+    self.assertEqual(pool.refcount(first), 0)
+    self.assertEqual(pool.refcount(second), 1)
+
+    # a retained frame is not reused
+    retained = param.retain()
+    third = param.acquire()
+    third[:] = 3
+    param.publish(third)
+    self.assertIsNot(param.acquire(), retained)
+    param.release(retained)
+    self.assertEqual(pool.refcount(retained), 0)
+
+  def test_publish_duplicate(self):
+    param = Params().image('cam')
+    pool = param.create_pool((2, 2), size=2)
+    first = param.acquire()
+    param.publish(first)
+
+    second = param.acquire() # same (zero) content
+    param.publish(second)
+    self.assertIs(param.val(), first)
+    self.assertEqual(pool.refcount(second), 0)
+    self.assertEqual(param.version, 1)
+
+  def test_serialized_frame_is_retained(self):
+    param = Params().image('cam')
+    pool = param.create_pool((2, 2), size=2)
+    frame = param.acquire()
+    param.publish(frame)
+
+    refs = []
+    param.serialize_value = lambda value: refs.append(pool.refcount(value))
+    param.get_serialized()
+    # retained while serializing, in addition to the param's reference
+    self.assertEqual(refs, [2])
+    self.assertEqual(pool.refcount(frame), 1)
+
+# run just the tests in this file
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+import unittest, json, time
+from remote_params import Params, Server, HttpServer, History, query_history
+
+class MockRequest:
+  def __init__(self, path, query):
+    self.path = path + '?' + query
+    self.query = query
+    self.responses = []
+
+  def respond(self, code, content, headers=None):
+    self.responses.append((code, content))
+
+class TestHistory(unittest.TestCase):
+  def test_ring_buffer(self):
+    history = History(size=4)
+    for i in range(6):
+      history.add(float(i), t=100.0 + i)
+
+    self.assertEqual(len(history), 4)
+    times, values = history.samples()
+    self.assertEqual(times.tolist(), [102.0, 103.0, 104.0, 105.0])
+    self.assertEqual(values.tolist(), [2.0, 3.0, 4.0, 5.0])
+    times, values = history.samples(start=103.0, end=104.0)
+    self.assertEqual(values.tolist(), [3.0, 4.0])
+
+  def test_query_buckets(self):
+    history = History(size=100)
+    for i, v in enumerate([1.0, 3.0, 5.0, 7.0, 8.0]):
+      history.add(v, t=10.0 + i)
+
+    # window 10..15 in 5 buckets of 1 second
+    data = history.query(window=5.0, buckets=5, end=15.0)
+    self.assertAlmostEqual(data['end'] - data['start'], 5.0)
+    self.assertEqual(data['count'], [1, 1, 1, 1, 1])
+    self.assertEqual(data['mean'], [1.0, 3.0, 5.0, 7.0, 8.0])
+
+    data = history.query(window=4.0, buckets=2, end=13.5)
+    self.assertEqual(data['count'], [2, 2])
+    self.assertEqual(data['min'], [1.0, 5.0])
+    self.assertEqual(data['max'], [3.0, 7.0])
+    self.assertEqual(data['mean'], [2.0, 6.0])
+
+    data = history.query(window=4.0, buckets=4, end=30.0)
+    self.assertEqual(data['count'], [0, 0, 0, 0])
+    self.assertEqual(data['mean'], [None] * 4)
+    self.assertRaises(ValueError, history.query, 0.0)
+    self.assertRaises(ValueError, history.query, float('inf'))
+    self.assertRaises(ValueError, history.query, float('nan'))
+
+  def test_param_history(self):
+    params = Params()
+    x = params.float('x')
+    x.set(1.0)
+    history = x.enable_history(size=10)
+    self.assertIs(x.enable_history(), history)
+    self.assertEqual(x.to_dict()['opts'], {'history': 10})
+    x.set(2.0)
+    x.set(2.0) # no change
+    self.assertEqual(history.samples()[1].tolist(), [1.0, 2.0])
+    self.assertIsNone(params.string('name').enable_history())
+
+    data = query_history(params, '/x', 60.0, 1)
+    self.assertEqual(data['count'], [2])
+    # monotonic sample times, wall clock window
+    self.assertLess(abs(data['end'] - time.time()), 1.0)
+    self.assertEqual(data['mean'], [1.5])
+    self.assertIsNone(query_history(params, '/name'))
+    self.assertIsNone(query_history(params, '/foo'))
+
+  def test_http_history(self):
+    params = Params()
+    params.int('level').enable_history()
+    params.get('level').set(3)
+    http_server = HttpServer(Server(params), startServer=False)
+
+    req = MockRequest('/params/history', 'path=/level&window=60&buckets=3')
+    http_server.onHttpRequest(req)
+    code, content = req.responses[0]
+    self.assertEqual(code, 200)
+    self.assertEqual(json.loads(content)['max'][-1], 3)
+
+    req = MockRequest('/params/history', 'path=/foo')
+    http_server.onHttpRequest(req)
+    self.assertEqual(req.responses[0][0], 404)
+
+    req = MockRequest('/params/history', 'path=/level&window=x')
+    http_server.onHttpRequest(req)
+    self.assertEqual(req.responses[0][0], 400)
+
+    req = MockRequest('/params/history', 'path=/level&window=inf')
+    http_server.onHttpRequest(req)
+    self.assertEqual(req.responses[0][0], 400)
+
+# run just the tests in this file
+if __name__ == '__main__':
+    unittest.main()
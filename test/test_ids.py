@@ -0,0 +1,62 @@
+#!/usr/bin/env python
+import unittest
+from remote_params import Params, Server, Remote, IdTable
+
+class TestIdTable(unittest.TestCase):
+  def test_ids(self):
+    params = Params()
+    name = params.string('name')
+    sub = Params()
+    x = sub.float('x')
+    params.group('sub', sub)
+
+    ids = IdTable(params)
+    self.assertEqual(ids.to_list(), ['/name', '/sub/x'])
+    self.assertEqual(ids.id('/sub/x'), 1)
+    self.assertIsNone(ids.id('/foo'))
+    self.assertIs(ids.param(0), name)
+    self.assertIs(ids.param(1), x)
+    self.assertIsNone(ids.param(2))
+    self.assertIsNone(ids.param('1'))
+    self.assertEqual(ids.path(1), '/sub/x')
+
+  def test_append_only(self):
+    params = Params()
+    params.string('name')
+    params.int('age')
+    ids = IdTable(params)
+    self.assertEqual(len(ids), 2)
+    version = ids.version
+
+    params.remove('name')
+    params.float('x')
+    ids.invalidate()
+    self.assertEqual(ids.to_list(), ['/name', '/age', '/x'])
+    self.assertEqual(ids.version, version + 1)
+    self.assertIsNone(ids.param(0))
+
+    # a param at a known path gets its previous id back
+    name = params.string('name')
+    ids.invalidate()
+    self.assertIs(ids.param(0), name)
+    self.assertEqual(ids.version, version + 1)
+
+  def test_server_resolves_ids(self):
+    params = Params()
+    params.string('name')
+    server = Server(params)
+    r = Remote()
+    server.connect(r)
+
+    r.incoming.valueIdEvent(0, 'Bob')
+    self.assertEqual(params.get('name').val(), 'Bob')
+
+    # the server updates its ids after schema changes
+    params.int('age')
+    r.incoming.valueIdEvent(1, 5)
+    self.assertEqual(params.get('age').val(), 5)
+    r.incoming.valueIdEvent(2, 5) # unknown
+
+# run just the tests in this file
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,61 @@
+#!/usr/bin/env python
+import unittest, json
+import numpy as np
+from remote_params import TileDeltaEncoder, TileDeltaDecoder, changed_tiles
+
+class TestImageDelta(unittest.TestCase):
+  def setUp(self):
+    self.frame = np.zeros((100, 130, 3), dtype=np.uint8)
+
+  def test_changed_tiles(self):
+    frame = self.frame.copy()
+    frame[5, 5, 0] = 1
+    frame[99, 129, 2] = 1 # in the (partial) bottom-right tile
+    self.assertEqual(changed_tiles(self.frame, frame, 32).tolist(), [[0, 0], [3, 4]])
+
+  def test_encode_and_decode(self):
+    encoder = TileDeltaEncoder(tile_size=32, format='raw')
+    decoder = TileDeltaDecoder()
+
+    delta = encoder.encode(self.frame)
+    self.assertTrue(delta['keyframe'])
+    self.assertEqual(len(delta['tiles']), 1)
+    self.assertTrue(np.array_equal(decoder.apply(json.loads(json.dumps(delta))), self.frame))
+
+    # unchanged
+    self.assertIsNone(encoder.encode(self.frame.copy()))
+
+    frame = self.frame.copy()
+    frame[40:42, 70:72] = 255
+    delta = encoder.encode(frame)
+    self.assertFalse(delta['keyframe'])
+    self.assertEqual([tile[0:4] for tile in delta['tiles']], [[64, 32, 32, 32]])
+    self.assertTrue(np.array_equal(decoder.apply(json.loads(json.dumps(delta))), frame))
+
+  def test_keyframes(self):
+    encoder = TileDeltaEncoder(tile_size=32, keyframe_interval=2, format='raw')
+    frame = self.frame.copy()
+    keyframes = []
+    for i in range(6):
+      frame[0, 0, 0] = i + 1
+      keyframes.append(encoder.encode(frame)['keyframe'])
+    self.assertEqual(keyframes, [True, False, False, True, False, False])
+
+    # mostly changed
+    self.assertTrue(encoder.encode(np.full((100, 130, 3), 9, dtype=np.uint8))['keyframe'])
+    # different shape
+    self.assertTrue(encoder.encode(np.zeros((10, 10), dtype=np.uint8))['keyframe'])
+
+  def test_decoder_waits_for_keyframe(self):
+    encoder = TileDeltaEncoder(tile_size=32, format='raw')
+    decoder = TileDeltaDecoder()
+    encoder.encode(self.frame)
+
+    frame = self.frame.copy()
+    frame[0, 0, 0] = 1
+    self.assertIsNone(decoder.apply(encoder.encode(frame)))
+    self.assertTrue(np.array_equal(decoder.apply(encoder.keyframe()), frame))
+
+# run just the tests in this file
+if __name__ == '__main__':
+    unittest.main()
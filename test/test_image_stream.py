@@ -0,0 +1,42 @@
+#!/usr/bin/env python
+import unittest
+import numpy as np
+from remote_params import AdaptiveImageEncoder, scale_frame
+
+def fake_encode(frame, quality):
+  # size grows with resolution and quality
+  return 'x' * (frame.shape[0] * frame.shape[1] * quality // 100)
+
+class TestAdaptiveImageEncoder(unittest.TestCase):
+  def test_adapts_quality_then_scale(self):
+    encoder = AdaptiveImageEncoder(target_fps=10, min_quality=20, max_quality=80, encode=fake_encode)
+    frame = np.zeros((100, 100), dtype=np.uint8)
+
+    # no estimate yet
+    self.assertEqual(len(encoder.encode(frame)), 8000)
+    self.assertEqual((encoder.quality, encoder.scale), (80, 1.0))
+
+    # 10KB/s at 10 fps; 1000 bytes per frame
+    for i in range(6):
+      encoder.encode(frame, 10000)
+    self.assertEqual(encoder.quality, 20)
+    self.assertEqual(encoder.scale, 1.0)
+
+    for i in range(10):
+      encoder.encode(frame, 10000)
+    self.assertLess(encoder.scale, 1.0)
+    self.assertLessEqual(len(encoder.encode(frame, 10000)), 1000)
+
+    # fast connection; back to full resolution and quality
+    for i in range(20):
+      encoder.encode(frame, 10000000)
+    self.assertEqual((encoder.quality, encoder.scale), (80, 1.0))
+
+  def test_scale_frame(self):
+    frame = np.zeros((100, 60, 3), dtype=np.uint8)
+    self.assertIs(scale_frame(frame, 1.0), frame)
+    self.assertEqual(scale_frame(frame, 0.5).shape, (50, 30, 3))
+
+# run just the tests in this file
+if __name__ == '__main__':
+    unittest.main()
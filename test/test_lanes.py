@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+import unittest, asyncio, asynctest
+from remote_params import Params, PriorityLanes, BandwidthEstimator, priority_of, PRIORITY_HIGH, PRIORITY_NORMAL, PRIORITY_BULK
+
+class TestPriorityOf(unittest.TestCase):
+  def test_type_defaults_and_override(self):
+    params = Params()
+    self.assertEqual(priority_of(params.void('trigger')), PRIORITY_HIGH)
+    self.assertEqual(priority_of(params.float('fader')), PRIORITY_HIGH)
+    self.assertEqual(priority_of(params.string('name')), PRIORITY_NORMAL)
+    self.assertEqual(priority_of(params.image('cam')), PRIORITY_BULK)
+
+    name = params.get('name')
+    name.priority = PRIORITY_BULK
+    self.assertEqual(priority_of(name), PRIORITY_BULK)
+
+class TestPriorityLanes(asynctest.TestCase):
+  async def test_high_priority_preempts_queued_bulk(self):
+    sent = []
+    gate = asyncio.Event()
+    async def send(msg):
+      sent.append(msg)
+      await gate.wait()
+
+    lanes = PriorityLanes(send)
+    lanes.put('image1', PRIORITY_BULK)
+    lanes.put('image2', PRIORITY_BULK)
+    await asyncio.sleep(0)
+    # image1 is being sent
+    self.assertEqual(sent, ['image1'])
+
+    lanes.put('name', PRIORITY_NORMAL)
+    lanes.put('fader', PRIORITY_HIGH)
+    gate.set()
+    await asyncio.sleep(0.01)
+    self.assertEqual(sent, ['image1', 'fader', 'name', 'image2'])
+    self.assertEqual(len(lanes), 0)
+    lanes.close()
+
+  async def test_failed_send_drops_queue(self):
+    async def send(msg):
+      raise ConnectionError('closed')
+
+    lanes = PriorityLanes(send)
+    lanes.put('a')
+    lanes.put('b')
+    await asyncio.sleep(0)
+    self.assertTrue(lanes.closed)
+    self.assertEqual(len(lanes), 0)
+    lanes.put('c') # ignored
+    self.assertEqual(len(lanes), 0)
+
+  async def test_put_latest_replaces_pending(self):
+    sent = []
+    async def send(msg):
+      sent.append(msg)
+
+    discarded = []
+    class Frame:
+      def __init__(self, name):
+        self.name = name
+      def __call__(self):
+        return self.name
+      def discard(self):
+        discarded.append(self.name)
+
+    lanes = PriorityLanes(send)
+    lanes.put_latest('/cam', Frame('frame1'))
+    lanes.put('name', PRIORITY_NORMAL)
+    lanes.put_latest('/cam', Frame('frame2'))
+    lanes.put_latest('/cam', Frame('frame3'))
+    await asyncio.sleep(0)
+    self.assertEqual(sent, ['name', 'frame3'])
+    self.assertEqual(discarded, ['frame1', 'frame2'])
+    self.assertEqual(lanes.dropped, 2)
+
+    # pending frames are discarded on close
+    lanes.put_latest('/cam', Frame('frame4'))
+    lanes.close()
+    self.assertEqual(discarded, ['frame1', 'frame2', 'frame4'])
+
+class TestBandwidthEstimator(unittest.TestCase):
+  def test_moving_average(self):
+    bw = BandwidthEstimator(alpha=0.5, min_size=1000)
+    self.assertIsNone(bw.rate)
+    self.assertFalse(bw.add(100, 1.0)) # too small
+    self.assertTrue(bw.add(1000, 1.0))
+    self.assertEqual(bw.rate, 1000)
+    bw.add(3000, 1.0)
+    self.assertEqual(bw.rate, 2000)
+
+# run just the tests in this file
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,51 @@
+#!/usr/bin/env python
+import unittest, asyncio
+from remote_params.loadtest import percentile, LatencyHistogram, LoadStats, encode_sample, decode_sample, run_load_test
+
+class TestLoadTest(unittest.TestCase):
+  def test_percentile(self):
+    values = list(range(1, 1001))
+    self.assertEqual(percentile(values, 50), 500)
+    self.assertEqual(percentile(values, 99), 990)
+    self.assertEqual(percentile(values, 99.9), 999)
+    self.assertEqual(percentile(values, 100), 1000)
+    self.assertIsNone(percentile([], 50))
+
+  def test_latency_histogram(self):
+    histogram = LatencyHistogram(precision=0.01)
+    values = [i / 1000.0 for i in range(1, 1001)]
+    histogram.extend(values)
+    self.assertEqual(len(histogram.buckets), len(LatencyHistogram(precision=0.01).buckets))
+    for p in (50, 99, 99.9):
+      self.assertAlmostEqual(histogram.percentile(p), percentile(values, p), delta=percentile(values, p) * 0.01)
+    self.assertEqual(histogram.percentile(100), 1.0)
+    self.assertEqual(histogram.summary()['max'], 1.0)
+    self.assertIsNone(LatencyHistogram().percentile(50))
+
+  def test_stats(self):
+    stats = LoadStats()
+    stats.add_sent(2)
+    stats.add_received(encode_sample(3, 7))
+    self.assertEqual(decode_sample(encode_sample(3, 7))[0:2], (3, 7))
+
+    sent, received, latencies = stats.take()
+    self.assertEqual((sent, received, len(latencies)), (2, 1, 1))
+    self.assertEqual(stats.take()[0:2], (0, 0))
+    self.assertEqual(stats.total_sent, 2)
+    self.assertEqual(stats.histogram.count, 1)
+
+  def test_run(self):
+    reports = []
+    result = asyncio.run(run_load_test(ws_clients=3, subscribers=2, writers=1, rate=20.0,
+      duration=1.0, interval=0.5, drain=0.5, ws_port=8093, report=reports.append))
+
+    self.assertEqual(len(reports), 2)
+    self.assertEqual(result['subscribers'], 2)
+    self.assertTrue(result['sent'] >= 15)
+    self.assertEqual(result['expected'], result['sent'] * 2)
+    self.assertEqual(result['dropped'], 0)
+    self.assertTrue(result['p50'] <= result['p99'] <= result['p999'])
+
+# run just the tests in this file
+if __name__ == '__main__':
+    unittest.main()
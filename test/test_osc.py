@@ -1,7 +1,9 @@
 #!/usr/bin/env python
 import unittest
+import numpy as np
 import json
-from remote_params import Params, Server, Remote, create_sync_params, OscServer, schema_list
+from oscpy.parser import format_message
+from remote_params import Params, Server, Remote, create_sync_params, OscServer, FragmentAssembler, schema_list
 
 class TestOsc(unittest.TestCase):
   def test_osc_server_choreography(self):
@@ -31,7 +33,7 @@ class TestOsc(unittest.TestCase):
     osc_server.receive('/params/connect', ['127.0.0.1:8081'])
     # verify a connect confirmation was sent
     self.assertEqual(send_log, [
-      ('127.0.0.1', 8081, '/params/connect/confirm', (json.dumps(schema_list(params))))])
+      ('127.0.0.1', 8081, '/params/connect/confirm', (json.dumps(schema_list(params)),))])
 
     #
     # Client sends new value
@@ -60,7 +62,7 @@ class TestOsc(unittest.TestCase):
     send_log.clear()
     params.int('age')
     self.assertEqual(send_log, [
-      ('127.0.0.1', 8081, '/params/schema', (json.dumps(schema_list(params))))])
+      ('127.0.0.1', 8081, '/params/schema', (json.dumps(schema_list(params)),))])
 
     #
     # Client requests schema
@@ -69,7 +71,10 @@ class TestOsc(unittest.TestCase):
     osc_server.receive('/params/schema', ['192.168.1.2:8080'])
     # verify response
     self.assertEqual(send_log, [
-      ('192.168.1.2', 8080, '/params/schema', (json.dumps(schema_list(params))))])
+      ('192.168.1.2', 8080, '/params/schema', (json.dumps(schema_list(params)),))])
+    # the json is sent as a single string argument
+    message, _ = format_message(b'/params/schema', send_log[0][3], encoding='utf8')
+    self.assertTrue(message.startswith(b'/params/schema\0\0,s\0\0'))
 
     #
     # Client disconnected by server
@@ -85,6 +90,182 @@ class TestOsc(unittest.TestCase):
 
 
 
+  def test_subscriptions(self):
+    params = Params()
+    params.string('name')
+    params.int('age')
+    server = Server(params)
+
+    send_log = []
+    def capture(host, port, addr, args):
+      send_log.append((host,port,addr,args))
+
+    osc_server = OscServer(server, capture_sends=capture, listen=False)
+    osc_server.receive('/params/connect', ['127.0.0.1:8081'])
+    osc_server.receive('/params/subscribe', ['127.0.0.1:8081', '/age'])
+
+    send_log.clear()
+    params.get('name').set('Fab')
+    params.get('age').set(5)
+    self.assertEqual(send_log, [
+      ('127.0.0.1', 8081, '/params/value', ('/age', 5))])
+
+    osc_server.receive('/params/unsubscribe', ['127.0.0.1:8081', '/age'])
+    send_log.clear()
+    params.get('age').set(6)
+    self.assertEqual(send_log, [])
+
+  def test_array_values(self):
+    params = Params()
+    p = params.vec2('pos')
+    server = Server(params)
+
+    send_log = []
+    def capture(host, port, addr, args):
+      send_log.append((host,port,addr,args))
+
+    osc_server = OscServer(server, capture_sends=capture, listen=False)
+    osc_server.receive('/params/connect', ['127.0.0.1:8081'])
+    send_log.clear()
+
+    # sent as blob
+    p.set([1.0, 2.0])
+    self.assertEqual(send_log, [
+      ('127.0.0.1', 8081, '/params/value', ('/pos', bytearray(np.array([1.0, 2.0], dtype='<f4').tobytes())))])
+
+    # received as blob
+    osc_server.receive('/params/value', ['/pos', np.array([3.0, 4.0], dtype='<f4').tobytes()])
+    self.assertEqual(p.val().tolist(), [3.0, 4.0])
+
+    # partial update
+    osc_server.receive('/params/range', ['/pos', 1, 5.0])
+    self.assertEqual(p.val().tolist(), [3.0, 5.0])
+
+  def test_fragmented_schema(self):
+    params = Params()
+    for i in range(10):
+      params.float('value{}'.format(i)).set(i)
+    server = Server(params)
+
+    send_log = []
+    def capture(host, port, addr, args):
+      send_log.append((host,port,addr,args))
+
+    osc_server = OscServer(server, capture_sends=capture, listen=False, max_fragment_size=100)
+    osc_server.receive('/params/connect', ['127.0.0.1:8081'])
+
+    self.assertTrue(len(send_log) > 1)
+    self.assertTrue(all(addr == '/params/connect/confirm/fragment' for host, port, addr, args in send_log))
+
+    # reassemble, with one missing fragment
+    assembler = FragmentAssembler()
+    transfer_id = send_log[0][3][0]
+    for host, port, addr, args in send_log[1:]:
+      self.assertIsNone(assembler.add(*args))
+    self.assertEqual(assembler.missing(transfer_id), [0])
+
+    # request retransmission
+    send_log.clear()
+    osc_server.receive('/params/confirm', ['127.0.0.1:8081', transfer_id, 0])
+    self.assertEqual(len(send_log), 1)
+    text = assembler.add(*send_log[0][3])
+    self.assertEqual(json.loads(text), schema_list(params))
+
+    # acknowledge
+    osc_server.receive('/params/confirm', ['127.0.0.1:8081', transfer_id])
+    self.assertNotIn(transfer_id, osc_server.transfers)
+
+  def test_interned_ids(self):
+    params = Params()
+    params.string('name')
+    params.int('age')
+    server = Server(params)
+    send_log = []
+    osc_server = OscServer(server, capture_sends=lambda host, port, addr, args: send_log.append((addr, args)), listen=False)
+    osc_server.receive('/params/connect', ['127.0.0.1:8081'])
+
+    # client requests the id table
+    send_log.clear()
+    osc_server.receive('/params/ids', ['127.0.0.1:8081'])
+    self.assertEqual(send_log, [('/params/ids', (json.dumps(['/name', '/age']),))])
+
+    # values in both directions use ids
+    send_log.clear()
+    osc_server.receive('/params/v', [1, 42])
+    self.assertEqual(params.get('age').val(), 42)
+    self.assertEqual(send_log, [('/params/v', (1, 42))])
+
+    # unknown ids are ignored
+    send_log.clear()
+    osc_server.receive('/params/v', [7, 'x'])
+    self.assertEqual(send_log, [])
+
+    # new params get new ids, which are sent after the schema
+    send_log.clear()
+    params.remove('name')
+    params.float('x')
+    self.assertEqual([addr for addr, args in send_log], ['/params/schema', '/params/schema', '/params/ids'])
+    self.assertEqual(send_log[-1][1], (json.dumps(['/name', '/age', '/x']),))
+    send_log.clear()
+    osc_server.receive('/params/v', [0, 'gone'])
+    osc_server.receive('/params/v', [2, 0.5])
+    self.assertEqual(send_log, [('/params/v', (2, 0.5))])
+
+  def test_no_eviction_by_default(self):
+    params = Params()
+    params.int('age')
+    server = Server(params)
+    send_log = []
+    osc_server = OscServer(server, capture_sends=lambda host, port, addr, args: send_log.append((port, addr)), listen=False)
+
+    # a (legacy) client that only sends values, which don't identify it
+    osc_server.receive('/params/connect', ['127.0.0.1:8081'])
+    connection = osc_server.connections['127.0.0.1:8081']
+    for i in range(3):
+      osc_server.receive('/params/value', ['/age', i])
+    send_log.clear()
+    osc_server.heartbeat(connection.last_seen + 60.0)
+
+    self.assertEqual(list(osc_server.connections), ['127.0.0.1:8081'])
+    self.assertTrue(connection.isActive)
+    params.get('age').set(5)
+    self.assertEqual(send_log, [(8081, '/params/heartbeat'), (8081, '/params/value')])
+
+  def test_liveness(self):
+    params = Params()
+    params.int('age')
+    server = Server(params)
+    send_log = []
+    osc_server = OscServer(server, capture_sends=lambda host, port, addr, args: send_log.append((port, addr)), listen=False, connection_timeout=10.0)
+
+    # repeated connects don't create more connections
+    osc_server.receive('/params/connect', ['127.0.0.1:8081'])
+    osc_server.receive('/params/connect', ['127.0.0.1:8081'])
+    osc_server.receive('/params/connect', ['127.0.0.1:8082'])
+    self.assertEqual(list(osc_server.connections), ['127.0.0.1:8081', '127.0.0.1:8082'])
+    self.assertEqual(len(server.connections), 3) # including the OscServer's own remote
+    self.assertEqual(send_log, [(8081, '/params/connect/confirm')] * 2 + [(8082, '/params/connect/confirm')])
+
+    # heartbeat; only 8081 confirms
+    first, second = osc_server.connections['127.0.0.1:8081'], osc_server.connections['127.0.0.1:8082']
+    send_log.clear()
+    osc_server.heartbeat(first.last_seen + 5.0)
+    self.assertEqual(send_log, [(8081, '/params/heartbeat'), (8082, '/params/heartbeat')])
+    osc_server.touch('127.0.0.1:8081', first.last_seen + 6.0)
+
+    # 8082 is evicted and no longer receives values
+    self.assertEqual(osc_server.check_liveness(second.last_seen + 11.0), [second])
+    self.assertEqual(list(osc_server.connections), ['127.0.0.1:8081'])
+    self.assertFalse(second.isActive)
+    send_log.clear()
+    params.get('age').set(3)
+    self.assertEqual(send_log, [(8081, '/params/value')])
+
+    # client disconnects
+    osc_server.receive('/params/disconnect', ['127.0.0.1:8081'])
+    self.assertEqual(osc_server.connections, {})
+    self.assertEqual(len(server.connections), 1)
+
 # run just the tests in this file
 if __name__ == '__main__':
     unittest.main()
@@ -1,6 +1,7 @@
 #!/usr/bin/env python
 import unittest
-from remote_params import Params, Param, IntParam, FloatParam
+import numpy as np
+from remote_params import Params, Param, IntParam, FloatParam, ImageParam, ArrayParam
 
 class TestParams(unittest.TestCase):
   def test_string(self):
@@ -31,19 +32,19 @@ class TestParams(unittest.TestCase):
 
     param.set('true')
     self.assertEqual(param.val(), True)
-    self.assertEqual(param.changeEvent._fireCount, 1)
+    self.assertEqual(param.version, 1)
 
     param.set('xxx') # will not change the value
     self.assertEqual(param.val(), True)
-    self.assertEqual(param.changeEvent._fireCount, 1)
+    self.assertEqual(param.version, 1)
 
     param.set('false')
     self.assertEqual(param.val(), False)
-    self.assertEqual(param.changeEvent._fireCount, 2)
+    self.assertEqual(param.version, 2)
 
     param.set('yyy') # will not change the value
     self.assertEqual(param.val(), False)
-    self.assertEqual(param.changeEvent._fireCount, 2)
+    self.assertEqual(param.version, 2)
 
   def test_float(self):
     params = Params()
@@ -98,20 +99,20 @@ class TestParams(unittest.TestCase):
 
   def test_propagates_param_changes(self):
     p = Params()
-    self.assertEqual(p.changeEvent._fireCount, 0)
+    self.assertEqual(p.version, 0)
     name = p.string('name')
-    self.assertEqual(p.changeEvent._fireCount, 1)
+    self.assertEqual(p.version, 1)
     name.set('John')
-    self.assertEqual(p.changeEvent._fireCount, 2)
+    self.assertEqual(p.version, 2)
 
   def test_propagates_params_changes(self):
     p = Params()
     self.assertEqual(len(p), 0)
     p2 = Params()
     p.group('P2', p2)
-    self.assertEqual(p.changeEvent._fireCount, 1)
+    self.assertEqual(p.version, 1)
     p2.int('foo')
-    self.assertEqual(p.changeEvent._fireCount, 2)
+    self.assertEqual(p.version, 2)
 
   def test_get(self):
     params = Params()
@@ -135,6 +136,23 @@ class TestParam(unittest.TestCase):
     p = Param('s', opts={'minlength': 3})
     self.assertEqual(p.opts, {'minlength': 3})
 
+  def test_equal_values_dont_trigger_change(self):
+    p = Param('s', setter=str)
+    p.set('abc')
+    p.set(''.join(['a', 'b', 'c'])) # equal, but not the same object
+    self.assertEqual(p.version, 1)
+    p.set('abd')
+    self.assertEqual(p.version, 2)
+
+  def test_equals(self):
+    p = Param('x')
+    self.assertTrue(p.equals(1000.5, float('1000.5')))
+    self.assertFalse(p.equals(1, True))
+    self.assertFalse(p.equals(None, 0))
+    self.assertTrue(p.equals(np.zeros((2, 2)), np.zeros((2, 2))))
+    self.assertFalse(p.equals(np.zeros((2, 2)), np.zeros((4,))))
+    self.assertFalse(p.equals(np.zeros((2, 2)), 0))
+
 class TestIntParam(unittest.TestCase):
   def test_set_with_invalid_value(self):
     p = IntParam()
@@ -163,6 +181,90 @@ class TestFloatParam(unittest.TestCase):
     p = IntParam(min=5, max=10)
     self.assertEqual(p.to_dict(), {'type':'i', 'opts': {'min':5, 'max':10}})
 
+  def test_epsilon(self):
+    p = FloatParam(epsilon=0.001)
+    p.set(1.0)
+    p.set(1.0004)
+    p.set(0.9996)
+    self.assertEqual(p.val(), 1.0)
+    self.assertEqual(p.version, 1)
+    p.set(1.002)
+    self.assertEqual(p.val(), 1.002)
+    self.assertEqual(p.version, 2)
+
+class TestImageParam(unittest.TestCase):
+  def test_dedup(self):
+    p = ImageParam()
+    frame = np.zeros((4, 4, 3), dtype=np.uint8)
+    p.set(frame)
+    p.set(frame.copy()) # same content
+    self.assertEqual(p.version, 1)
+
+    frame[0, 0, 0] = 255 # refilled buffer
+    p.set(frame)
+    self.assertEqual(p.version, 2)
+
+  def test_without_dedup(self):
+    p = ImageParam(dedup=False)
+    frame = np.zeros((4, 4, 3), dtype=np.uint8)
+    p.set(frame)
+    p.set(frame.copy())
+    self.assertEqual(p.version, 1)
+    p.set(np.ones((4, 4, 3), dtype=np.uint8))
+    self.assertEqual(p.version, 2)
+
+class TestArrayParam(unittest.TestCase):
+  def test_vectors(self):
+    params = Params()
+    p = params.vec3('position')
+    self.assertEqual(p.type, 'a')
+    self.assertEqual(p.opts, {'kind': 'vec3', 'dtype': 'f', 'length': 3})
+    self.assertEqual(p.val().tolist(), [0.0, 0.0, 0.0])
+    self.assertEqual(params.vec2('a').length, 2)
+    self.assertEqual(params.vec4('b').length, 4)
+
+    p.set([1.0, 2.0, 3.0])
+    self.assertEqual(p.val().dtype, np.float32)
+    self.assertEqual(p.version, 1)
+    p.set((1.0, 2.0, 3.0)) # same value
+    self.assertEqual(p.version, 1)
+    p.set([1.0, 2.0]) # wrong length
+    self.assertEqual(p.val().tolist(), [1.0, 2.0, 3.0])
+    p.set('[3.0, 2.0, 1.0]')
+    self.assertEqual(p.val().tolist(), [3.0, 2.0, 1.0])
+
+    # values can't be modified in-place
+    with self.assertRaises(ValueError):
+      p.val()[0] = 5.0
+
+  def test_color(self):
+    p = Params().color('tint')
+    self.assertEqual(p.val().tolist(), [0.0, 0.0, 0.0, 1.0])
+    p.set([2.0, -1.0, 0.5, 1.0])
+    self.assertEqual(p.val().tolist(), [1.0, 0.0, 0.5, 1.0])
+
+  def test_element_wise_limits(self):
+    p = ArrayParam(3, 'i', min=[0, 10, 20], max=255)
+    p.set([-5, 5, 300])
+    self.assertEqual(p.val().tolist(), [0, 10, 255])
+    self.assertEqual(p.opts['min'], [0, 10, 20])
+
+  def test_set_range(self):
+    p = Params().ints('dmx', 512, min=0, max=255)
+    p.set_range(10, [255, 128])
+    self.assertEqual(p.val()[9:13].tolist(), [0, 255, 128, 0])
+    self.assertEqual(p.version, 1)
+
+    p.set_range(511, [1, 2]) # out of bounds
+    self.assertEqual(p.version, 1)
+
+  def test_typed_array_bytes(self):
+    p = Params().floats('weights', 4)
+    p.set(np.array([0.5, 1.0, 1.5, 2.0], dtype='<f4').tobytes())
+    self.assertEqual(p.val().tolist(), [0.5, 1.0, 1.5, 2.0])
+    self.assertEqual(p.tobytes(), np.array([0.5, 1.0, 1.5, 2.0], dtype='<f4').tobytes())
+    self.assertEqual(p.to_dict(), {'type': 'a', 'value': [0.5, 1.0, 1.5, 2.0], 'opts': {'kind': 'array', 'dtype': 'f', 'length': 4}})
+
 # run just the tests in this file
 if __name__ == '__main__':
     unittest.main()
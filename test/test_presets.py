@@ -0,0 +1,129 @@
+#!/usr/bin/env python
+import unittest, tempfile, shutil, os, time
+from remote_params import Params, Server, Remote, PresetStore, Snapshot, Journal, read_journal, write_snapshot
+
+class TestPresets(unittest.TestCase):
+  def setUp(self):
+    self.dir = tempfile.mkdtemp()
+    self.params = params = Params()
+    params.string('name').set('John')
+    params.int('count').set(3)
+    params.void('go')
+    sub = Params()
+    sub.float('gain').set(0.5)
+    sub.bool('enabled').set(True)
+    params.group('sub', sub)
+
+  def tearDown(self):
+    shutil.rmtree(self.dir)
+
+  def test_snapshot(self):
+    file_path = os.path.join(self.dir, 'snap')
+    self.assertEqual(write_snapshot(self.params, file_path), 4)
+
+    snapshot = Snapshot(file_path)
+    self.assertEqual(snapshot.to_dict(), {
+      '/name': 'John',
+      '/count': 3,
+      '/sub/gain': 0.5,
+      '/sub/enabled': True})
+    self.assertEqual(snapshot.get('/count'), 3)
+    self.assertIsNone(snapshot.get('/go'))
+    snapshot.close()
+
+  def test_snapshot_with_array(self):
+    file_path = os.path.join(self.dir, 'snap')
+    self.params.vec3('pos').set([1.0, 2.0, 3.0])
+    self.assertEqual(write_snapshot(self.params, file_path), 5)
+
+    snapshot = Snapshot(file_path)
+    self.assertEqual(snapshot.get('/pos').tolist(), [1.0, 2.0, 3.0])
+    snapshot.close()
+
+  def test_recall_is_single_batched_update(self):
+    store = PresetStore(self.dir)
+    store.save('a', self.params)
+    self.assertEqual(store.names(), ['a'])
+
+    self.params.get('count').set(10)
+    self.params.get('sub').get('gain').set(0.9)
+
+    server = Server(self.params)
+    value_log = []
+    remote = Remote()
+    remote.outgoing.sendValueEvent += lambda path, value: value_log.append((path, value))
+    server.connect(remote)
+
+    store.recall('a', server)
+    self.assertEqual(self.params.get('count').val(), 3)
+    self.assertEqual(self.params.get('sub').get('gain').val(), 0.5)
+    # every changed value is broadcasted once
+    self.assertIn(('/count', 3), value_log)
+    self.assertIn(('/sub/gain', 0.5), value_log)
+    self.assertEqual(len(value_log), len(set(path for path, value in value_log)))
+
+  def test_journal(self):
+    file_path = os.path.join(self.dir, 'journal')
+    journal = Journal(file_path, fsync_interval=60.0)
+    unsub = journal.attach(self.params)
+    self.params.get('count').set(4)
+    self.params.get('name').set('Jane')
+    self.params.get('go').trigger() # not journaled
+
+    # buffered, not written yet
+    self.assertEqual(list(read_journal(file_path)), [])
+    journal.sync()
+    self.assertEqual([(p, v) for t, p, v in read_journal(file_path)], [('/count', 4), ('/name', 'Jane')])
+    unsub()
+    journal.close()
+
+  def test_journal_syncs_idle_buffer(self):
+    file_path = os.path.join(self.dir, 'journal')
+    journal = Journal(file_path, fsync_interval=0.1)
+    journal.sync()
+    journal.append('/count', 'i', 5)
+    self.assertEqual(list(read_journal(file_path)), [])
+
+    # no more records are appended; the buffer reaches the disk within fsync_interval
+    time.sleep(0.3)
+    self.assertEqual([(p, v) for t, p, v in read_journal(file_path)], [('/count', 5)])
+    journal.close()
+
+  def test_journal_ignores_incomplete_record(self):
+    file_path = os.path.join(self.dir, 'journal')
+    journal = Journal(file_path, fsync_interval=0.0)
+    journal.append('/count', 'i', 5)
+    journal.append('/count', 'i', 6)
+    journal.close()
+
+    with open(file_path, 'r+b') as f:
+      f.truncate(os.path.getsize(file_path) - 3)
+
+    self.assertEqual([(p, v) for t, p, v in read_journal(file_path)], [('/count', 5)])
+
+  def test_checkpoint_and_recover(self):
+    store = PresetStore(self.dir)
+    store.start_journal(self.params)
+    store.checkpoint(self.params)
+    self.params.get('count').set(7)
+    self.params.get('sub').get('enabled').set(False)
+    store.stop_journal()
+
+    # 'crash'; restore into a fresh tree
+    params = Params()
+    params.string('name')
+    params.int('count')
+    sub = Params()
+    sub.float('gain')
+    sub.bool('enabled')
+    params.group('sub', sub)
+
+    self.assertEqual(store.recover(Server(params)), 4)
+    self.assertEqual(params.get('name').val(), 'John')
+    self.assertEqual(params.get('count').val(), 7)
+    self.assertEqual(sub.get('gain').val(), 0.5)
+    self.assertEqual(sub.get('enabled').val(), False)
+
+# run just the tests in this file
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,123 @@
+#!/usr/bin/env python
+import unittest, tempfile, shutil, os, time
+import numpy as np
+from remote_params import Params, Server, Remote, Recorder, Replayer, read_recording
+
+class TestRecorder(unittest.TestCase):
+  def setUp(self):
+    self.dir = tempfile.mkdtemp()
+    self.path = os.path.join(self.dir, 'traffic.rec')
+
+  def tearDown(self):
+    shutil.rmtree(self.dir)
+
+  def create_server(self):
+    params = Params()
+    params.string('name')
+    params.int('age')
+    params.vec3('pos')
+    return params, Server(params)
+
+  def test_records_traffic(self):
+    params, server = self.create_server()
+    r1 = Remote()
+    server.connect(r1)
+
+    recorder = Recorder(server, self.path)
+    r2 = Remote()
+    server.connect(r2)
+    r1.incoming.valueEvent('/name', 'Bob')
+    r2.incoming.valueEvent('/age', 42)
+    r2.incoming.valueRangeEvent('/pos', 1, np.array([2.0, 3.0], dtype='<f4'))
+    r2.incoming.subscribeEvent('/name')
+    r2.incoming.requestSchemaEvent()
+    server.disconnect(r2)
+    r1.incoming.valueEvent('/age', 43) # after disconnect of r2
+    recorder.close()
+    r1.incoming.valueEvent('/name', 'Cat') # after close
+
+    records = list(read_recording(self.path))
+    incoming = [(kind, remote_id, data) for t, kind, remote_id, data in records if kind not in (b'V', b'S')]
+    self.assertEqual(incoming[:5], [
+      (b'c', 1, (False,)),
+      (b'c', 2, (False,)),
+      (b'v', 1, ('/name', 'Bob')),
+      (b'v', 2, ('/age', 42)),
+      (b'r', 2, incoming[4][2])])
+    self.assertEqual(incoming[4][2][:2], ('/pos', 1))
+    self.assertEqual(incoming[4][2][2].tolist(), [2.0, 3.0])
+    self.assertEqual(incoming[5:], [
+      (b'u', 2, ('/name',)),
+      (b'q', 2, ()),
+      (b'd', 2, ()),
+      (b'v', 1, ('/age', 43))])
+
+    # outgoing
+    self.assertIn((b'V', 1, ('/name', 'Bob')), [(kind, remote_id, data) for t, kind, remote_id, data in records])
+    self.assertIn(b'S', [kind for t, kind, remote_id, data in records])
+
+    # timestamps
+    times = [t for t, kind, remote_id, data in records]
+    self.assertEqual(times, sorted(times))
+
+  def test_records_id_values(self):
+    params, server = self.create_server()
+    recorder = Recorder(server, self.path)
+    r = Remote()
+    server.connect(r)
+    r.incoming.valueIdEvent(server.ids.id('/age'), 42)
+    r.incoming.valueIdEvent(99, 1) # unknown id
+    recorder.close()
+
+    incoming = [(kind, data) for t, kind, remote_id, data in read_recording(self.path) if kind == b'v']
+    self.assertEqual(incoming, [(b'v', ('/age', 42))])
+
+  def test_ignores_incomplete_record(self):
+    params, server = self.create_server()
+    recorder = Recorder(server, self.path, outgoing=False)
+    r = Remote()
+    server.connect(r)
+    r.incoming.valueEvent('/name', 'Bob')
+    recorder.close()
+
+    with open(self.path, 'ab') as f:
+      f.write(b'\x20\x00\x00\x00partial')
+
+    self.assertEqual([kind for t, kind, remote_id, data in read_recording(self.path)], [b'c', b'v'])
+
+  def test_replay(self):
+    params, server = self.create_server()
+    recorder = Recorder(server, self.path)
+    r = Remote()
+    server.connect(r)
+    r.incoming.valueEvent('/name', 'Bob')
+    time.sleep(0.1)
+    r.incoming.valueEvent('/age', 42)
+    r.incoming.valueRangeEvent('/pos', 0, np.array([1.0], dtype='<f4'))
+    server.disconnect(r)
+    recorder.close()
+
+    params2, server2 = self.create_server()
+    changes = []
+    params2.valueChangeEvent += lambda path, value, param: changes.append(path)
+
+    # as fast as possible
+    t = time.time()
+    self.assertEqual(Replayer(self.path).replay(server2, speed=None), 5)
+    self.assertLess(time.time() - t, 0.1)
+    self.assertEqual(changes, ['/name', '/age', '/pos'])
+    self.assertEqual(params2.get('name').val(), 'Bob')
+    self.assertEqual(params2.get('age').val(), 42)
+    self.assertEqual(params2.get('pos').val().tolist(), [1.0, 0.0, 0.0])
+    self.assertEqual(len(server2.connections), 0)
+
+    # real-time
+    params2.get('name').set('')
+    t = time.time()
+    Replayer(self.path).replay(server2)
+    self.assertGreaterEqual(time.time() - t, 0.1)
+    self.assertEqual(params2.get('name').val(), 'Bob')
+
+# run just the tests in this file
+if __name__ == '__main__':
+    unittest.main()
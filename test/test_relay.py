@@ -0,0 +1,55 @@
+#!/usr/bin/env python
+import unittest, asyncio, asynctest, websockets
+from remote_params import Params, Server, schema_list
+from remote_params.WebsocketServer import WebsocketServer
+from remote_params.relay import Relay
+
+class TestRelay(asynctest.TestCase):
+  def setUp(self):
+    self.params = params = Params()
+    self.p1 = params.int('some_int')
+    self.p1.set(1)
+    self.wss = WebsocketServer(Server(self.params), port=8091, start=False)
+
+  def tearDown(self):
+    self.wss.stop()
+
+  async def test_relay(self):
+    await self.wss.start_async()
+    relay = Relay('ws://127.0.0.1:8091', port=8092, ping_interval=None)
+    await relay.start_async()
+    await asyncio.sleep(0.1)
+
+    # mirrors the upstream params
+    self.assertEqual(schema_list(relay.params), schema_list(self.params))
+
+    async with websockets.connect('ws://127.0.0.1:8092') as ws:
+      self.assertEqual(await ws.recv(), 'welcome to pyRemoteParams websockets')
+
+      # upstream changes are relayed
+      self.p1.set(2)
+      self.assertEqual(await ws.recv(), 'POST /some_int?value=2')
+
+      # writes are forwarded upstream
+      await ws.send('POST /some_int?value=3')
+      await asyncio.sleep(0.1)
+      self.assertEqual(self.p1.value, 3)
+
+      # latency
+      self.wss.upstream_latency = 0.5
+      rtt = await relay.measure_latency()
+      await asyncio.sleep(0.1)
+      self.assertEqual(relay.upstream_latency, 0.5)
+      self.assertAlmostEqual(relay.latency, 0.5 + rtt / 2.0)
+
+      await ws.send('GET latency')
+      msg = await ws.recv()
+      while not msg.startswith('POST latency'):
+        msg = await ws.recv()
+      self.assertEqual(msg, 'POST latency?value={}'.format(relay.latency))
+
+    await relay.stop_async()
+
+# run just the tests in this file
+if __name__ == '__main__':
+    unittest.main()
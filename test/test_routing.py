@@ -0,0 +1,45 @@
+#!/usr/bin/env python
+import unittest
+from remote_params import SubscriptionTrie
+
+class TestSubscriptionTrie(unittest.TestCase):
+  def test_prefix(self):
+    trie = SubscriptionTrie()
+    trie.subscribe('a', '/page1')
+    trie.subscribe('b', '/page1/fader')
+    trie.subscribe('c', '/')
+
+    self.assertEqual(list(trie.match('/page1/fader')), ['c', 'a', 'b'])
+    self.assertEqual(list(trie.match('/page1/knob')), ['c', 'a'])
+    self.assertEqual(list(trie.match('/page2/fader')), ['c'])
+    self.assertEqual(list(trie.match('/page10')), ['c'])
+
+  def test_glob(self):
+    trie = SubscriptionTrie()
+    trie.subscribe('a', '/deck*/volume')
+    trie.subscribe('b', '/deck?')
+
+    self.assertEqual(list(trie.match('/deckA/volume')), ['b', 'a'])
+    self.assertEqual(list(trie.match('/deckAB/volume')), ['a'])
+    self.assertEqual(list(trie.match('/deckB/pan')), ['b'])
+    self.assertEqual(list(trie.match('/mixer/volume')), [])
+
+  def test_unsubscribe(self):
+    trie = SubscriptionTrie()
+    trie.subscribe('a', '/page1')
+    trie.subscribe('a', '/page2/*')
+    self.assertTrue(trie.has_subscriptions('a'))
+
+    self.assertTrue(trie.unsubscribe('a', '/page1'))
+    self.assertFalse(trie.unsubscribe('a', '/page1'))
+    self.assertEqual(list(trie.match('/page1/x')), [])
+    self.assertEqual(list(trie.match('/page2/x')), ['a'])
+
+    trie.unsubscribe_all('a')
+    self.assertFalse(trie.has_subscriptions('a'))
+    self.assertEqual(list(trie.match('/page2/x')), [])
+    self.assertTrue(trie.root.is_empty())
+
+# run just the tests in this file
+if __name__ == '__main__':
+    unittest.main()
@@ -1,6 +1,6 @@
 #!/usr/bin/env python
 import unittest, json
-from remote_params import Params, schema_list, get_values, set_values, get_path
+from remote_params import Params, Param, schema_list, get_values, set_values, get_path, set_path, apply_schema_list, build_params, build_params_from_spec, iter_schema_json, schema_page
 
 class TestSchema(unittest.TestCase):
   def test_schema_list_empty(self):
@@ -94,6 +94,120 @@ class TestSchema(unittest.TestCase):
     self.assertEqual(pars.get('price').val(), 0.5)
     self.assertEqual(pars.get('subgroup').get('flag').val(), False)
 
+  def test_apply_schema_list(self):
+    pars = Params()
+    pars.string('name').set('Moby Dick')
+    details = Params()
+    details.int('page_count', min=1).set(345)
+    details.bool('soldout').set(True)
+    pars.group('details', details)
+
+    mirror = Params()
+    apply_schema_list(mirror, schema_list(pars))
+    self.assertEqual(schema_list(mirror), schema_list(pars))
+    self.assertEqual(mirror.schemaChangeEvent._fireCount, 1)
+
+    # incoming string values are converted
+    apply_schema_list(mirror, [{'path': '/details/soldout', 'type': 'b', 'value': 'false'}])
+    self.assertEqual(mirror.get('details').get('soldout').val(), False)
+
+  def test_apply_schema_list_incremental(self):
+    mirror = Params()
+    apply_schema_list(mirror, [
+      {'path': '/name', 'type': 's', 'value': 'a'},
+      {'path': '/a/b/count', 'type': 'i', 'value': 1},
+      {'path': '/a/c/ratio', 'type': 'f'}])
+    self.assertEqual(mirror.get('a').get('b').get('count').val(), 1)
+    count_param = mirror.get('a').get('b').get('count')
+
+    # values only; no schema change
+    apply_schema_list(mirror, [
+      {'path': '/name', 'type': 's', 'value': 'b'},
+      {'path': '/a/b/count', 'type': 'i', 'value': 2},
+      {'path': '/a/c/ratio', 'type': 'f'}])
+    self.assertEqual(mirror.schemaChangeEvent._fireCount, 1)
+    self.assertIs(mirror.get('a').get('b').get('count'), count_param)
+    self.assertEqual(count_param.val(), 2)
+
+    # type change, removed param and removed group
+    apply_schema_list(mirror, [
+      {'path': '/name', 'type': 'i', 'value': 3},
+      {'path': '/a/b/other', 'type': 'f'}])
+    self.assertEqual(mirror.schemaChangeEvent._fireCount, 2)
+    self.assertEqual(schema_list(mirror), [
+      {'path': '/a/b/other', 'type': 'f'},
+      {'path': '/name', 'type': 'i', 'value': 3}])
+    self.assertIsNone(mirror.get('a').get('c'))
+
+  def test_set_path(self):
+    pars = Params()
+    sub = Params()
+    pars.group('sub', sub)
+    p = Param('s')
+    set_path(pars, '/sub/name', p)
+    self.assertIs(get_path(pars, '/sub/name'), p)
+
+  def test_build_params(self):
+    pars = Params()
+    pars.string('name').set('Moby Dick')
+    details = Params()
+    details.int('page_count', min=1).set(345)
+    nested = Params()
+    nested.float('price', min=0.0)
+    details.group('nested', nested)
+    pars.group('details', details)
+
+    built = build_params(schema_list(pars))
+    self.assertEqual(schema_list(built), schema_list(pars))
+    self.assertEqual(built.schemaChangeEvent._fireCount, 1)
+    self.assertEqual(built.get('details').schemaChangeEvent._fireCount, 0)
+
+  def test_build_array_params(self):
+    pars = Params()
+    pars.color('tint').set([1.0, 0.5, 0.25, 1.0])
+    pars.ints('dmx', 8, min=0, max=255)
+
+    built = build_params(json.loads(json.dumps(schema_list(pars))))
+    self.assertEqual(schema_list(built), schema_list(pars))
+    self.assertEqual(built.get('tint').val().tolist(), [1.0, 0.5, 0.25, 1.0])
+    self.assertEqual(get_values(built)['dmx'], [0] * 8)
+
+  def test_build_params_from_spec(self):
+    built = build_params_from_spec({
+      'name': 's',
+      'count': {'type': 'i', 'min': 0, 'value': 3},
+      'light': {
+        'intensity': {'type': 'f', 'min': 0.0, 'max': 1.0},
+        'on': 'b'
+      }
+    })
+
+    self.assertEqual(schema_list(built), [
+      {'path': '/name', 'type': 's'},
+      {'path': '/count', 'type': 'i', 'value': 3, 'opts': {'min': 0}},
+      {'path': '/light/intensity', 'type': 'f', 'opts': {'min': 0.0, 'max': 1.0}},
+      {'path': '/light/on', 'type': 'b'}])
+
+  def test_iter_schema_json(self):
+    pars = Params()
+    for i in range(20):
+      pars.float('f{}'.format(i)).set(i)
+
+    chunks = list(iter_schema_json(pars, chunk_size=100))
+    self.assertTrue(len(chunks) > 1)
+    self.assertTrue(all(len(chunk) <= 100 for chunk in chunks))
+    self.assertEqual(''.join(chunks), json.dumps(schema_list(pars)))
+    self.assertEqual(list(iter_schema_json(Params())), ['[]'])
+
+  def test_schema_page(self):
+    pars = Params()
+    for i in range(5):
+      pars.int('i{}'.format(i))
+
+    self.assertEqual(schema_page(pars, 3, 10), [
+      {'path': '/i3', 'type': 'i'},
+      {'path': '/i4', 'type': 'i'}])
+
 # run just the tests in this file
 if __name__ == '__main__':
     unittest.main()
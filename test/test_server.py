@@ -1,5 +1,5 @@
 #!/usr/bin/env python
-import unittest
+import unittest, threading, sys
 from remote_params import Params, Server, Remote, create_sync_params
 
 class TestServer(unittest.TestCase):
@@ -107,6 +107,20 @@ class TestServer(unittest.TestCase):
     s.disconnect(r)
     s.disconnect(None)
 
+  def test_connect_and_disconnect_events(self):
+    s = Server(Params())
+    connected, disconnected = [], []
+    s.connectEvent += connected.append
+    s.disconnectEvent += disconnected.append
+
+    r = Remote()
+    s.connect(r)
+    s.connect(r) # already connected
+    self.assertEqual(connected, [r])
+    s.disconnect(r)
+    s.disconnect(r) # not connected
+    self.assertEqual(disconnected, [r])
+
   def test_option_queueIncomingValuesUntilUpdate(self):
     # params
     pars = Params()
@@ -126,6 +140,145 @@ class TestServer(unittest.TestCase):
     # incoming value effectuated 
     self.assertEqual(pars.get('name').val(), 'Bob') 
 
+  def test_subscriptions(self):
+    pars = Params()
+    pars.int('age')
+    page = Params()
+    page.float('fader')
+    page.float('knob')
+    pars.group('page', page)
+    s = Server(pars)
+
+    all_log = []
+    r1 = Remote()
+    r1.outgoing.sendValueEvent += lambda path, val: all_log.append(path)
+    s.connect(r1)
+
+    page_log = []
+    r2 = Remote()
+    r2.outgoing.sendValueEvent += lambda path, val: page_log.append(path)
+    s.connect(r2)
+    r2.incoming.subscribeEvent('/page/f*')
+
+    pars.get('age').set(1)
+    page.get('fader').set(0.5)
+    page.get('knob').set(0.5)
+    self.assertEqual(all_log, ['/age', '/page/fader', '/page/knob'])
+    self.assertEqual(page_log, ['/page/fader'])
+
+    # unsubscribed remotes receive nothing
+    r2.incoming.unsubscribeEvent('/page/f*')
+    page.get('fader').set(0.6)
+    self.assertEqual(page_log, ['/page/fader'])
+
+    # disconnect cleans up subscriptions
+    r2.incoming.subscribeEvent('/')
+    s.disconnect(r2)
+    self.assertFalse(s.subscriptions.has_subscriptions(r2))
+
+  def test_batch(self):
+    # params
+    pars = Params()
+    pars.string('name').set('Abe')
+    pars.int('age').set(1)
+    # server
+    s = Server(pars)
+    # remote
+    value_log = []
+    r1 = Remote()
+    r1.outgoing.sendValueEvent += lambda path, val: value_log.append((path, val))
+    s.connect(r1)
+
+    with s.batch():
+      pars.get('age').set(2)
+      pars.get('name').set('Bob')
+      pars.get('age').set(3)
+      # nothing broadcasted yet
+      self.assertEqual(value_log, [])
+
+    # every changed param broadcasted once, with its latest value
+    self.assertEqual(value_log, [('/age', 3), ('/name', 'Bob')])
+
+  def test_batch_is_per_thread(self):
+    pars = Params()
+    pars.int('age')
+    pars.int('count')
+    s = Server(pars)
+    value_log = []
+    r1 = Remote()
+    r1.outgoing.sendValueEvent += lambda path, val: value_log.append((path, val))
+    s.connect(r1)
+
+    with s.batch():
+      pars.get('age').set(2)
+      # changes from other threads are not deferred by this batch
+      thread = threading.Thread(target=lambda: pars.get('count').set(5))
+      thread.start()
+      thread.join()
+      self.assertEqual(value_log, [('/count', 5)])
+
+    self.assertEqual(value_log, [('/count', 5), ('/age', 2)])
+
+  def test_invalid_value_ranges(self):
+    pars = Params()
+    pos = pars.array('pos', 4)
+    s = Server(pars)
+    r1 = Remote()
+    s.connect(r1)
+
+    # malformed remote input is logged and ignored
+    for start, values in [(0, '[1,'), (0, b'abc'), (0, '[[1, 2], [3]]'), (-1, '[1]'), (4, '[1]'), ('x', '[1]'), (3, '[1, 2]')]:
+      r1.incoming.valueRangeEvent('/pos', start, values)
+    self.assertEqual(pos.val().tolist(), [0, 0, 0, 0])
+
+    r1.incoming.valueRangeEvent('/pos', 1, '[1, 2]')
+    self.assertEqual(pos.val().tolist(), [0, 1, 2, 0])
+
+  def test_concurrent_disconnects(self):
+    pars = Params()
+    page = Params()
+    fader = page.float('fader')
+    pars.group('page', page)
+    s = Server(pars)
+    errors = []
+    done = threading.Event()
+
+    # ie. remotes evicted by the OSC heartbeat thread, while values are broadcasted
+    def churn():
+      try:
+        while not done.is_set():
+          remotes = [Remote() for i in range(20)]
+          for i, r in enumerate(remotes):
+            s.connect(r)
+            r.incoming.subscribeEvent('/page/f{}*'.format(i))
+          for r in remotes:
+            s.disconnect(r)
+      except Exception as err:
+        errors.append(err)
+
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    thread = threading.Thread(target=churn)
+    thread.start()
+    try:
+      for i in range(2000):
+        fader.set(float(i))
+    finally:
+      done.set()
+      thread.join()
+      sys.setswitchinterval(interval)
+    self.assertEqual(errors, [])
+
+  def test_apply_values(self):
+    pars = Params()
+    pars.string('name')
+    pars.int('age')
+    s = Server(pars)
+
+    s.apply_values({'/name': 'Cat', '/age': '5', '/foo': 1})
+    self.assertEqual(pars.get('name').val(), 'Cat')
+    self.assertEqual(pars.get('age').val(), 5)
+
 # run just the tests in this file
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,98 @@
+#!/usr/bin/env python
+import unittest, multiprocessing, threading, time
+from remote_params import Params, SharedParamBank, SharedParamReader, shared_layout
+from remote_params import shared
+
+def read_in_child(name, queue):
+  reader = SharedParamReader(name)
+  queue.put(reader.snapshot())
+  reader.close()
+
+class TestSharedParamBank(unittest.TestCase):
+  def setUp(self):
+    self.params = Params()
+    self.params.string('name').set('John')
+    self.params.int('count').set(3)
+    self.params.float('ratio').set(0.5)
+    sub = Params()
+    sub.bool('enabled').set(True)
+    sub.float('gain')
+    self.params.group('sub', sub)
+
+    self.bank = SharedParamBank(self.params)
+
+  def tearDown(self):
+    self.bank.close()
+
+  def test_shared_layout(self):
+    self.assertEqual(shared_layout(self.params), [
+      ['/count', 'i'],
+      ['/ratio', 'f'],
+      ['/sub/enabled', 'b'],
+      ['/sub/gain', 'f']])
+
+  def test_reader_gets_initial_values(self):
+    reader = SharedParamReader(self.bank.name)
+    self.assertEqual(reader.get('/count'), 3)
+    self.assertEqual(reader.get('/ratio'), 0.5)
+    self.assertEqual(reader.get('/sub/enabled'), True)
+    self.assertIsNone(reader.get('/name')) # strings are not mirrored
+    reader.close()
+
+  def test_publishes_value_changes(self):
+    reader = SharedParamReader(self.bank.name)
+    version = reader.version
+    self.params.get('count').set(10)
+    self.params.get('sub').get('gain').set(2.5)
+
+    self.assertEqual(reader.version, version + 2)
+    self.assertEqual(reader.get('/count'), 10)
+    self.assertEqual(reader.get('/sub/gain'), 2.5)
+    reader.close()
+
+  def test_concurrent_writers(self):
+    reader = SharedParamReader(self.bank.name)
+    version = reader.version
+    # sequence numbers seen while writing values; odd within a (single) write section
+    seqs = []
+    to_slot = shared._to_slot
+    def slow_to_slot(value):
+      seqs.append(self.bank.seq)
+      time.sleep(0.0001) # lets the other writers run
+      return to_slot(value)
+
+    def publish():
+      for i in range(50):
+        self.bank.publish('/count', i)
+
+    shared._to_slot = slow_to_slot
+    try:
+      threads = [threading.Thread(target=publish) for i in range(4)]
+      for thread in threads:
+        thread.start()
+      for thread in threads:
+        thread.join()
+    finally:
+      shared._to_slot = to_slot
+
+    self.assertTrue(all(seq % 2 == 1 for seq in seqs))
+    self.assertEqual(reader.version, version + 200)
+    reader.close()
+
+  def test_reader_in_other_process(self):
+    self.params.get('ratio').set(0.25)
+    queue = multiprocessing.Queue()
+    proc = multiprocessing.Process(target=read_in_child, args=(self.bank.name, queue))
+    proc.start()
+    snapshot = queue.get(timeout=10)
+    proc.join()
+
+    self.assertEqual(snapshot, {
+      '/count': 3,
+      '/ratio': 0.25,
+      '/sub/enabled': True,
+      '/sub/gain': None})
+
+# run just the tests in this file
+if __name__ == '__main__':
+    unittest.main()
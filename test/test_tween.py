@@ -0,0 +1,54 @@
+#!/usr/bin/env python
+import unittest
+from remote_params import Params, Server, Remote, Tween, TweenEngine, get_values
+
+class TestTween(unittest.TestCase):
+  def setUp(self):
+    self.params = params = Params()
+    params.float('x', min=0.0, max=10.0).set(0.0)
+    params.int('count').set(0)
+    params.string('name').set('a')
+    sub = Params()
+    sub.float('gain').set(1.0)
+    params.group('sub', sub)
+    self.server = Server(params)
+
+  def test_interpolates_numeric_params(self):
+    start = get_values(self.params)
+    end = {'/x': 20.0, '/count': 10, '/name': 'b', '/sub/gain': 0.0}
+    tween = Tween(self.server, start, end, duration=2.0, start_time=100.0)
+    self.assertEqual(tween.paths, ['/x', '/count', '/sub/gain'])
+
+    self.assertTrue(tween.update(101.0))
+    self.assertEqual(self.params.get('x').val(), 10.0) # clamped to max
+    self.assertEqual(self.params.get('count').val(), 5)
+    self.assertEqual(self.params.get('sub').get('gain').val(), 0.5)
+    self.assertEqual(self.params.get('name').val(), 'a') # not numeric
+
+    self.assertFalse(tween.update(103.0))
+    self.assertEqual(self.params.get('count').val(), 10)
+    self.assertEqual(self.params.get('sub').get('gain').val(), 0.0)
+
+  def test_easing(self):
+    tween = Tween(self.server, {'/count': 0}, {'/count': 100}, duration=1.0, easing='ease_in', start_time=0.0)
+    tween.update(0.5)
+    self.assertEqual(self.params.get('count').val(), 25)
+
+  def test_engine_batches_updates(self):
+    value_log = []
+    remote = Remote()
+    remote.outgoing.sendValueEvent += lambda path, value: value_log.append(path)
+    self.server.connect(remote)
+
+    engine = TweenEngine(self.server)
+    start_time = 100.0
+    engine.crossfade({'/count': 0}, {'/count': 10}, duration=1.0, start_time=start_time)
+    engine.crossfade({'/sub/gain': 1.0}, {'/sub/gain': 0.0}, duration=2.0, start_time=start_time)
+
+    self.assertEqual(engine.update(start_time + 1.0), 1)
+    self.assertEqual(sorted(value_log), ['/count', '/sub/gain'])
+    self.assertEqual(engine.update(start_time + 2.0), 0)
+
+# run just the tests in this file
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+import unittest, tempfile, shutil, os, time
+import numpy as np
+from remote_params import Params, Server, schema_list, UnixSocketServer, UnixSocketClient
+from remote_params.uds import pack_frame
+
+def wait_for(condition, timeout=2.0):
+  end = time.time() + timeout
+  while not condition() and time.time() < end:
+    time.sleep(0.001)
+  return condition()
+
+class TestUnixSocketTransport(unittest.TestCase):
+  def setUp(self):
+    self.dir = tempfile.mkdtemp()
+    self.path = os.path.join(self.dir, 'params.sock')
+    self.params = params = Params()
+    params.string('name').set('John')
+    params.float('x')
+    params.vec3('pos')
+    self.server = Server(params)
+    self.uds_server = UnixSocketServer(self.server, self.path)
+    self.client = UnixSocketClient(self.path)
+
+  def tearDown(self):
+    self.client.close()
+    self.uds_server.stop()
+    shutil.rmtree(self.dir)
+
+  def test_mirrors_schema(self):
+    self.assertTrue(wait_for(lambda: len(self.client.params) == 3))
+    self.assertEqual(schema_list(self.client.params), schema_list(self.params))
+    self.assertTrue(wait_for(lambda: len(self.uds_server.connections) == 1))
+
+  def test_values(self):
+    self.assertTrue(wait_for(lambda: len(self.client.params) == 3))
+
+    # client to server
+    for i in range(1000):
+      self.client.send_value('/x', i * 0.5)
+    self.assertTrue(wait_for(lambda: self.params.get('x').val() == 499.5))
+
+    self.client.send_range('/pos', 1, np.array([2.0, 3.0]))
+    self.assertTrue(wait_for(lambda: self.params.get('pos').val().tolist() == [0.0, 2.0, 3.0]))
+
+    # server to client
+    self.params.get('name').set('Jane')
+    self.assertTrue(wait_for(lambda: self.client.params.get('name').val() == 'Jane'))
+    self.assertTrue(wait_for(lambda: self.client.params.get('pos').val().tolist() == [0.0, 2.0, 3.0]))
+
+  def test_subscribe(self):
+    self.assertTrue(wait_for(lambda: len(self.client.params) == 3))
+    values = []
+    self.client.valueEvent += lambda path, value: values.append((path, value))
+    self.client.subscribe('/name')
+    time.sleep(0.05)
+
+    self.params.get('x').set(1.0)
+    self.params.get('name').set('Jane')
+    self.assertTrue(wait_for(lambda: len(values) > 0))
+    self.assertEqual(values, [('/name', 'Jane')])
+
+  def test_disconnect(self):
+    self.assertTrue(wait_for(lambda: len(self.uds_server.connections) == 1))
+    self.client.close()
+    self.assertTrue(wait_for(lambda: len(self.uds_server.connections) == 0))
+    self.assertEqual(len(self.server.connected_remotes), 0)
+
+  def test_empty_message(self):
+    self.assertTrue(wait_for(lambda: len(self.uds_server.connections) == 1))
+    # valid framing, but without a message type; ignored
+    self.client.writer.write(pack_frame(b''))
+    self.client.send_value('/x', 2.0)
+    self.assertTrue(wait_for(lambda: self.params.get('x').val() == 2.0))
+    self.assertEqual(len(self.uds_server.connections), 1)
+
+# run just the tests in this file
+if __name__ == '__main__':
+    unittest.main()
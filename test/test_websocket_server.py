@@ -1,9 +1,14 @@
 
 #!/usr/bin/env python
-import unittest, asyncio, asynctest, websockets, json
+import unittest, asyncio, asynctest, websockets, json, zlib, threading
+import numpy as np
 from remote_params import HttpServer, Params, Server, Remote, create_sync_params, schema_list
 
 from remote_params.WebsocketServer import WebsocketServer
+from remote_params.image_delta import TileDeltaDecoder
+from remote_params.image_stream import PendingFrame
+from remote_params.lanes import PRIORITY_HIGH, PRIORITY_BULK
+from remote_params.binary import U32, pack_path, pack_value, unpack_path, unpack_value
 
 class MockSocket:
   def __init__(self):
@@ -78,6 +83,23 @@ class TestWebsocketServer(asynctest.TestCase):
       f'POST schema.json?schema={json.dumps(schema_list(self.params))}'
     ])
 
+  async def test_responds_to_chunked_schema_request(self):
+    for i in range(10):
+      self.params.float(f'f{i}')
+
+    mocksocket = MockSocket()
+    await self.wss._onMessage('GET schema.json?chunk_size=100', mocksocket)
+
+    self.assertTrue(len(mocksocket.msgs) > 1)
+    data = ''
+    for idx, msg in enumerate(mocksocket.msgs):
+      last = 1 if idx == len(mocksocket.msgs) - 1 else 0
+      prefix = f'POST schema.json?chunk={idx}&last={last}&data='
+      self.assertTrue(msg.startswith(prefix))
+      data += msg[len(prefix):]
+
+    self.assertEqual(json.loads(data), schema_list(self.params))
+
   async def test_broadcasts_value_changes(self):
     await self.wss.start_async()
 
@@ -111,6 +133,341 @@ class TestWebsocketServer(asynctest.TestCase):
       msg = await ws.recv()
       self.assertEqual(msg, f'POST schema.json?schema={json.dumps(schema_list(self.params))}')
 
+  async def test_cross_thread_value_changes(self):
+    await self.wss.start_async()
+
+    uri = f'ws://127.0.0.1:{self.wss.port}'
+    async with websockets.connect(uri) as ws:
+      msg = await ws.recv()
+
+      # ie. the OSC listener thread
+      thread = threading.Thread(target=lambda: self.p1.set(5))
+      thread.start()
+      thread.join()
+
+      msg = await asyncio.wait_for(ws.recv(), 1.0)
+      self.assertEqual(msg, 'POST /some_int?value=5')
+
+  async def test_subscriptions(self):
+    p2 = self.params.int('other_int')
+    await self.wss.start_async()
+
+    uri = f'ws://127.0.0.1:{self.wss.port}'
+    async with websockets.connect(uri) as ws:
+      msg = await ws.recv()
+      self.assertEqual(msg, 'welcome to pyRemoteParams websockets')
+      await ws.send('POST subscribe?pattern=/other*')
+      await asyncio.sleep(0.1)
+
+      self.p1.set(2)
+      p2.set(3)
+      # only receives the subscribed param value change
+      msg = await ws.recv()
+      self.assertEqual(msg, 'POST /other_int?value=3')
+
+  async def test_compressed_payloads(self):
+    for i in range(50):
+      self.params.float(f'f{i}')
+    await self.wss.start_async()
+    expected = f'POST schema.json?schema={json.dumps(schema_list(self.params))}'
+
+    plain, compressing = MockSocket(), MockSocket()
+    await self.wss._onMessage('POST compression?payloads=zlib', compressing)
+    await self.wss._onMessage('GET schema.json', plain)
+    await self.wss._onMessage('GET schema.json', compressing)
+
+    self.assertEqual(plain.msgs, [expected])
+    self.assertEqual(type(compressing.msgs[0]), bytes)
+    self.assertEqual(zlib.decompress(compressing.msgs[0]).decode('utf-8'), expected)
+
+    # compressed only once per schema version
+    await self.wss._onMessage('GET schema.json', compressing)
+    self.assertIs(compressing.msgs[1], compressing.msgs[0])
+
+    # value changes don't invalidate the cached schema; changed values are sent after it
+    self.params.get('f0').set(1.0)
+    await self.wss._onMessage('GET schema.json', compressing)
+    self.assertIs(compressing.msgs[2], compressing.msgs[0])
+    self.assertEqual(compressing.msgs[3], 'POST /f0?value=1.0')
+
+    # schema changes do
+    self.params.float('extra')
+    await self.wss._onMessage('GET schema.json', compressing)
+    expected = f'POST schema.json?schema={json.dumps(schema_list(self.params))}'
+    self.assertEqual(zlib.decompress(compressing.msgs[4]).decode('utf-8'), expected)
+    self.assertEqual(len(compressing.msgs), 5)
+
+    # small payloads are sent uncompressed
+    self.wss.payload_compression_threshold = len(expected) * 2
+    await self.wss._onMessage('GET schema.json', compressing)
+    self.assertEqual(type(compressing.msgs[5]), str)
+
+    await self.wss._onMessage('POST compression?payloads=none', compressing)
+    self.assertFalse(compressing in self.wss.compressing_sockets)
+
+    # sockets with permessage-deflate get uncompressed payloads
+    class Deflate:
+      name = 'permessage-deflate'
+    deflating = MockSocket()
+    deflating.extensions = [Deflate()]
+    await self.wss._onMessage('POST compression?payloads=zlib', deflating)
+    self.assertFalse(deflating in self.wss.compressing_sockets)
+
+  def test_serve_options(self):
+    self.assertEqual(self.wss._serveOptions(), {'compression': 'deflate'})
+    self.assertEqual(WebsocketServer(self.wss.server, start=False, compression=None)._serveOptions(), {'compression': None})
+
+    opts = WebsocketServer(self.wss.server, start=False, compression_level=3, compression_window_bits=10)._serveOptions()
+    self.assertEqual(opts['compression'], None)
+    self.assertEqual(len(opts['extensions']), 1)
+
+  async def test_array_values(self):
+    p = self.params.vec3('pos')
+    await self.wss.start_async()
+
+    # binary value message
+    await self.wss._onMessage(b'V' + pack_path('/pos') + pack_value('a', np.array([1.0, 2.0, 3.0])), None)
+    self.assertEqual(p.val().tolist(), [1.0, 2.0, 3.0])
+
+    # binary partial value message
+    await self.wss._onMessage(b'R' + pack_path('/pos') + U32.pack(1) + pack_value('a', np.array([5.0])), None)
+    self.assertEqual(p.val().tolist(), [1.0, 5.0, 3.0])
+
+    # text messages
+    await self.wss._onMessage('POST /pos?value=[0.5, 0.5, 0.5]', None)
+    self.assertEqual(p.val().tolist(), [0.5, 0.5, 0.5])
+    await self.wss._onMessage('POST /pos?range=2&value=[1.5]', None)
+    self.assertEqual(p.val().tolist(), [0.5, 0.5, 1.5])
+
+    # outgoing array values are sent as binary message
+    mocksocket = MockSocket()
+    self.wss.sockets.add(mocksocket)
+    self.wss.unfiltered_sockets[mocksocket] = True
+    p.set([7.0, 8.0, 9.0])
+    await asyncio.sleep(0)
+    msg = mocksocket.msgs[0]
+    self.assertEqual(msg[0:1], b'V')
+    path, offset = unpack_path(msg, 1)
+    type_, value, _ = unpack_value(msg, offset)
+    self.assertEqual((path, type_, value.tolist()), ('/pos', 'a', [7.0, 8.0, 9.0]))
+
+  async def test_image_deltas(self):
+    image = self.params.image('cam')
+    self.wss.delta_tile_size = 16
+    await self.wss.start_async()
+
+    first, second = MockSocket(), MockSocket()
+    for ws in (first, second):
+      self.wss.sockets.add(ws)
+      self.wss.unfiltered_sockets[ws] = True
+    await self.wss._onMessage('POST delta?enabled=1', first)
+
+    frame = np.zeros((32, 32), dtype=np.uint8)
+    image.set(frame)
+    await asyncio.sleep(0)
+    self.assertTrue(first.msgs[0].startswith('POST /cam?delta='))
+    self.assertTrue(second.msgs[0].startswith('POST /cam?value='))
+
+    decoder = TileDeltaDecoder()
+    delta = json.loads(first.msgs[0][len('POST /cam?delta='):])
+    self.assertTrue(delta['keyframe'])
+    decoder.apply(delta)
+
+    # late joiner starts with a keyframe
+    await self.wss._onMessage('POST delta?enabled=1', second)
+    frame = frame.copy()
+    frame[20, 20] = 255
+    image.set(frame)
+    await asyncio.sleep(0)
+
+    delta = json.loads(first.msgs[1][len('POST /cam?delta='):])
+    self.assertFalse(delta['keyframe'])
+    self.assertEqual(len(delta['tiles']), 1)
+    self.assertTrue(np.array_equal(decoder.apply(delta), frame))
+    self.assertTrue(json.loads(second.msgs[1][len('POST /cam?delta='):])['keyframe'])
+
+  async def test_lazy_image_serialization(self):
+    image = self.params.image('cam')
+    await self.wss.start_async()
+    self.wss.encode_image = lambda frame, quality: 'jpeg'
+    serialized = []
+    image.get_serialized = lambda: serialized.append(1) or 'png'
+
+    delta, adaptive = MockSocket(), MockSocket()
+    for ws in (delta, adaptive):
+      self.wss.sockets.add(ws)
+      self.wss.unfiltered_sockets[ws] = True
+    await self.wss._onMessage('POST delta?enabled=1', delta)
+    await self.wss._onMessage('POST images?adaptive=1', adaptive)
+
+    # no client needs the full (serialized) frame
+    image.set(np.zeros((8, 8), dtype=np.uint8))
+    await asyncio.sleep(0.05)
+    self.assertEqual(serialized, [])
+    self.assertTrue(delta.msgs[0].startswith('POST /cam?delta='))
+    self.assertEqual(adaptive.msgs, ['POST /cam?jpeg=jpeg'])
+
+    # serialized once for all full frame clients
+    plain = [MockSocket(), MockSocket()]
+    for ws in plain:
+      self.wss.sockets.add(ws)
+      self.wss.unfiltered_sockets[ws] = True
+    image.set(np.ones((8, 8), dtype=np.uint8))
+    await asyncio.sleep(0.05)
+    self.assertEqual(serialized, [1])
+    self.assertEqual([ws.msgs for ws in plain], [['POST /cam?value=png']] * 2)
+
+  async def test_param_ids(self):
+    await self.wss.start_async()
+    mocksocket = MockSocket()
+    self.wss.sockets.add(mocksocket)
+    self.wss.unfiltered_sockets[mocksocket] = True
+
+    await self.wss._onMessage('GET ids', mocksocket)
+    self.assertEqual(mocksocket.msgs, ['POST ids?table=["/some_int"]'])
+
+    # incoming value with id
+    await self.wss._onMessage(b'I' + U32.pack(0) + pack_value('i', 5), mocksocket)
+    self.assertEqual(self.p1.val(), 5)
+    await asyncio.sleep(0)
+    self.assertEqual(mocksocket.msgs[1], b'I' + U32.pack(0) + pack_value('i', 5))
+
+    # new ids are sent after the schema
+    mocksocket.msgs.clear()
+    self.params.string('name')
+    await asyncio.sleep(0)
+    self.assertTrue(mocksocket.msgs[0].startswith('POST schema.json?schema='))
+    self.assertEqual(mocksocket.msgs[1], 'POST ids?table=["/some_int", "/name"]')
+
+    # string values
+    mocksocket.msgs.clear()
+    self.params.get('name').set('Bob')
+    await asyncio.sleep(0)
+    self.assertEqual(mocksocket.msgs, [b'I' + U32.pack(1) + pack_value('s', 'Bob')])
+
+  async def test_priority_lanes(self):
+    image = self.params.image('cam')
+    await self.wss.start_async()
+
+    gate = asyncio.Event()
+    sent = []
+    class SlowSocket(MockSocket):
+      async def send(self, msg):
+        sent.append(msg)
+        await gate.wait()
+
+    sock = SlowSocket()
+    self.wss.sockets.add(sock)
+    self.wss.unfiltered_sockets[sock] = True
+
+    frame = np.zeros((8, 8), dtype=np.uint8)
+    image.set(frame)
+    await asyncio.sleep(0)
+    image.set(frame + 1)
+    self.p1.set(7)
+    self.assertEqual(len(sent), 1)
+
+    # the int value is sent before the queued image
+    gate.set()
+    await asyncio.sleep(0.01)
+    self.assertEqual([msg.split('?')[0] for msg in sent], ['POST /cam', 'POST /some_int', 'POST /cam'])
+
+  async def test_queue_after_close(self):
+    image = self.params.image('cam', dedup=False)
+    image.create_pool((8, 8), size=2)
+    image.publish(image.acquire())
+    await self.wss.start_async()
+
+    # messages queued (with call_soon_threadsafe) after the socket disconnected
+    sock = MockSocket()
+    self.wss._queueLatest('/cam', [(sock, PendingFrame(image, image.retain(), None, None))], PRIORITY_BULK)
+    self.wss._queue('POST /some_int?value=1', [sock], PRIORITY_HIGH)
+    self.assertFalse(sock in self.wss.lanes)
+    # the retained frame is released; only the param's current frame is in use
+    self.assertEqual(sum(image.pool.refs), 1)
+
+  async def test_latest_frame_only(self):
+    image = self.params.image('cam', dedup=False)
+    image.create_pool((8, 8), size=3)
+    await self.wss.start_async()
+
+    gate = asyncio.Event()
+    sent = []
+    class SlowSocket(MockSocket):
+      async def send(self, msg):
+        sent.append(msg)
+        await gate.wait()
+
+    sock = SlowSocket()
+    self.wss.sockets.add(sock)
+    self.wss.unfiltered_sockets[sock] = True
+    self.wss.encode_image = lambda frame, quality: '{}:{}'.format(frame[0, 0], quality)
+    await self.wss._onMessage('POST images?adaptive=1', sock)
+
+    for i in range(4):
+      frame = image.acquire()
+      frame[:] = i
+      image.publish(frame)
+      # frames are encoded in an executor
+      await asyncio.sleep(0.05 if i == 0 else 0)
+
+    # frame 0 is being sent, 1 and 2 were replaced by 3
+    lanes = self.wss.lanes[sock]
+    self.assertEqual(sent, ['POST /cam?jpeg=0:85'])
+    self.assertEqual(lanes.dropped, 2)
+    # only the current frame is in use (by the param and the pending frame)
+    self.assertEqual(sum(image.pool.refs), 2)
+
+    gate.set()
+    await asyncio.sleep(0.01)
+    self.assertEqual(sent, ['POST /cam?jpeg=0:85', 'POST /cam?jpeg=3:85'])
+    self.assertEqual(len(lanes), 0)
+
+  async def test_adaptive_encoding_off_the_loop(self):
+    image = self.params.image('cam')
+    await self.wss.start_async()
+
+    encoding = threading.Event()
+    encoded = []
+    def encode(frame, quality):
+      encoding.wait(5.0)
+      encoded.append(quality)
+      return 'jpeg'
+    self.wss.encode_image = encode
+
+    first, second = MockSocket(), MockSocket()
+    for ws in (first, second):
+      self.wss.sockets.add(ws)
+      self.wss.unfiltered_sockets[ws] = True
+      await self.wss._onMessage('POST images?adaptive=1', ws)
+
+    image.set(np.zeros((8, 8), dtype=np.uint8))
+    await asyncio.sleep(0.01)
+    # control values aren't held up by the (blocked) encoding
+    self.p1.set(5)
+    await asyncio.sleep(0.01)
+    self.assertEqual(first.msgs, ['POST /some_int?value=5'])
+    self.assertEqual(second.msgs, ['POST /some_int?value=5'])
+
+    encoding.set()
+    await asyncio.sleep(0.05)
+    self.assertEqual(first.msgs[1], 'POST /cam?jpeg=jpeg')
+    self.assertEqual(second.msgs[1], 'POST /cam?jpeg=jpeg')
+    # encoded once for both clients (same quality and scale)
+    self.assertEqual(encoded, [85])
+
+  async def test_value_history(self):
+    self.p1.enable_history()
+    self.p1.set(4)
+    mocksocket = MockSocket()
+    await self.wss._onMessage('GET /some_int?history=60&buckets=2', mocksocket)
+    path, data = mocksocket.msgs[0].split('?history=')
+    self.assertEqual(path, 'POST /some_int')
+    self.assertEqual(json.loads(data)['max'], [None, 4])
+
+    await self.wss._onMessage('GET /foo?history=60', mocksocket)
+    self.assertEqual(mocksocket.msgs[1], 'POST /foo?history=null')
+
 # run just the tests in this file
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,59 @@
+#!/usr/bin/env python
+import unittest, asyncio, asynctest, websockets, socket
+from remote_params import Params, Server
+from remote_params.workers import WorkerPool
+
+class TestWorkerPool(asynctest.TestCase):
+  async def test_worker_pool(self):
+    params = Params()
+    p1 = params.int('some_int')
+    p1.set(1)
+    pool = WorkerPool(Server(params), host='127.0.0.1', port=8093, workers=2)
+    pool.start()
+    try:
+      clients = [await websockets.connect('ws://127.0.0.1:8093') for i in range(4)]
+      for ws in clients:
+        self.assertEqual(await ws.recv(), 'welcome to pyRemoteParams websockets')
+
+      # value changes reach the clients of all workers
+      p1.set(2)
+      for ws in clients:
+        self.assertEqual(await asyncio.wait_for(ws.recv(), 5.0), 'POST /some_int?value=2')
+
+      # writes are applied by the owning server, and published to all workers
+      await clients[0].send('POST /some_int?value=3')
+      for ws in clients:
+        self.assertEqual(await asyncio.wait_for(ws.recv(), 5.0), 'POST /some_int?value=3')
+      self.assertEqual(p1.val(), 3)
+
+      # schema changes
+      params.string('name')
+      for ws in clients:
+        self.assertTrue((await asyncio.wait_for(ws.recv(), 5.0)).startswith('POST schema.json?schema='))
+
+      for ws in clients:
+        await ws.close()
+    finally:
+      processes = [process for process, conn, q in pool.workers]
+      pool.stop()
+
+    # the workers stopped by themselves (weren't terminated)
+    self.assertEqual([process.exitcode for process in processes], [0, 0])
+
+  def test_failing_worker(self):
+    # the workers can't share a port that is already in use (without SO_REUSEPORT)
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.bind(('127.0.0.1', 8094))
+    sock.listen()
+    try:
+      pool = WorkerPool(Server(Params()), host='127.0.0.1', port=8094, workers=2)
+      with self.assertRaises(RuntimeError):
+        pool.start()
+      self.assertEqual(pool.workers, [])
+      self.assertEqual(pool.threads, [])
+    finally:
+      sock.close()
+
+# run just the tests in this file
+if __name__ == '__main__':
+    unittest.main()